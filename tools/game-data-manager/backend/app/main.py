@@ -1,14 +1,48 @@
 """Game Data Manager - FastAPI Backend"""
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from .routers import data_router
-from .routers.image_router import router as image_router
+from .routers.image_router import get_image_catalog, router as image_router
+from .services.data_service import get_data_service
+from .services.event_broker import get_event_broker
+from .services.file_watcher import DataFileWatcher
+from .services.image_catalog import ImageCatalogWatcher
+
+# データファイル監視の間隔 (秒, 0で無効)
+WATCH_INTERVAL = float(os.environ.get("GAME_DATA_WATCH_INTERVAL", "1.0"))
+# 画像フォルダ監視の間隔 (秒, 0で無効)
+IMAGE_WATCH_INTERVAL = float(os.environ.get("GAME_DATA_IMAGE_WATCH_INTERVAL", "2.0"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    service = get_data_service()
+    broker = get_event_broker()
+    broker.attach(asyncio.get_running_loop())
+    service.subscribe(broker.publish)
+    watcher = DataFileWatcher(service, interval=WATCH_INTERVAL)
+    watcher.start()
+    # 画像カタログを構築し、以降は外部での追加・削除を反映
+    image_watcher = ImageCatalogWatcher(get_image_catalog(), interval=IMAGE_WATCH_INTERVAL)
+    image_watcher.start()
+    yield
+    image_watcher.stop()
+    watcher.stop()
+    service.unsubscribe(broker.publish)
+    # 未反映のジャーナルを書き出して終了
+    service.close()
+
 
 app = FastAPI(
     title="Game Data Manager",
     description="Arknights Cleaker ゲームデータ管理API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS設定 (React開発サーバーからのアクセスを許可)
@@ -18,6 +52,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Total-Count", "X-Reference-Warnings"],
 )
 
 # ルーター登録
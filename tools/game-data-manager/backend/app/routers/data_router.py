@@ -1,11 +1,28 @@
 """データAPI Router"""
-from typing import List, Dict, Any
-from fastapi import APIRouter, HTTPException, Query
+import hashlib
+import json
+from typing import List, Dict, Any, Optional
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
 
-from ..services.data_service import get_data_service
+from ..services.concurrency import run_io
+from ..services.data_service import (
+    BulkValidationError,
+    DanglingReferenceError,
+    RecordNotFoundError,
+    get_data_service,
+)
+from ..services.event_broker import get_event_broker
+from ..services.export import get_export_archives, iter_ndjson
+from ..services.importer import StreamingImport, get_import_jobs
+from ..services.query import parse_filters
+from ..services.serialization import SerializedBody, choose_encoding
 
 router = APIRouter(prefix="/api/data", tags=["data"])
 
+# 一覧取得で予約済みのクエリパラメータ (それ以外はフィルタ扱い)
+LIST_QUERY_PARAMS = {"offset", "limit", "fields", "sort"}
+
 # 有効なデータタイプ
 VALID_DATA_TYPES = [
     "items", "upgrades", "gacha_banners", "companies",
@@ -18,121 +35,475 @@ def validate_data_type(data_type: str):
         raise HTTPException(status_code=400, detail=f"Invalid data type: {data_type}")
 
 
+# 作成・更新・削除時の参照チェック
+REFERENCES_QUERY = Query("ignore", description="ignore / warn (X-Reference-Warnings ヘッダーで警告) / reject")
+
+
+async def add_reference_warnings(response: Response, data_type: str, records: List[Dict] = (), removed_ids: List[str] = ()):
+    """未解決の参照をX-Reference-Warningsヘッダーで返す (references=warn)"""
+    service = get_data_service()
+    warnings = await run_io(service.find_dangling_references, data_type, records, removed_ids)
+    if warnings:
+        response.headers["X-Reference-Warnings"] = json.dumps(warnings)
+
+
+# ========================================
+# ETag (リビジョンベース)
+# ========================================
+
+def make_etag(*parts: Any) -> str:
+    """サーバーインスタンスとリビジョンから強いETagを生成"""
+    raw = "|".join(str(p) for p in parts)
+    return '"' + hashlib.blake2b(raw.encode("utf-8"), digest_size=12).hexdigest() + '"'
+
+
+def all_revisions_etag(*parts: Any) -> str:
+    """全データタイプのリビジョンに依存するETag"""
+    service = get_data_service()
+    revisions = [service.get_revision(t) for t in VALID_DATA_TYPES]
+    return make_etag(service.instance_id, *revisions, *parts)
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """If-None-Matchが現在のETagと一致するか"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = {t.strip().removeprefix("W/") for t in header.split(",")}
+    return "*" in tags or etag in tags
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    """圧縮した本体には別のETagを付ける"""
+    return etag if encoding is None else f'{etag[:-1]}-{encoding}"'
+
+
+async def serialized_response(request: Request, body: SerializedBody, etag: str) -> Response:
+    """エンコード済みJSONをそのまま返す (クライアントが対応していれば圧縮版)"""
+    content, encoding = await run_io(body.encoded, choose_encoding(request.headers.get("accept-encoding")))
+    headers = {"ETag": encoded_etag(etag, encoding), "Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content, media_type="application/json", headers=headers)
+
+
+def check_not_modified(request: Request, etag: str) -> Optional[Response]:
+    """圧縮有無どちらのETagでも一致すれば304を返す"""
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    for candidate in (encoded_etag(etag, encoding), etag):
+        if is_not_modified(request, candidate):
+            return not_modified(candidate)
+    return None
+
+
+# 固定パスのエンドポイントは /{data_type} より先に登録する
+
+# ========================================
+# 変更差分
+# ========================================
+
+@router.get("/changes")
+async def get_changes(
+    since: int = Query(0, ge=0),
+    instance: Optional[str] = Query(None, description="前回の応答の instance (サーバー再起動の検出に使用)"),
+) -> Dict[str, Any]:
+    """指定シーケンス以降の変更を取得
+
+    `full_resync` が true の場合は履歴が残っていないか、サーバーが再起動して
+    シーケンスが振り直されたため全件を取得し直す。
+    `reset` に含まれるデータタイプは丸ごと差し替えられたため再取得する。
+    """
+    service = get_data_service()
+    return service.get_changes(since, instance)
+
+
+@router.get("/events")
+async def stream_events() -> StreamingResponse:
+    """データ変更をServer-Sent Eventsで配信
+
+    `mutation` イベント: {type, op, id または count, revision, seq}
+    `resync` イベント: 変更が溜まりすぎたため、そのデータタイプを再取得する
+    """
+    return StreamingResponse(
+        get_event_broker().stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ========================================
+# 全文検索
+# ========================================
+
+@router.get("/search")
+async def search(
+    q: str = Query(..., min_length=1, description="検索語 (空白区切りでAND)"),
+    types: Optional[str] = Query(None, description="対象データタイプ (カンマ区切り)"),
+    limit: int = Query(20, ge=1, le=200),
+) -> List[Dict]:
+    """名前・説明文・IDを全データタイプ横断で検索"""
+    data_types = types.split(",") if types else None
+    for data_type in data_types or []:
+        validate_data_type(data_type)
+    service = get_data_service()
+    return await run_io(service.search, q, data_types, limit)
+
+
+# ========================================
+# 参照整合性 & 依存関係
+# ========================================
+
+@router.get("/validation/references")
+async def check_references(request: Request, response: Response) -> Dict[str, List[Dict]]:
+    """参照整合性チェック"""
+    etag = all_revisions_etag("references")
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    service = get_data_service()
+    response.headers["ETag"] = etag
+    return await run_io(service.check_references)
+
+
+@router.get("/graph/dependencies")
+async def get_dependency_graph(request: Request, response: Response) -> Dict[str, Any]:
+    """依存関係グラフを取得"""
+    etag = all_revisions_etag("graph")
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    service = get_data_service()
+    response.headers["ETag"] = etag
+    return await run_io(service.get_dependency_graph)
+
+
+@router.get("/analysis/prerequisites")
+async def get_prerequisite_analysis(request: Request, response: Response) -> Dict[str, Any]:
+    """前提条件チェーン (アップグレード・ゲームイベント・ガチャバナー) の分析
+
+    cycles: 循環している前提条件、types: タイプごとの最大深さと各レコードの深さ、
+    order: 前提が先に来る解放順
+    """
+    etag = all_revisions_etag("prerequisites")
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    service = get_data_service()
+    response.headers["ETag"] = etag
+    return await run_io(service.get_prerequisite_analysis)
+
+
+@router.get("/graph/neighborhood")
+async def get_graph_neighborhood(
+    request: Request,
+    response: Response,
+    node: str = Query(..., description="起点ノード (item:xxx, upgrade:xxx, gacha:xxx, company:xxx, event:xxx)"),
+    depth: int = Query(1, ge=0, le=10),
+    edge_types: Optional[str] = Query(None, description="たどるエッジの種類 (カンマ区切り: unlock,prerequisite,material,contains,reward)"),
+    direction: str = Query("both", description="out / in / both"),
+    limit: int = Query(500, ge=1, le=5000, description="ノード数の上限"),
+) -> Dict[str, Any]:
+    """ノード周辺の部分グラフを取得"""
+    etag = all_revisions_etag("graph", request.url.query)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    service = get_data_service()
+    try:
+        result = await run_io(
+            service.get_graph_neighborhood, node, depth,
+            edge_types.split(",") if edge_types else None, direction, limit,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Not found: {node}")
+    response.headers["ETag"] = etag
+    return result
+
+
+# ========================================
+# エクスポート/インポート
+# ========================================
+
+@router.get("/export/all", response_model=Dict[str, List[Dict]])
+async def export_all(request: Request) -> Response:
+    """全データをエクスポート (タイプごとのエンコード済みJSONから組み立てる)"""
+    etag = all_revisions_etag("export")
+    cached = check_not_modified(request, etag)
+    if cached:
+        return cached
+    service = get_data_service()
+    body = await run_io(service.get_serialized_export, VALID_DATA_TYPES)
+    # 取得中に更新された場合に備え、実際に返すリビジョンからETagを作り直す
+    etag = make_etag(service.instance_id, *(revision for _, revision in body.revision), "export")
+    return await serialized_response(request, body, etag)
+
+
+@router.get("/export/stream")
+async def export_stream(format: str = Query("ndjson", description="ndjson または zip")):
+    """全データをストリーミングでエクスポート
+
+    ndjson: 1行1レコードの {"type": データタイプ, "data": レコード}
+    zip: データタイプごとの正規JSONファイル一式 (Rangeリクエストで再開可能)
+    """
+    if format == "ndjson":
+        service = get_data_service()
+        return StreamingResponse(
+            iter_ndjson(service, VALID_DATA_TYPES),
+            media_type="application/x-ndjson",
+            headers={"Content-Disposition": 'attachment; filename="game_data.ndjson"'},
+        )
+    if format == "zip":
+        path = await run_io(get_export_archives().get, VALID_DATA_TYPES)
+        return FileResponse(path, media_type="application/zip", filename="game_data.zip")
+    raise HTTPException(status_code=400, detail=f"Invalid format: {format}")
+
+
+@router.post("/import/diff")
+async def import_diff(data: Dict[str, List[Dict]]) -> Dict[str, Dict[str, Any]]:
+    """インポートした場合の差分を取得 (データは変更しない)"""
+    service = get_data_service()
+    datasets = {
+        data_type: items for data_type, items in data.items()
+        if data_type in VALID_DATA_TYPES
+    }
+    return await run_io(service.diff_all, datasets)
+
+
+@router.post("/import/all")
+async def import_all(data: Dict[str, List[Dict]]) -> Dict[str, int]:
+    """全データをインポート (全件検証後にタイプごとアトミックに差し替え)"""
+    service = get_data_service()
+    datasets = {
+        data_type: items for data_type, items in data.items()
+        if data_type in VALID_DATA_TYPES
+    }
+    try:
+        return await run_io(service.replace_all, datasets)
+    except BulkValidationError as e:
+        raise HTTPException(status_code=400, detail={"message": str(e), "errors": e.errors})
+
+
+@router.post("/import/stream")
+async def import_stream(
+    request: Request,
+    format: str = Query("ndjson", description="ndjson または zip"),
+    job_id: Optional[str] = Query(None, description="進捗確認用のジョブID (省略時は自動生成)"),
+) -> Dict[str, Any]:
+    """リクエスト本体をストリーミングでインポート
+
+    受信しながらレコード単位で検証し、全件が正しければタイプごとに丸ごと差し替える。
+    進捗は `GET /import/jobs/{job_id}` で確認できる。
+    """
+    service = get_data_service()
+    try:
+        job = get_import_jobs().create(format, job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    importer = StreamingImport(service, job)
+    try:
+        async for chunk in request.stream():
+            await run_io(importer.feed, chunk)
+        counts = await run_io(importer.finish)
+    except BulkValidationError as e:
+        raise HTTPException(status_code=400, detail={
+            "message": f"{job.error_count} invalid record(s)", "job": job.id, "errors": e.errors,
+        })
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        await run_io(importer.close)
+    return {"job": job.id, "counts": counts}
+
+
+@router.get("/import/jobs/{job_id}")
+async def get_import_job(job_id: str) -> Dict[str, Any]:
+    """インポートジョブの進捗を取得"""
+    job = get_import_jobs().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Not found: {job_id}")
+    return job.to_dict()
+
+
 # ========================================
 # 全データ取得
 # ========================================
 
 @router.get("/{data_type}")
-async def get_all(data_type: str) -> List[Dict]:
-    """指定タイプの全データを取得"""
+async def get_all(
+    data_type: str,
+    request: Request,
+    response: Response,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    fields: Optional[str] = Query(None, description="取得するフィールド (カンマ区切り)"),
+    sort: Optional[str] = Query(None, description="並び替えフィールド (先頭に - で降順)"),
+) -> List[Dict]:
+    """指定タイプのデータを取得
+
+    フィルタは `rarity=Star5` (複数指定でOR) や `sortOrder__gte=10` (gte/gt/lte/lt) の形式。
+    絞り込み後の総件数は `X-Total-Count` ヘッダーで返す。
+    """
     validate_data_type(data_type)
     service = get_data_service()
-    return service.get_all(data_type)
+    etag = make_etag(service.instance_id, data_type, service.get_revision(data_type), request.url.query)
+    if not request.query_params:
+        cached = check_not_modified(request, etag)
+        if cached:
+            return cached
+        body = await run_io(service.get_serialized, data_type)
+        etag = make_etag(service.instance_id, data_type, body.revision, request.url.query)
+        return await serialized_response(request, body, etag)
+
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+
+    try:
+        filters = parse_filters(
+            (key, value) for key, value in request.query_params.multi_items()
+            if key not in LIST_QUERY_PARAMS
+        )
+        total, page = await run_io(
+            service.query, data_type, filters, sort, offset, limit,
+            fields.split(",") if fields else None,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers["X-Total-Count"] = str(total)
+    return page
 
 
 @router.get("/{data_type}/{item_id}")
-async def get_by_id(data_type: str, item_id: str) -> Dict:
+async def get_by_id(data_type: str, item_id: str, request: Request, response: Response) -> Dict:
     """IDでデータを取得"""
     validate_data_type(data_type)
     service = get_data_service()
-    result = service.get_by_id(data_type, item_id)
+    etag = make_etag(service.instance_id, data_type, service.get_revision(data_type), item_id)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    result = await run_io(service.get_by_id, data_type, item_id)
     if result is None:
         raise HTTPException(status_code=404, detail=f"Not found: {item_id}")
     return result
 
 
+@router.get("/{data_type}/{item_id}/references")
+async def get_inbound_references(data_type: str, item_id: str) -> List[Dict]:
+    """このレコードを参照しているレコードの一覧 (改名・削除の影響範囲)"""
+    validate_data_type(data_type)
+    service = get_data_service()
+    return await run_io(service.get_inbound_references, data_type, item_id)
+
+
 # ========================================
 # 作成・更新・削除
 # ========================================
 
 @router.post("/{data_type}")
-async def create(data_type: str, item: Dict) -> Dict:
+async def create(data_type: str, item: Dict, response: Response, references: str = REFERENCES_QUERY) -> Dict:
     """新規データ作成"""
     validate_data_type(data_type)
     service = get_data_service()
     try:
-        return service.create(data_type, item)
+        result = await run_io(service.create, data_type, item, references)
+    except DanglingReferenceError as e:
+        raise HTTPException(status_code=400, detail={"message": str(e), "errors": e.errors})
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    if references == "warn":
+        await add_reference_warnings(response, data_type, [result])
+    return result
 
 
 @router.put("/{data_type}/{item_id}")
-async def update(data_type: str, item_id: str, item: Dict) -> Dict:
+async def update(
+    data_type: str, item_id: str, item: Dict, response: Response, references: str = REFERENCES_QUERY
+) -> Dict:
     """データ更新"""
     validate_data_type(data_type)
     service = get_data_service()
     try:
-        return service.update(data_type, item_id, item)
+        result = await run_io(service.update, data_type, item_id, item, references)
+    except DanglingReferenceError as e:
+        raise HTTPException(status_code=400, detail={"message": str(e), "errors": e.errors})
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    if references == "warn":
+        new_id = result.get(service._get_id_field(data_type))
+        await add_reference_warnings(response, data_type, [result], [item_id] if new_id != item_id else [])
+    return result
 
 
 @router.delete("/{data_type}/{item_id}")
-async def delete(data_type: str, item_id: str) -> Dict[str, bool]:
+async def delete(
+    data_type: str,
+    item_id: str,
+    response: Response,
+    references: str = REFERENCES_QUERY,
+    cascade: bool = Query(False, description="参照しているレコードから参照を取り除いて削除"),
+) -> Dict[str, Any]:
     """データ削除"""
     validate_data_type(data_type)
     service = get_data_service()
-    success = service.delete(data_type, item_id)
+    if cascade:
+        try:
+            updated = await run_io(service.delete_cascade, data_type, item_id)
+        except RecordNotFoundError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except BulkValidationError as e:
+            raise HTTPException(status_code=400, detail={"message": str(e), "errors": e.errors})
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"success": True, "updated": updated}
+    try:
+        success = await run_io(service.delete, data_type, item_id, references)
+    except DanglingReferenceError as e:
+        raise HTTPException(status_code=400, detail={"message": str(e), "errors": e.errors})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not success:
         raise HTTPException(status_code=404, detail=f"Not found: {item_id}")
+    if references == "warn":
+        await add_reference_warnings(response, data_type, removed_ids=[item_id])
     return {"success": True}
 
 
-@router.post("/{data_type}/bulk")
-async def bulk_create(data_type: str, items: List[Dict]) -> List[Dict]:
-    """一括作成"""
+@router.post("/{data_type}/{item_id}/rename")
+async def rename(data_type: str, item_id: str, body: Dict[str, str]) -> Dict[str, Any]:
+    """IDを変更し、参照している全レコードを新しいIDに付け替える
+
+    リクエスト: {"newId": 新しいID}
+    """
     validate_data_type(data_type)
     service = get_data_service()
     try:
-        return service.bulk_create(data_type, items)
+        updated = await run_io(service.rename_cascade, data_type, item_id, body.get("newId"))
+    except RecordNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except BulkValidationError as e:
+        raise HTTPException(status_code=400, detail={"message": str(e), "errors": e.errors})
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    return {"id": body["newId"], "updated": updated}
 
 
-# ========================================
-# 参照整合性 & 依存関係
-# ========================================
-
-@router.get("/validation/references")
-async def check_references() -> Dict[str, List[Dict]]:
-    """参照整合性チェック"""
-    service = get_data_service()
-    return service.check_references()
-
-
-@router.get("/graph/dependencies")
-async def get_dependency_graph() -> Dict[str, Any]:
-    """依存関係グラフを取得"""
-    service = get_data_service()
-    return service.get_dependency_graph()
-
-
-# ========================================
-# エクスポート/インポート
-# ========================================
-
-@router.get("/export/all")
-async def export_all() -> Dict[str, List[Dict]]:
-    """全データをエクスポート"""
+@router.post("/{data_type}/bulk")
+async def bulk_create(
+    data_type: str, items: List[Dict], response: Response, references: str = REFERENCES_QUERY
+) -> List[Dict]:
+    """一括作成 (1件でも不正なら何も作成せず、行ごとのエラーを返す)"""
+    validate_data_type(data_type)
     service = get_data_service()
-    return {
-        data_type: service.get_all(data_type)
-        for data_type in VALID_DATA_TYPES
-    }
-
-
-@router.post("/import/all")
-async def import_all(data: Dict[str, List[Dict]]) -> Dict[str, int]:
-    """全データをインポート"""
-    service = get_data_service()
-    counts = {}
-    for data_type, items in data.items():
-        if data_type in VALID_DATA_TYPES:
-            # 既存データをクリアして新規作成
-            for existing in service.get_all(data_type):
-                id_field = service._get_id_field(data_type)
-                service.delete(data_type, existing[id_field])
-            for item in items:
-                service.create(data_type, item)
-            counts[data_type] = len(items)
-    return counts
+    try:
+        result = await run_io(service.bulk_create, data_type, items, references)
+    except (BulkValidationError, DanglingReferenceError) as e:
+        raise HTTPException(status_code=400, detail={"message": str(e), "errors": e.errors})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if references == "warn":
+        await add_reference_warnings(response, data_type, result)
+    return result
@@ -1,11 +1,24 @@
 """画像アップロード・管理 Router"""
-import os
-import shutil
 from pathlib import Path
-from typing import List
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from fastapi.responses import FileResponse
 
+from ..services.concurrency import run_io
+from ..services.image_catalog import ImageCatalog
+from ..services.image_store import MAX_UPLOAD_SIZE, ImageStore, ImageTooLargeError
+from ..services.image_sync import ImageSync
+from ..services.image_variants import (
+    MAX_VARIANT_DIMENSION,
+    VARIANT_FORMATS,
+    ImageVariants,
+    VariantError,
+    variant_name,
+    variants_available,
+)
+from ..services.multipart_upload import MAX_FIELD_BYTES, MultipartFileReceiver
+from .data_router import is_not_modified, not_modified
+
 router = APIRouter(prefix="/api/images", tags=["images"])
 
 # 画像保存ディレクトリ（Unityプロジェクトのパスも設定可能）
@@ -18,6 +31,24 @@ CATEGORIES = ["items", "upgrades", "gacha", "companies", "events", "characters"]
 # 許可する拡張子
 ALLOWED_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".webp"}
 
+# URLの ?v= に付けるハッシュの長さ
+URL_HASH_LENGTH = 16
+# ハッシュ付きURLは内容が変わらないので長期間キャッシュさせる
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# それ以外は毎回ETagで確認させる
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# 内容ハッシュで重複排除する画像ストア
+_image_store = ImageStore(IMAGES_DIR)
+# サムネイルなどのバリアントのキャッシュ
+_image_variants = ImageVariants(IMAGES_DIR)
+# カテゴリごとの画像一覧 (メモリ上)
+_image_catalog = ImageCatalog(_image_store, CATEGORIES, ALLOWED_EXTENSIONS)
+
+
+def get_image_catalog() -> ImageCatalog:
+    return _image_catalog
+
 
 def get_category_path(category: str) -> Path:
     """カテゴリのパスを取得"""
@@ -35,62 +66,155 @@ async def list_categories() -> List[str]:
 
 
 @router.get("/{category}")
-async def list_images(category: str) -> List[dict]:
-    """カテゴリ内の画像一覧"""
-    path = get_category_path(category)
-    images = []
-    for file in path.iterdir():
-        if file.suffix.lower() in ALLOWED_EXTENSIONS:
-            images.append({
-                "name": file.name,
-                "path": f"/api/images/{category}/{file.name}",
-                "size": file.stat().st_size,
-            })
-    return sorted(images, key=lambda x: x["name"])
+async def list_images(
+    response: Response,
+    category: str,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    prefix: Optional[str] = Query(None, description="名前の前方一致 (大文字小文字を区別しない)"),
+    sort: str = Query("name", description="name / size / mtime / width / height (先頭に - で降順)"),
+) -> List[dict]:
+    """カテゴリ内の画像一覧 (絞り込み後の総件数は X-Total-Count ヘッダー)"""
+    get_category_path(category)
+    if not _image_catalog.is_loaded(category):
+        await run_io(_image_catalog.ensure_loaded, category)
+    try:
+        page, total = _image_catalog.query(category, offset, limit, prefix, sort)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers["X-Total-Count"] = str(total)
+    return [_image_info(category, entry) for entry in page]
+
+
+def _image_info(category: str, entry: dict) -> dict:
+    return {
+        **entry,
+        "path": f"/api/images/{category}/{entry['name']}",
+        "url": image_url(category, entry["name"], entry["hash"]),
+    }
+
+
+def image_url(category: str, name: str, digest: str) -> str:
+    """内容ハッシュ付きのURL (内容が変わるとURLも変わるのでブラウザが長期間キャッシュできる)"""
+    return f"/api/images/{category}/{name}?v={digest[:URL_HASH_LENGTH]}"
+
+
+def _file_response(request: Request, path: Path, etag: str, digest: str, v: Optional[str], media_type: Optional[str] = None):
+    """ETag・Cache-Control付きで返す (一致すれば304、Rangeリクエストは部分的に返す)"""
+    cache_control = IMMUTABLE_CACHE_CONTROL if v in (digest[:URL_HASH_LENGTH], digest) else REVALIDATE_CACHE_CONTROL
+    if is_not_modified(request, etag):
+        response = not_modified(etag)
+        response.headers["Cache-Control"] = cache_control
+        return response
+    return FileResponse(path, media_type=media_type, headers={"ETag": etag, "Cache-Control": cache_control})
 
 
 @router.get("/{category}/{filename}")
-async def get_image(category: str, filename: str):
-    """画像ファイルを取得"""
+async def get_image(
+    request: Request,
+    category: str,
+    filename: str,
+    v: Optional[str] = Query(None, description="内容ハッシュ (一致すれば長期間キャッシュ可能)"),
+    w: Optional[int] = Query(None, ge=1, le=MAX_VARIANT_DIMENSION, description="縮小後の最大幅"),
+    h: Optional[int] = Query(None, ge=1, le=MAX_VARIANT_DIMENSION, description="縮小後の最大高さ"),
+    format: Optional[str] = Query(None, description="変換後の形式 (webp / png / jpeg)"),
+):
+    """画像ファイルを取得 (w / h / format を指定すると縮小・変換したものを返す)"""
     path = get_category_path(category) / filename
-    if not path.exists():
+    if not await run_io(path.exists):
         raise HTTPException(status_code=404, detail="Image not found")
-    return FileResponse(path)
-
-
-@router.post("/{category}")
-async def upload_image(category: str, file: UploadFile = File(...)) -> dict:
-    """画像をアップロード"""
-    # 拡張子チェック
-    ext = Path(file.filename).suffix.lower()
-    if ext not in ALLOWED_EXTENSIONS:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid file type. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"
-        )
+    if format is not None and format not in VARIANT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format: {format}")
+    digest = await run_io(_image_store.digest, path)
+    if (w is None and h is None and format is None) or not variants_available():
+        # Pillowが無い場合は元画像をそのまま返す
+        return _file_response(request, path, f'"{digest}"', digest, v)
+
+    fmt = format or _source_format(path)
+    etag = f'"{variant_name(digest, w, h, fmt)}"'
+    if is_not_modified(request, etag):
+        # 304なら変換済みかどうかに関わらず生成しない
+        return _file_response(request, path, etag, digest, v)
+    try:
+        variant = await _image_variants.get(path, digest, w, h, fmt)
+    except VariantError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return _file_response(request, variant, etag, digest, v, VARIANT_FORMATS[fmt][1])
+
+
+def _source_format(path: Path) -> str:
+    """形式の指定が無いときは元画像に近い形式にする (GIFなどはPNG)"""
+    ext = path.suffix.lower().lstrip(".")
+    if ext == "jpg":
+        return "jpeg"
+    return ext if ext in VARIANT_FORMATS else "png"
+
+
+# OpenAPIに載せるアップロードのリクエスト形式 (本体は自前で逐次解析するため手書きする)
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                },
+            },
+        },
+    },
+}
+
+
+@router.post("/{category}", openapi_extra=UPLOAD_OPENAPI)
+async def upload_image(category: str, request: Request) -> dict:
+    """画像をアップロード
+
+    本体は受信しながら解析して一時ファイルに書き込み、上限サイズを超えた時点で413を返す
+    (Content-Length が上限を超えていれば本体を読まずに拒否する)。
+    """
+    get_category_path(category)  # カテゴリの検証とフォルダ作成
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_SIZE + MAX_FIELD_BYTES:
+        raise HTTPException(status_code=413, detail=str(ImageTooLargeError(MAX_UPLOAD_SIZE)))
+
+    def open_file(filename: str):
+        # 拡張子チェック (ファイルの本体を受信する前に行う)
+        if Path(filename).suffix.lower() not in ALLOWED_EXTENSIONS:
+            raise ValueError(f"Invalid file type. Allowed: {', '.join(ALLOWED_EXTENSIONS)}")
+        return _image_store.begin_upload()
+
+    try:
+        receiver = MultipartFileReceiver(request.headers.get("content-type", ""), "file", open_file)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    writer = None
+    try:
+        async for chunk in request.stream():
+            await run_io(receiver.feed, chunk)
+        filename, writer = await run_io(receiver.finish)
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        if writer is None:
+            # 途中で打ち切った (切断を含む) 場合は書きかけの一時ファイルを削除
+            await run_io(receiver.close)
 
     # ファイル名をサニタイズ
-    safe_name = "".join(c for c in file.filename if c.isalnum() or c in "._-")
+    safe_name = "".join(c for c in filename if c.isalnum() or c in "._-")
     if not safe_name:
-        safe_name = "image" + ext
-
-    # 保存
-    path = get_category_path(category) / safe_name
-
-    # 同名ファイルがあればリネーム
-    counter = 1
-    original_stem = path.stem
-    while path.exists():
-        path = path.with_name(f"{original_stem}_{counter}{ext}")
-        counter += 1
-
-    with open(path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+        safe_name = "image" + Path(filename).suffix.lower()
 
+    # 保存 (同じ内容は実体を共有し、同名で内容が異なればハッシュ付きの名前にする)
+    saved = await run_io(_image_store.commit_upload, category, safe_name, writer)
+    await run_io(_image_catalog.refresh_file, category, saved["name"])
     return {
-        "name": path.name,
-        "path": f"/api/images/{category}/{path.name}",
-        "size": path.stat().st_size,
+        **saved,
+        "path": f"/api/images/{category}/{saved['name']}",
+        "url": image_url(category, saved["name"], saved["hash"]),
     }
 
 
@@ -98,9 +222,10 @@ async def upload_image(category: str, file: UploadFile = File(...)) -> dict:
 async def delete_image(category: str, filename: str) -> dict:
     """画像を削除"""
     path = get_category_path(category) / filename
-    if not path.exists():
+    if not await run_io(path.exists):
         raise HTTPException(status_code=404, detail="Image not found")
-    path.unlink()
+    await run_io(_image_store.remove, category, filename)
+    await run_io(_image_catalog.refresh_file, category, filename)
     return {"success": True}
 
 
@@ -112,9 +237,16 @@ async def delete_image(category: str, filename: str) -> dict:
 UNITY_PROJECT_PATH: Path | None = None
 
 
+# 同期マニフェスト (前回コピーしたファイルのサイズ・更新時刻・ハッシュ)
+_image_sync = ImageSync(_image_store, ALLOWED_EXTENSIONS)
+
+
 @router.post("/sync/unity")
-async def sync_from_unity(unity_path: str) -> dict:
-    """Unityプロジェクトから画像を同期"""
+async def sync_from_unity(unity_path: str, prune: bool = False) -> dict:
+    """Unityプロジェクトから画像を同期 (前回から変更されたファイルだけコピー)
+
+    prune: Unity側で削除された画像をこちらでも削除する (Falseなら件数の報告のみ)
+    """
     global UNITY_PROJECT_PATH
     UNITY_PROJECT_PATH = Path(unity_path)
 
@@ -124,19 +256,19 @@ async def sync_from_unity(unity_path: str) -> dict:
     # Resources/Iconsなどから画像をコピー
     icons_path = UNITY_PROJECT_PATH / "Assets" / "Resources" / "Icons"
     if not icons_path.exists():
-        return {"synced": 0, "message": "No Icons folder found in Unity project"}
-
-    synced = 0
-    for category in CATEGORIES:
-        category_path = icons_path / category
-        if category_path.exists():
-            dest_path = get_category_path(category)
-            for file in category_path.iterdir():
-                if file.suffix.lower() in ALLOWED_EXTENSIONS:
-                    shutil.copy2(file, dest_path / file.name)
-                    synced += 1
-
-    return {"synced": synced, "message": f"Synced {synced} images from Unity project"}
+        return {"synced": 0, "copied": 0, "skipped": 0, "removed": 0, "message": "No Icons folder found in Unity project"}
+
+    summary = await run_io(_image_sync.sync, icons_path, CATEGORIES, prune)
+    for category, counts in summary["categories"].items():
+        if counts["copied"] or counts["removed"]:
+            await run_io(_image_catalog.refresh, category)
+    message = f"Synced {summary['copied']} images from Unity project ({summary['skipped']} unchanged"
+    if summary["removed"]:
+        message += f", {summary['removed']} removed"
+    if summary["missing_upstream"]:
+        message += f", {summary['missing_upstream']} missing upstream"
+    message += ")"
+    return {"synced": summary["copied"], "message": message, **summary}
 
 
 @router.get("/unity/path")
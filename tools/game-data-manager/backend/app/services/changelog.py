@@ -0,0 +1,84 @@
+"""変更履歴 - シーケンス番号付きの上限ありチェンジログ"""
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, NamedTuple, Optional
+
+
+class ChangeEntry(NamedTuple):
+    seq: int
+    data_type: str
+    op: str                  # "put" / "del" / "reset"
+    item_id: Optional[str]
+    record: Optional[Dict]
+
+
+class ChangeLog:
+    """直近の変更をメモリに保持し、指定シーケンス以降の差分を返す"""
+
+    def __init__(self, max_entries: int = 10000):
+        self._entries: Deque[ChangeEntry] = deque(maxlen=max_entries)
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    @property
+    def seq(self) -> int:
+        """最新のシーケンス番号"""
+        return self._seq
+
+    def record(self, data_type: str, changes: List[Dict]) -> int:
+        """put/del変更を記録"""
+        with self._lock:
+            for change in changes:
+                if change["op"] == "put" and change.get("prev"):
+                    # ID変更は旧IDの削除として記録
+                    self._append(data_type, "del", change["prev"], None)
+                self._append(data_type, change["op"], change["id"], change.get("data"))
+            return self._seq
+
+    def record_reset(self, data_type: str) -> int:
+        """データタイプ全体の差し替えを記録 (クライアントは再取得が必要)"""
+        with self._lock:
+            self._append(data_type, "reset", None, None)
+            return self._seq
+
+    def _append(self, data_type: str, op: str, item_id: Optional[str], record: Optional[Dict]) -> None:
+        self._seq += 1
+        self._entries.append(ChangeEntry(self._seq, data_type, op, item_id, record))
+
+    def full_resync(self) -> Dict[str, Any]:
+        """差分を返せないときの応答 (クライアントは全件を取得し直す)"""
+        return {"seq": self._seq, "full_resync": True, "reset": [], "changes": {}}
+
+    def since(self, since: int) -> Dict[str, Any]:
+        """指定シーケンスより後の変更をID単位にまとめて返す"""
+        with self._lock:
+            seq = self._seq
+            oldest = self._entries[0].seq if self._entries else seq + 1
+            if since > seq or since < oldest - 1:
+                # 履歴から溢れた (またはサーバー再起動後) → 全件再取得が必要
+                return self.full_resync()
+            entries = []
+            for entry in reversed(self._entries):
+                if entry.seq <= since:
+                    break
+                entries.append(entry)
+
+        reset: List[str] = []
+        latest: Dict[str, Dict[str, ChangeEntry]] = {}
+        for entry in reversed(entries):
+            if entry.op == "reset":
+                if entry.data_type not in reset:
+                    reset.append(entry.data_type)
+                latest.pop(entry.data_type, None)
+                continue
+            latest.setdefault(entry.data_type, {})[entry.item_id] = entry
+
+        changes = {}
+        for data_type, by_id in latest.items():
+            if data_type in reset and not by_id:
+                continue
+            changes[data_type] = {
+                "upserted": [e.record for e in by_id.values() if e.op == "put"],
+                "deleted": [e.item_id for e in by_id.values() if e.op == "del"],
+            }
+        return {"seq": seq, "full_resync": False, "reset": reset, "changes": changes}
@@ -0,0 +1,65 @@
+"""並行処理ユーティリティ - スレッドプールでのI/O実行と読み書きロック"""
+import os
+import threading
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Callable, Optional
+
+import anyio
+import anyio.to_thread
+
+# ブロッキングI/Oに使うワーカー数
+IO_WORKERS = int(os.environ.get("GAME_DATA_IO_WORKERS", "8"))
+
+_limiter: Optional[anyio.CapacityLimiter] = None
+
+
+def _get_limiter() -> anyio.CapacityLimiter:
+    global _limiter
+    if _limiter is None:
+        _limiter = anyio.CapacityLimiter(IO_WORKERS)
+    return _limiter
+
+
+async def run_io(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """ブロッキング処理を上限付きスレッドプールで実行 (イベントループを止めない)"""
+    return await anyio.to_thread.run_sync(partial(func, *args, **kwargs), limiter=_get_limiter())
+
+
+class RWLock:
+    """読み書きロック (読み込みは並行、書き込みは排他、書き込み優先)"""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
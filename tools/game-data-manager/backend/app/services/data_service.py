@@ -1,10 +1,27 @@
 """データサービス - JSON読み書きとバリデーション"""
-import json
+import copy
+import logging
 import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
 from pathlib import Path
-from typing import Dict, List, Any, Optional, TypeVar, Type
-from pydantic import BaseModel
-
+from typing import Callable, Dict, List, Any, Optional, Tuple, TypeVar, Type
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+from .record_diff import diff_fields, record_hash
+from .changelog import ChangeLog
+from .concurrency import RWLock
+from .query import TableIndex, project
+from .graph import DIRECTIONS, EDGE_TYPES, DependencyGraph
+from .maintained_index import MaintainedIndex
+from .prerequisites import PREREQUISITE_FIELDS, analyze, cycle_errors
+from .reference_index import ReferenceIndex
+from .search import SearchIndex
+from .references import NODE_PREFIXES, REFERENCES_BY_SOURCE, iter_references, rewrite_references
+from .serialization import SerializedBody, dumps, join_object
+from .storage import STORAGE_BACKENDS
 from ..models import (
     ItemData, UpgradeData, GachaBannerData, CompanyData,
     StockData, StockPrestigeData, MarketEventData, GameEventData
@@ -12,6 +29,8 @@ from ..models import (
 
 T = TypeVar('T', bound=BaseModel)
 
+logger = logging.getLogger(__name__)
+
 # データタイプとファイル名のマッピング
 DATA_FILES = {
     "items": "items.json",
@@ -35,19 +54,96 @@ DATA_MODELS: Dict[str, Type[BaseModel]] = {
     "game_events": GameEventData,
 }
 
+# 一括バリデーション用のアダプタ
+DATA_LIST_ADAPTERS: Dict[str, TypeAdapter] = {
+    data_type: TypeAdapter(List[model_class])
+    for data_type, model_class in DATA_MODELS.items()
+}
+
+# チェンジログに保持する変更件数
+CHANGELOG_SIZE = int(os.environ.get("GAME_DATA_CHANGELOG_SIZE", "10000"))
+
+# ストレージ方式 ("json": 毎回全体を書き換え / "journal": 追記ジャーナル + コンパクション / "sqlite": SQLite)
+STORAGE_MODE = os.environ.get("GAME_DATA_STORAGE", "json")
+
+# 作成・更新・削除時の参照チェック ("ignore": しない / "warn": 警告のみ / "reject": 未解決の参照があれば拒否)
+REFERENCE_MODES = ("ignore", "warn", "reject")
+
+
+def id_type_error(item_id: Any) -> Optional[str]:
+    """IDが文字列でなければエラーメッセージ (リストやオブジェクトは照合に使えない)"""
+    if item_id is None or isinstance(item_id, str):
+        return None
+    return f"ID must be a string, got {type(item_id).__name__}"
+
+
+class BulkValidationError(ValueError):
+    """一括処理のバリデーションエラー (行ごとのエラーを保持)"""
+
+    def __init__(self, errors: List[Dict]):
+        super().__init__(f"{len(errors)} invalid record(s)")
+        self.errors = errors
+
+
+class RecordNotFoundError(KeyError):
+    """指定したIDのレコードが存在しない"""
+
+    def __str__(self) -> str:
+        return f"Not found: {self.args[0]}"
+
+
+class DanglingReferenceError(ValueError):
+    """存在しないレコードへの参照が残る変更 (参照ごとのエラーを保持)"""
+
+    def __init__(self, errors: List[Dict]):
+        super().__init__(f"{len(errors)} dangling reference(s)")
+        self.errors = errors
+
 
 class DataService:
     """データ管理サービス"""
 
-    def __init__(self, data_dir: str = None):
+    def __init__(self, data_dir: str = None, storage: str = None):
         if data_dir is None:
             # デフォルトはbackend/dataフォルダ
             data_dir = Path(__file__).parent.parent.parent / "data"
         self.data_dir = Path(data_dir)
         self.data_dir.mkdir(parents=True, exist_ok=True)
 
+        storage = storage or STORAGE_MODE
+        if storage not in STORAGE_BACKENDS:
+            raise ValueError(f"Unknown storage: {storage}")
+        self._storage = STORAGE_BACKENDS[storage](self.data_dir, DATA_FILES, self._get_id_field)
+
         # キャッシュ
         self._cache: Dict[str, List[Dict]] = {}
+        # 主キーインデックス (データタイプ -> {ID: リスト上の位置})
+        self._index: Dict[str, Dict[str, int]] = {}
+        # レコードハッシュのメモ (データタイプ -> {ID: (レコード, ハッシュ)})
+        self._hashes: Dict[str, Dict[str, Tuple[Dict, str]]] = {}
+        # データタイプごとのリビジョン (変更・再読み込みのたびに増加)
+        self._revisions: Dict[str, int] = {}
+        # 変更履歴 (差分取得用)
+        self.changelog = ChangeLog(CHANGELOG_SIZE)
+        # 変更イベントの購読者
+        self._listeners: List[Callable[[Dict], None]] = []
+        # プロセスごとの識別子 (再起動でリビジョンが巻き戻ってもETagが衝突しないように)
+        self.instance_id = uuid.uuid4().hex
+        # 一覧クエリ用インデックス (初回の問い合わせで構築し、以降は変更イベントで差分更新)
+        self._query_indexes: Dict[str, TableIndex] = {}
+        self._query_lock = threading.Lock()
+        # レスポンス用のエンコード済みJSON (リビジョンが変わったタイプだけ作り直す)
+        self._serialized: Dict[str, SerializedBody] = {}
+        self._serialized_export: Optional[SerializedBody] = None
+        # 参照インデックス・依存関係グラフなど (初回の利用時に構築し、以降は変更イベントで更新)
+        self._maintained: Dict[str, MaintainedIndex] = {}
+        self._maintained_lock = threading.Lock()
+        # 前提チェーン分析の結果 (関係するタイプのリビジョン, 結果)
+        self._prerequisites: Optional[Tuple[Tuple[int, ...], Dict[str, Any]]] = None
+        # データタイプごとの読み書きロック (読み込みは並行、変更は直列)
+        self._locks = {data_type: RWLock() for data_type in DATA_FILES}
+        self._load_lock = threading.Lock()
+        self.subscribe(self._update_query_index)
 
     def _get_file_path(self, data_type: str) -> Path:
         """データタイプに対応するファイルパスを取得"""
@@ -57,95 +153,488 @@ class DataService:
 
     def _load_json(self, data_type: str) -> List[Dict]:
         """JSONファイルを読み込み"""
-        file_path = self._get_file_path(data_type)
-        if not file_path.exists():
-            return []
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-
-    def _save_json(self, data_type: str, data: List[Dict]) -> None:
-        """JSONファイルに保存"""
-        file_path = self._get_file_path(data_type)
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        # キャッシュを更新
-        self._cache[data_type] = data
+        self._get_file_path(data_type)
+        return self._storage.load(data_type)
+
+    def _save_json(self, data_type: str, changes: List[Dict], op: str) -> None:
+        """変更をストレージに書き込み (changes: put/delレコード)"""
+        self._storage.commit(data_type, self._cache[data_type], changes)
+        self._bump_revision(data_type)
+        self.changelog.record(data_type, changes)
+        self._notify(data_type, op, changes)
+
+    def _swap_table(self, data_type: str, data: List[Dict], op: str) -> None:
+        """テーブル全体を差し替えたことを反映 (書き込みロック中に呼ぶ)"""
+        self._set_cache(data_type, data)
+        self._bump_revision(data_type)
+        self.changelog.record_reset(data_type)
+        id_field = self._get_id_field(data_type)
+        self._notify(data_type, op, [_put(record, id_field) for record in data], reset=True)
 
     # ========================================
-    # CRUD操作
+    # 変更通知
     # ========================================
 
-    def get_all(self, data_type: str) -> List[Dict]:
-        """全データを取得"""
-        if data_type not in self._cache:
-            self._cache[data_type] = self._load_json(data_type)
-        return self._cache[data_type]
+    def subscribe(self, listener: Callable[[Dict], None]) -> None:
+        """変更イベントの購読を登録
+
+        イベント: {"type", "op", "ids", "revision", "seq", "changes", "reset"}
+        書き込みロック中に呼ばれるため、listenerは素早く戻ること。
+        """
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[Dict], None]) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _notify(self, data_type: str, op: str, changes: List[Dict], reset: bool = False) -> None:
+        if not self._listeners:
+            return
+        event = {
+            "type": data_type,
+            "op": op,
+            "ids": [change["id"] for change in changes],
+            "revision": self.get_revision(data_type),
+            "seq": self.changelog.seq,
+            "changes": changes,
+            "reset": reset,
+        }
+        for listener in list(self._listeners):
+            try:
+                listener(event)
+            except Exception:
+                logger.exception("change listener failed")
 
-    def get_by_id(self, data_type: str, item_id: str) -> Optional[Dict]:
-        """IDでデータを取得"""
-        id_field = self._get_id_field(data_type)
-        data = self.get_all(data_type)
-        for item in data:
-            if item.get(id_field) == item_id:
-                return item
-        return None
+    def _bump_revision(self, data_type: str) -> None:
+        self._revisions[data_type] = self._revisions.get(data_type, 0) + 1
 
-    def create(self, data_type: str, item: Dict) -> Dict:
-        """新規データ作成"""
-        data = self.get_all(data_type)
+    def get_revision(self, data_type: str) -> int:
+        """データタイプの現在のリビジョン"""
+        return self._revisions.get(data_type, 0)
 
-        # IDの重複チェック
-        id_field = self._get_id_field(data_type)
-        item_id = item.get(id_field)
-        if any(d.get(id_field) == item_id for d in data):
-            raise ValueError(f"Duplicate ID: {item_id}")
+    def get_changes(self, since: int, instance: Optional[str] = None) -> Dict[str, Any]:
+        """指定シーケンス以降の変更 (追加・更新レコードと削除ID) を取得
 
-        # バリデーション
-        model_class = DATA_MODELS[data_type]
-        validated = model_class(**item)
-        validated_dict = validated.model_dump(by_alias=True, exclude_none=True)
+        instance: クライアントが前回受け取ったインスタンスID。
+        再起動でシーケンスが振り直されていれば、番号が一致しても全件再取得とする。
+        """
+        if instance is not None and instance != self.instance_id:
+            return {"instance": self.instance_id, **self.changelog.full_resync()}
+        return {"instance": self.instance_id, **self.changelog.since(since)}
 
-        data.append(validated_dict)
-        self._save_json(data_type, data)
-        return validated_dict
+    def close(self) -> None:
+        """ストレージを閉じる (未反映のジャーナルを書き出す)"""
+        self._storage.close()
 
-    def update(self, data_type: str, item_id: str, item: Dict) -> Dict:
-        """データ更新"""
-        data = self.get_all(data_type)
-        id_field = self._get_id_field(data_type)
+    # ========================================
+    # 主キーインデックス
+    # ========================================
 
-        # バリデーション
-        model_class = DATA_MODELS[data_type]
-        validated = model_class(**item)
-        validated_dict = validated.model_dump(by_alias=True, exclude_none=True)
+    def _set_cache(self, data_type: str, data: List[Dict]) -> None:
+        """キャッシュを差し替えてインデックスを再構築"""
+        self._cache[data_type] = data
+        self._index[data_type] = self._build_index(data_type, data)
+        self._hashes.pop(data_type, None)
 
-        # 更新
+    def _build_index(self, data_type: str, data: List[Dict]) -> Dict[str, int]:
+        """ID -> 位置のインデックスを構築 (重複IDは先頭を優先)"""
+        id_field = self._get_id_field(data_type)
+        index: Dict[str, int] = {}
         for i, d in enumerate(data):
-            if d.get(id_field) == item_id:
-                data[i] = validated_dict
-                self._save_json(data_type, data)
-                return validated_dict
+            index.setdefault(d.get(id_field), i)
+        return index
+
+    def _ensure_loaded(self, data_type: str) -> None:
+        """未読み込みならファイルから読み込んでキャッシュする"""
+        if data_type not in self._cache:
+            with self._load_lock:
+                if data_type not in self._cache:
+                    self._set_cache(data_type, self._load_json(data_type))
+
+    def reload(self, data_type: str) -> None:
+        """ファイルから再読み込みしてキャッシュを差し替え (外部での変更を反映)"""
+        self._get_file_path(data_type)
+        with self._locks[data_type].write():
+            self._swap_table(data_type, self._storage.reload(data_type), "reload")
+
+    @contextmanager
+    def _write_locked(self, *data_types: str):
+        """複数タイプの書き込みロックを取得 (デッドロック防止のため名前順)"""
+        with ExitStack() as stack:
+            for data_type in sorted(set(data_types)):
+                self._ensure_loaded(data_type)
+                stack.enter_context(self._locks[data_type].write())
+            yield
+
+    @contextmanager
+    def _read_locked(self, *data_types: str):
+        """複数タイプの読み込みロックを取得 (書き込みロックと同じ名前順)"""
+        with ExitStack() as stack:
+            for data_type in sorted(set(data_types)):
+                self._ensure_loaded(data_type)
+                stack.enter_context(self._locks[data_type].read())
+            yield
+
+    def is_loaded(self, data_type: str) -> bool:
+        """キャッシュに読み込み済みか"""
+        return data_type in self._cache
+
+    def _remove_at(self, data_type: str, pos: int) -> Dict:
+        """指定位置のレコードを削除し、後続の位置を詰める"""
+        data = self._cache[data_type]
+        index = self._index[data_type]
+        id_field = self._get_id_field(data_type)
+
+        removed = data.pop(pos)
+        removed_id = removed.get(id_field)
+        if index.get(removed_id) == pos:
+            del index[removed_id]
+        for i in range(pos, len(data)):
+            key = data[i].get(id_field)
+            if index.get(key) == i + 1:
+                index[key] = i
+            elif key == removed_id and key not in index:
+                # 重複IDが残っていれば次の出現位置を採用
+                index[key] = i
+        return removed
+
+    # ========================================
+    # CRUD操作
+    # ========================================
 
-        raise ValueError(f"Not found: {item_id}")
+    def get_all(self, data_type: str) -> List[Dict]:
+        """全データを取得 (呼び出し時点のスナップショット)"""
+        self._ensure_loaded(data_type)
+        with self._locks[data_type].read():
+            return list(self._cache[data_type])
+
+    def query(
+        self,
+        data_type: str,
+        filters: List[Tuple[str, str, List[str]]] = (),
+        sort: Optional[str] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        fields: Optional[List[str]] = None,
+    ) -> Tuple[int, List[Dict]]:
+        """絞り込み・並び替え・ページング付きでデータを取得し (総件数, ページ) を返す"""
+        known = self._get_field_names(data_type)
+        requested = [f for f, _, _ in filters] + ([sort.lstrip("-")] if sort else []) + list(fields or [])
+        for field in requested:
+            if field not in known:
+                raise ValueError(f"Unknown field: {field}")
+
+        self._ensure_loaded(data_type)
+        with self._locks[data_type].read():
+            total, page = self._table_index(data_type).query(filters, sort, offset, limit)
+        if fields:
+            id_field = self._get_id_field(data_type)
+            page = project(page, [id_field] + [f for f in fields if f != id_field])
+        return total, page
+
+    def _table_index(self, data_type: str) -> TableIndex:
+        """クエリ用インデックスを取得 (読み込みロック中に呼ぶ)"""
+        index = self._query_indexes.get(data_type)
+        if index is None:
+            with self._query_lock:
+                index = self._query_indexes.get(data_type)
+                if index is None:
+                    index = TableIndex(self._cache[data_type], self._get_id_field(data_type))
+                    self._query_indexes[data_type] = index
+        return index
+
+    def _update_query_index(self, event: Dict) -> None:
+        """変更イベントをクエリ用インデックスに反映 (構築済みのタイプのみ)"""
+        index = self._query_indexes.get(event["type"])
+        if index is not None:
+            index.apply(event)
+
+    def get_serialized(self, data_type: str) -> SerializedBody:
+        """全データのエンコード済みJSONを取得 (リビジョンごとにキャッシュ)"""
+        self._ensure_loaded(data_type)
+        body = self._serialized.get(data_type)
+        if body is None or body.revision != self.get_revision(data_type):
+            with self._locks[data_type].read():
+                body = SerializedBody(dumps(self._cache[data_type]), self.get_revision(data_type))
+            self._serialized[data_type] = body
+        return body
+
+    def get_serialized_export(self, data_types: List[str]) -> SerializedBody:
+        """複数タイプをまとめたエンコード済みJSON (タイプごとのキャッシュから組み立てる)"""
+        bodies = [(data_type, self.get_serialized(data_type)) for data_type in data_types]
+        revisions = tuple((data_type, body.revision) for data_type, body in bodies)
+        export = self._serialized_export
+        if export is None or export.revision != revisions:
+            export = SerializedBody(join_object((t, body.plain) for t, body in bodies), revisions)
+            self._serialized_export = export
+        return export
+
+    def _get_field_names(self, data_type: str) -> set:
+        """モデルのフィールド名 (JSONのキー名) 一覧"""
+        return {
+            field.alias or name
+            for name, field in DATA_MODELS[data_type].model_fields.items()
+        }
 
-    def delete(self, data_type: str, item_id: str) -> bool:
-        """データ削除"""
-        data = self.get_all(data_type)
+    def get_by_id(self, data_type: str, item_id: str) -> Optional[Dict]:
+        """IDでデータを取得"""
+        self._ensure_loaded(data_type)
+        with self._locks[data_type].read():
+            pos = self._index[data_type].get(item_id)
+            if pos is None:
+                return None
+            return self._cache[data_type][pos]
+
+    def create(self, data_type: str, item: Dict, references: str = "ignore") -> Dict:
+        """新規データ作成 (references="reject" なら存在しないレコードへの参照を拒否)"""
+        self._prepare_reference_check(references)
+        self._ensure_loaded(data_type)
+        with self._locks[data_type].write():
+            data = self._cache[data_type]
+
+            # IDの重複チェック
+            id_field = self._get_id_field(data_type)
+            item_id = item.get(id_field)
+            if item_id in self._index[data_type]:
+                raise ValueError(f"Duplicate ID: {item_id}")
+
+            # バリデーション
+            model_class = DATA_MODELS[data_type]
+            validated = model_class(**item)
+            validated_dict = validated.model_dump(by_alias=True, exclude_none=True)
+            if references == "reject":
+                self._reject_dangling(data_type, [validated_dict])
+
+            data.append(validated_dict)
+            self._index[data_type].setdefault(validated_dict.get(id_field), len(data) - 1)
+            self._save_json(data_type, [_put(validated_dict, id_field)], "create")
+            return validated_dict
+
+    def update(self, data_type: str, item_id: str, item: Dict, references: str = "ignore") -> Dict:
+        """データ更新 (references="reject" なら未解決の参照が生じる変更を拒否)"""
+        self._prepare_reference_check(references)
+        self._ensure_loaded(data_type)
+        with self._locks[data_type].write():
+            data = self._cache[data_type]
+            id_field = self._get_id_field(data_type)
+
+            # バリデーション
+            model_class = DATA_MODELS[data_type]
+            validated = model_class(**item)
+            validated_dict = validated.model_dump(by_alias=True, exclude_none=True)
+
+            # 更新
+            pos = self._index[data_type].get(item_id)
+            if pos is None:
+                raise ValueError(f"Not found: {item_id}")
+
+            new_id = validated_dict.get(id_field)
+            if new_id != item_id and new_id in self._index[data_type]:
+                raise ValueError(f"Duplicate ID: {new_id}")
+            if references == "reject":
+                self._reject_dangling(data_type, [validated_dict], [item_id] if new_id != item_id else [])
+            if new_id != item_id:
+                # ID変更時はインデックスの付け替え
+                del self._index[data_type][item_id]
+                self._index[data_type][new_id] = pos
+
+            data[pos] = validated_dict
+            self._save_json(data_type, [_put(validated_dict, id_field, prev=item_id)], "update")
+            return validated_dict
+
+    def delete(self, data_type: str, item_id: str, references: str = "ignore") -> bool:
+        """データ削除 (references="reject" なら参照されているレコードの削除を拒否)"""
+        self._prepare_reference_check(references)
+        self._ensure_loaded(data_type)
+        with self._locks[data_type].write():
+            pos = self._index[data_type].get(item_id)
+            if pos is None:
+                return False
+            if references == "reject":
+                self._reject_dangling(data_type, removed_ids=[item_id])
+
+            self._remove_at(data_type, pos)
+            self._save_json(data_type, [{"op": "del", "id": item_id}], "delete")
+            return True
+
+    def bulk_create(self, data_type: str, items: List[Dict], references: str = "ignore") -> List[Dict]:
+        """一括作成 (全件検証後に1回で書き込み、1件でも不正なら何も反映しない)"""
+        self._prepare_reference_check(references)
+        self._ensure_loaded(data_type)
+        with self._locks[data_type].write():
+            data = self._cache[data_type]
+            index = self._index[data_type]
+            id_field = self._get_id_field(data_type)
+
+            validated, errors = self._check_batch(data_type, items, index)
+            if errors:
+                raise BulkValidationError(errors)
+            if references == "reject":
+                self._reject_dangling(data_type, validated)
+
+            for record in validated:
+                data.append(record)
+                index[record.get(id_field)] = len(data) - 1
+            self._save_json(data_type, [_put(record, id_field) for record in validated], "bulk")
+            return validated
+
+    def replace_all(self, datasets: Dict[str, List[Dict]]) -> Dict[str, int]:
+        """複数タイプのデータを丸ごと差し替え
+
+        全タイプをメモリ上で並列に検証し、1件でも不正なら何も反映しない。
+        反映はタイプごとに一時ファイル + renameで1回ずつ書き込む。
+        """
+        for data_type in datasets:
+            self._get_file_path(data_type)
+
+        with ThreadPoolExecutor(max_workers=len(datasets) or 1) as pool:
+            checked = dict(zip(
+                datasets,
+                pool.map(lambda t: self._check_batch(t, datasets[t]), datasets),
+            ))
+
+        errors = [
+            {"type": data_type, **err}
+            for data_type, (_, type_errors) in checked.items()
+            for err in type_errors
+        ]
+        if errors:
+            raise BulkValidationError(errors)
+        return self.replace_validated({data_type: validated for data_type, (validated, _) in checked.items()})
+
+    def replace_validated(self, datasets: Dict[str, List[Dict]]) -> Dict[str, int]:
+        """検証済みのデータでタイプごとに丸ごと差し替え (全タイプを同時にロックして反映)"""
+        for data_type in datasets:
+            self._get_file_path(data_type)
+        with self._write_locked(*datasets):
+            for data_type, validated in datasets.items():
+                self._storage.replace(data_type, validated)
+                self._swap_table(data_type, validated, "import")
+        return {data_type: len(validated) for data_type, validated in datasets.items()}
+
+    def diff_all(self, datasets: Dict[str, List[Dict]]) -> Dict[str, Dict[str, Any]]:
+        """インポートした場合の差分を取得 (ドライラン)
+
+        正規化したレコードのハッシュで比較するため、変更のないレコードは検証しない。
+        """
+        return {data_type: self._diff_type(data_type, items) for data_type, items in datasets.items()}
+
+    def _diff_type(self, data_type: str, items: List[Dict]) -> Dict[str, Any]:
+        """1タイプ分の差分 (追加/削除/変更ID)"""
+        self._ensure_loaded(data_type)
+        with self._locks[data_type].read():
+            data = list(self._cache[data_type])
+            index = dict(self._index[data_type])
         id_field = self._get_id_field(data_type)
+        model_class = DATA_MODELS[data_type]
 
-        for i, d in enumerate(data):
-            if d.get(id_field) == item_id:
-                data.pop(i)
-                self._save_json(data_type, data)
-                return True
-        return False
-
-    def bulk_create(self, data_type: str, items: List[Dict]) -> List[Dict]:
-        """一括作成"""
-        results = []
-        for item in items:
-            results.append(self.create(data_type, item))
-        return results
+        added, modified, errors = [], [], []
+        unchanged = 0
+        seen = set()
+        for i, item in enumerate(items):
+            item_id = item.get(id_field) if isinstance(item, dict) else None
+            id_error = id_type_error(item_id)
+            if id_error:
+                errors.append({"index": i, "id": item_id, "errors": [id_error]})
+                continue
+            if item_id in seen:
+                errors.append({"index": i, "id": item_id, "errors": [f"Duplicate ID in batch: {item_id}"]})
+                continue
+            seen.add(item_id)
+
+            pos = index.get(item_id)
+            if pos is not None and record_hash(item) == self._record_hash(data_type, item_id, data[pos]):
+                unchanged += 1
+                continue
+
+            try:
+                normalized = model_class.model_validate(item).model_dump(by_alias=True, exclude_none=True)
+            except ValidationError as e:
+                errors.append({"index": i, "id": item_id, "errors": [
+                    f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+                ]})
+                continue
+
+            if pos is None:
+                added.append(item_id)
+            elif record_hash(normalized) == self._record_hash(data_type, item_id, data[pos]):
+                unchanged += 1
+            else:
+                modified.append({"id": item_id, "changes": diff_fields(data[pos], normalized)})
+
+        removed = [d.get(id_field) for d in data if d.get(id_field) not in seen]
+        return {
+            "added": added,
+            "removed": removed,
+            "modified": modified,
+            "unchanged": unchanged,
+            "errors": errors,
+        }
+
+    def _record_hash(self, data_type: str, item_id: str, record: Dict) -> str:
+        """保存済みレコードのハッシュ (レコードが差し替わるまでメモ)"""
+        memo = self._hashes.setdefault(data_type, {})
+        cached = memo.get(item_id)
+        if cached is not None and cached[0] is record:
+            return cached[1]
+        digest = record_hash(record)
+        memo[item_id] = (record, digest)
+        return digest
+
+    def _check_batch(
+        self, data_type: str, items: List[Dict], existing: Optional[Dict[str, int]] = None
+    ) -> Tuple[List[Dict], List[Dict]]:
+        """バッチを検証し、(検証済み辞書リスト, 行ごとのエラー一覧) を返す"""
+        id_field = self._get_id_field(data_type)
+        validated, errors = self._validate_batch(data_type, items)
+
+        # IDの重複チェック (既存データ + バッチ内)
+        seen = set()
+        for i, item in enumerate(items):
+            item_id = item.get(id_field) if isinstance(item, dict) else None
+            if id_type_error(item_id):
+                # 型の誤りはモデルの検証で行ごとのエラーになっている
+                continue
+            if existing is not None and item_id in existing:
+                errors.setdefault(i, []).append(f"Duplicate ID: {item_id}")
+            elif item_id in seen:
+                errors.setdefault(i, []).append(f"Duplicate ID in batch: {item_id}")
+            seen.add(item_id)
+
+        return validated, [
+            {
+                "index": i,
+                "id": items[i].get(id_field) if isinstance(items[i], dict) else None,
+                "errors": errors[i],
+            }
+            for i in sorted(errors)
+        ]
+
+    def _validate_batch(self, data_type: str, items: List[Dict]):
+        """リストをまとめて検証し、(検証済み辞書リスト, 位置 -> エラー一覧) を返す"""
+        try:
+            models = DATA_LIST_ADAPTERS[data_type].validate_python(items)
+        except ValidationError as e:
+            errors: Dict[int, List[str]] = {}
+            for err in e.errors():
+                loc = err["loc"]
+                row = loc[0] if loc and isinstance(loc[0], int) else 0
+                field = ".".join(str(part) for part in loc[1:])
+                errors.setdefault(row, []).append(f"{field}: {err['msg']}" if field else err["msg"])
+            return [], errors
+
+        return [model.model_dump(by_alias=True, exclude_none=True) for model in models], {}
+
+    def validate_record(self, data_type: str, item: Any) -> Tuple[Optional[Dict], List[str]]:
+        """1件を検証し、(検証済み辞書, エラー一覧) を返す"""
+        try:
+            model = DATA_MODELS[data_type].model_validate(item)
+        except ValidationError as e:
+            return None, [
+                f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" if err["loc"] else err["msg"]
+                for err in e.errors()
+            ]
+        return model.model_dump(by_alias=True, exclude_none=True), []
 
     def _get_id_field(self, data_type: str) -> str:
         """データタイプに対応するIDフィールド名を取得"""
@@ -166,152 +655,231 @@ class DataService:
     # ========================================
 
     def check_references(self) -> Dict[str, List[Dict]]:
-        """全データの参照整合性をチェック"""
-        errors = {
-            "missing_items": [],
-            "missing_upgrades": [],
-            "missing_companies": [],
-            "missing_stocks": [],
-            "missing_events": [],
-            "missing_banners": [],
+        """全データの参照整合性をチェック (未解決参照 + 前提条件の循環)"""
+        return {
+            **self._reference_index().report(),
+            "prerequisite_cycles": cycle_errors(self.get_prerequisite_analysis()),
         }
 
-        # 全IDを収集
-        item_ids = {d["id"] for d in self.get_all("items")}
-        upgrade_ids = {d["id"] for d in self.get_all("upgrades")}
-        company_ids = {d["id"] for d in self.get_all("companies")}
-        stock_ids = {d["stockId"] for d in self.get_all("stocks")}
-        event_ids = {d["eventId"] for d in self.get_all("game_events")}
-        banner_ids = {d["bannerId"] for d in self.get_all("gacha_banners")}
-
-        # アップグレードの参照チェック
-        for upgrade in self.get_all("upgrades"):
-            # 解放条件アイテム
-            if ref := upgrade.get("requiredUnlockItemId"):
-                if ref not in item_ids:
-                    errors["missing_items"].append({
-                        "source": f"upgrade:{upgrade['id']}",
-                        "field": "requiredUnlockItemId",
-                        "missing_id": ref
-                    })
-            # 前提アップグレード
-            if ref := upgrade.get("prerequisiteUpgradeId"):
-                if ref not in upgrade_ids:
-                    errors["missing_upgrades"].append({
-                        "source": f"upgrade:{upgrade['id']}",
-                        "field": "prerequisiteUpgradeId",
-                        "missing_id": ref
-                    })
-            # 素材アイテム
-            for mat in upgrade.get("requiredMaterials", []):
-                if mat.get("itemId") not in item_ids:
-                    errors["missing_items"].append({
-                        "source": f"upgrade:{upgrade['id']}",
-                        "field": "requiredMaterials",
-                        "missing_id": mat.get("itemId")
-                    })
-
-        # ガチャの参照チェック
-        for banner in self.get_all("gacha_banners"):
-            # 排出アイテム
-            for entry in banner.get("pool", []):
-                if entry.get("itemId") not in item_ids:
-                    errors["missing_items"].append({
-                        "source": f"gacha:{banner['bannerId']}",
-                        "field": "pool",
-                        "missing_id": entry.get("itemId")
-                    })
-            # ピックアップアイテム
-            for item_id in banner.get("pickupItemIds", []):
-                if item_id not in item_ids:
-                    errors["missing_items"].append({
-                        "source": f"gacha:{banner['bannerId']}",
-                        "field": "pickupItemIds",
-                        "missing_id": item_id
-                    })
-            # 前提バナー
-            if ref := banner.get("prerequisiteBannerId"):
-                if ref not in banner_ids:
-                    errors["missing_banners"].append({
-                        "source": f"gacha:{banner['bannerId']}",
-                        "field": "prerequisiteBannerId",
-                        "missing_id": ref
-                    })
-
-        # 企業の参照チェック
-        for company in self.get_all("companies"):
-            if ref := company.get("unlockKeyItemId"):
-                if ref not in item_ids:
-                    errors["missing_items"].append({
-                        "source": f"company:{company['id']}",
-                        "field": "unlockKeyItemId",
-                        "missing_id": ref
-                    })
-
-        # ゲームイベントの参照チェック
-        for event in self.get_all("game_events"):
-            if ref := event.get("prerequisiteEventId"):
-                if ref not in event_ids:
-                    errors["missing_events"].append({
-                        "source": f"event:{event['eventId']}",
-                        "field": "prerequisiteEventId",
-                        "missing_id": ref
-                    })
-            for reward in event.get("rewardItems", []):
-                if reward.get("itemId") not in item_ids:
-                    errors["missing_items"].append({
-                        "source": f"event:{event['eventId']}",
-                        "field": "rewardItems",
-                        "missing_id": reward.get("itemId")
-                    })
-
+    def _maintained_index(self, name: str, factory: Callable[[Dict[str, str]], MaintainedIndex]) -> MaintainedIndex:
+        """全データから一度だけ構築し、以降は変更イベントで差分更新するインデックスを取得"""
+        index = self._maintained.get(name)
+        if index is None:
+            with self._maintained_lock:
+                index = self._maintained.get(name)
+                if index is None:
+                    # 構築中に変更が入らないよう全タイプの読み込みロックを取る
+                    with self._read_locked(*DATA_FILES):
+                        index = factory({t: self._get_id_field(t) for t in DATA_FILES})
+                        for data_type in DATA_FILES:
+                            index.load(data_type, self._cache[data_type])
+                        self.subscribe(index.apply)
+                    self._maintained[name] = index
+        return index
+
+    def _reference_index(self) -> ReferenceIndex:
+        """参照インデックス (正引き・逆引き・未解決参照)"""
+        return self._maintained_index("references", ReferenceIndex)
+
+    def _prepare_reference_check(self, references: str) -> None:
+        """参照チェックモードを検証 (書き込みロックを取る前に呼ぶ)"""
+        if references not in REFERENCE_MODES:
+            raise ValueError(f"Invalid references mode: {references}")
+        if references == "reject":
+            self._reference_index()
+
+    def find_dangling_references(
+        self, data_type: str, records: List[Dict] = (), removed_ids: List[str] = ()
+    ) -> List[Dict]:
+        """変更によって生じる未解決参照を取得
+
+        records: 作成・更新するレコード (参照先が存在するか)
+        removed_ids: 削除・改名で無くなるID (参照しているレコードが残るか)
+        """
+        index = self._reference_index()
+        id_field = self._get_id_field(data_type)
+        batch_ids = {record.get(id_field) for record in records}
+        removed = set(removed_ids) - batch_ids
+        prefix = NODE_PREFIXES[data_type]
+
+        errors = []
+        for record in records:
+            for ref, target_id in iter_references(data_type, record):
+                if ref.target == data_type and target_id in batch_ids:
+                    continue
+                if (ref.target == data_type and target_id in removed) or not index.exists(ref.target, target_id):
+                    errors.append({"source": f"{prefix}:{record.get(id_field)}", "field": ref.field, "missing_id": target_id})
+        for item_id in sorted(removed):
+            for source, source_id, field, count in index.inbound(data_type, item_id):
+                if source == data_type and (source_id in removed or source_id in batch_ids):
+                    # 自身 (置き換え・削除されるレコード) からの参照は数えない
+                    continue
+                errors.extend(
+                    {"source": f"{NODE_PREFIXES[source]}:{source_id}", "field": field, "missing_id": item_id}
+                    for _ in range(count)
+                )
         return errors
 
+    def _reject_dangling(self, data_type: str, records: List[Dict] = (), removed_ids: List[str] = ()) -> None:
+        errors = self.find_dangling_references(data_type, records, removed_ids)
+        if errors:
+            raise DanglingReferenceError(errors)
+
+    # ========================================
+    # 被参照の確認 & カスケード改名・削除
+    # ========================================
+
+    def get_inbound_references(self, data_type: str, item_id: str) -> List[Dict]:
+        """レコードを参照しているレコードとフィールドの一覧"""
+        self._get_file_path(data_type)
+        return [
+            {"type": source, "id": source_id, "field": field, "count": count}
+            for source, source_id, field, count in sorted(self._reference_index().inbound(data_type, item_id))
+        ]
+
+    def rename_cascade(self, data_type: str, item_id: str, new_id: str) -> Dict[str, int]:
+        """IDを変更し、参照している全レコードを新しいIDに付け替える (タイプごとに1回書き込み)"""
+        if not new_id:
+            raise ValueError("New ID is required")
+        return self._cascade(data_type, item_id, new_id)
+
+    def delete_cascade(self, data_type: str, item_id: str) -> Dict[str, int]:
+        """レコードを削除し、参照している全レコードから参照を取り除く (タイプごとに1回書き込み)"""
+        return self._cascade(data_type, item_id, None)
+
+    def _cascade(self, data_type: str, item_id: str, new_id: Optional[str]) -> Dict[str, int]:
+        """カスケード改名・削除の本体 (関係する全タイプを書き込みロックして反映)
+
+        戻り値: 付け替えたレコード数 (データタイプごと)
+        """
+        self._get_file_path(data_type)
+        index = self._reference_index()
+        while True:
+            sources = {source for source, _, _, _ in index.inbound(data_type, item_id)}
+            with self._write_locked(data_type, *sources):
+                inbound = index.inbound(data_type, item_id)
+                if not {source for source, _, _, _ in inbound} <= sources | {data_type}:
+                    # ロック待ちの間に別タイプからの参照が増えた → ロックを取り直す
+                    continue
+                return self._apply_cascade(data_type, item_id, new_id, inbound)
+
+    def _apply_cascade(
+        self, data_type: str, item_id: str, new_id: Optional[str], inbound: List[Tuple[str, str, str, int]]
+    ) -> Dict[str, int]:
+        pos = self._index[data_type].get(item_id)
+        if pos is None:
+            raise RecordNotFoundError(item_id)
+        if new_id is not None and new_id != item_id and new_id in self._index[data_type]:
+            raise ValueError(f"Duplicate ID: {new_id}")
+
+        # 参照元レコードを書き換えて検証 (必須の参照フィールドは削除で空にできない)
+        rewritten: Dict[str, Dict[str, Dict]] = {}
+        errors = []
+        for source, source_id in sorted({(source, source_id) for source, source_id, _, _ in inbound}):
+            if source == data_type and source_id == item_id:
+                continue
+            record = copy.deepcopy(self._cache[source][self._index[source][source_id]])
+            for ref in REFERENCES_BY_SOURCE[source]:
+                if ref.target == data_type:
+                    rewrite_references(record, ref, item_id, new_id)
+            validated, record_errors = self.validate_record(source, record)
+            if record_errors:
+                errors.append({"type": source, "id": source_id, "errors": record_errors})
+            else:
+                rewritten.setdefault(source, {})[source_id] = validated
+        if errors:
+            raise BulkValidationError(errors)
+
+        changes: Dict[str, List[Dict]] = {}
+        for source, records in rewritten.items():
+            id_field = self._get_id_field(source)
+            for source_id, record in records.items():
+                self._cache[source][self._index[source][source_id]] = record
+                changes.setdefault(source, []).append(_put(record, id_field))
+
+        id_field = self._get_id_field(data_type)
+        if new_id is None:
+            self._remove_at(data_type, pos)
+            changes.setdefault(data_type, []).append({"op": "del", "id": item_id})
+        else:
+            record = copy.deepcopy(self._cache[data_type][pos])
+            record[id_field] = new_id
+            # 自己参照も付け替える
+            for ref in REFERENCES_BY_SOURCE.get(data_type, []):
+                if ref.target == data_type:
+                    rewrite_references(record, ref, item_id, new_id)
+            self._cache[data_type][pos] = record
+            del self._index[data_type][item_id]
+            self._index[data_type][new_id] = pos
+            changes.setdefault(data_type, []).append(_put(record, id_field, prev=item_id))
+
+        for source, type_changes in changes.items():
+            self._save_json(source, type_changes, "cascade")
+        return {source: len(records) for source, records in rewritten.items()}
+
+    # ========================================
+    # 全文検索
+    # ========================================
+
+    def search(self, query: str, data_types: Optional[List[str]] = None, limit: int = 20) -> List[Dict]:
+        """名前・説明文・IDを全データタイプ横断で検索 (スコア順)"""
+        for data_type in data_types or []:
+            self._get_file_path(data_type)
+        return self._maintained_index("search", SearchIndex).search(query, data_types, limit)
+
+    # ========================================
+    # 前提チェーン分析
+    # ========================================
+
+    def get_prerequisite_analysis(self) -> Dict[str, Any]:
+        """前提条件チェーンの循環・深さ・解放順を取得 (リビジョンが変わったときだけ再計算)"""
+        data_types = list(PREREQUISITE_FIELDS)
+        for data_type in data_types:
+            self._ensure_loaded(data_type)
+        revisions = tuple(self.get_revision(t) for t in data_types)
+        cached = self._prerequisites
+        if cached is None or cached[0] != revisions:
+            result = analyze(
+                {t: self.get_all(t) for t in data_types},
+                {t: self._get_id_field(t) for t in data_types},
+            )
+            cached = self._prerequisites = (revisions, result)
+        return cached[1]
+
     # ========================================
     # 依存関係グラフ
     # ========================================
 
     def get_dependency_graph(self) -> Dict[str, Any]:
-        """依存関係グラフを生成"""
-        nodes = []
-        edges = []
-
-        # ノード追加
-        for item in self.get_all("items"):
-            nodes.append({"id": f"item:{item['id']}", "type": "item", "label": item.get("displayName", item["id"])})
-        for upgrade in self.get_all("upgrades"):
-            nodes.append({"id": f"upgrade:{upgrade['id']}", "type": "upgrade", "label": upgrade.get("displayName", upgrade["id"])})
-        for banner in self.get_all("gacha_banners"):
-            nodes.append({"id": f"gacha:{banner['bannerId']}", "type": "gacha", "label": banner.get("bannerName", banner["bannerId"])})
-        for company in self.get_all("companies"):
-            nodes.append({"id": f"company:{company['id']}", "type": "company", "label": company.get("displayName", company["id"])})
-        for event in self.get_all("game_events"):
-            nodes.append({"id": f"event:{event['eventId']}", "type": "event", "label": event.get("eventName", event["eventId"])})
-
-        # エッジ追加
-        for upgrade in self.get_all("upgrades"):
-            if ref := upgrade.get("requiredUnlockItemId"):
-                edges.append({"from": f"upgrade:{upgrade['id']}", "to": f"item:{ref}", "type": "unlock"})
-            if ref := upgrade.get("prerequisiteUpgradeId"):
-                edges.append({"from": f"upgrade:{upgrade['id']}", "to": f"upgrade:{ref}", "type": "prerequisite"})
-            for mat in upgrade.get("requiredMaterials", []):
-                edges.append({"from": f"upgrade:{upgrade['id']}", "to": f"item:{mat['itemId']}", "type": "material"})
-
-        for banner in self.get_all("gacha_banners"):
-            for entry in banner.get("pool", []):
-                edges.append({"from": f"gacha:{banner['bannerId']}", "to": f"item:{entry['itemId']}", "type": "contains"})
-
-        for company in self.get_all("companies"):
-            if ref := company.get("unlockKeyItemId"):
-                edges.append({"from": f"company:{company['id']}", "to": f"item:{ref}", "type": "unlock"})
-
-        for event in self.get_all("game_events"):
-            if ref := event.get("prerequisiteEventId"):
-                edges.append({"from": f"event:{event['eventId']}", "to": f"event:{ref}", "type": "prerequisite"})
-            for reward in event.get("rewardItems", []):
-                edges.append({"from": f"event:{event['eventId']}", "to": f"item:{reward['itemId']}", "type": "reward"})
-
-        return {"nodes": nodes, "edges": edges}
+        """依存関係グラフ全体を取得 (隣接リストは変更のたびに差分更新)"""
+        return self._maintained_index("graph", DependencyGraph).full()
+
+    def get_graph_neighborhood(
+        self,
+        node: str,
+        depth: int = 1,
+        edge_types: Optional[List[str]] = None,
+        direction: str = "both",
+        limit: int = 500,
+    ) -> Optional[Dict[str, Any]]:
+        """ノード ("item:xxx" など) からdepthホップ以内の部分グラフを取得 (ノードが無ければNone)"""
+        for edge_type in edge_types or []:
+            if edge_type not in EDGE_TYPES:
+                raise ValueError(f"Unknown edge type: {edge_type}")
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Invalid direction: {direction}")
+        graph = self._maintained_index("graph", DependencyGraph)
+        if not graph.has_node(node):
+            return None
+        return graph.neighborhood(node, depth, edge_types, direction, limit)
+
+
+def _put(record: Dict, id_field: str, prev: Optional[str] = None) -> Dict:
+    """ストレージ用のput変更レコードを作成"""
+    change = {"op": "put", "id": record.get(id_field), "data": record}
+    if prev is not None and prev != change["id"]:
+        change["prev"] = prev
+    return change
 
 
 # シングルトンインスタンス
@@ -0,0 +1,123 @@
+"""変更通知ブローカー - データ変更をServer-Sent Eventsで配信"""
+import asyncio
+import json
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+# クライアントごとに保持する未送信イベントの上限 (超えたらタイプ単位の再取得通知にまとめる)
+MAX_PENDING_EVENTS = 256
+# 連続した変更をまとめる待ち時間 (秒)
+COALESCE_WINDOW = 0.05
+# 接続維持用コメントの送信間隔 (秒)
+KEEPALIVE_INTERVAL = 15.0
+
+
+def compact_event(event: Dict) -> Dict:
+    """DataServiceの変更イベントを配信用の小さな形式に変換"""
+    ids = event["ids"]
+    compact = {
+        "type": event["type"],
+        "op": event["op"],
+        "revision": event["revision"],
+        "seq": event["seq"],
+    }
+    if len(ids) == 1 and not event["reset"]:
+        compact["id"] = ids[0]
+    else:
+        compact["count"] = len(ids)
+    return compact
+
+
+class _Subscriber:
+    """1クライアント分の送信待ちキュー (同じレコードへの変更は最新だけ残す)"""
+
+    def __init__(self):
+        self.pending: Dict[Tuple[str, Optional[str]], Dict] = {}
+        self.wakeup = asyncio.Event()
+
+    def push(self, event: Dict) -> None:
+        key = (event["type"], event.get("id"))
+        self.pending.pop(key, None)
+        self.pending[key] = event
+        if len(self.pending) > MAX_PENDING_EVENTS:
+            self._collapse()
+        self.wakeup.set()
+
+    def _collapse(self) -> None:
+        """溜まりすぎたイベントをデータタイプごとの再取得通知1件にまとめる"""
+        latest: Dict[str, Dict] = {}
+        for event in self.pending.values():
+            latest[event["type"]] = event
+        self.pending = {
+            (data_type, None): {
+                "type": data_type,
+                "op": "resync",
+                "revision": event["revision"],
+                "seq": event["seq"],
+            }
+            for data_type, event in latest.items()
+        }
+
+    def drain(self) -> List[Dict]:
+        events = list(self.pending.values())
+        self.pending.clear()
+        self.wakeup.clear()
+        return events
+
+
+class EventBroker:
+    """DataServiceの変更イベントを購読中の全クライアントに配信する"""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers: Set[_Subscriber] = set()
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        """配信に使うイベントループを設定 (起動時に呼ぶ)"""
+        self._loop = loop
+
+    def publish(self, event: Dict) -> None:
+        """変更イベントを配信 (任意のスレッドから呼び出し可)"""
+        if self._loop is None or not self._subscribers:
+            return
+        compact = compact_event(event)
+        try:
+            self._loop.call_soon_threadsafe(self._dispatch, compact)
+        except RuntimeError:
+            # ループ終了後
+            pass
+
+    def _dispatch(self, event: Dict) -> None:
+        for subscriber in self._subscribers:
+            subscriber.push(event)
+
+    async def stream(self) -> AsyncIterator[str]:
+        """SSE形式のメッセージを生成 (切断されるまで続く)"""
+        subscriber = _Subscriber()
+        self._subscribers.add(subscriber)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    await asyncio.wait_for(subscriber.wakeup.wait(), KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                # 短時間に続く変更をまとめて送る
+                await asyncio.sleep(COALESCE_WINDOW)
+                for event in subscriber.drain():
+                    name = "resync" if event["op"] == "resync" else "mutation"
+                    yield f"event: {name}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            self._subscribers.discard(subscriber)
+
+
+# シングルトンインスタンス
+_broker: Optional[EventBroker] = None
+
+
+def get_event_broker() -> EventBroker:
+    """変更通知ブローカーのシングルトンを取得"""
+    global _broker
+    if _broker is None:
+        _broker = EventBroker()
+    return _broker
@@ -0,0 +1,107 @@
+"""ストリーミングエクスポート - NDJSONと正規JSONファイル一式のzip"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import zipfile
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .data_service import DATA_FILES, DataService, get_data_service
+from .serialization import dumps
+
+# NDJSONの1回の送信量の目安 (バイト)
+CHUNK_SIZE = 64 * 1024
+# zipアーカイブの保存先 (データフォルダ内)
+EXPORT_DIR_NAME = "exports"
+
+
+def iter_ndjson(service: DataService, data_types: Iterable[str]) -> Iterator[bytes]:
+    """1行1レコードの {"type": ..., "data": ...} を順に生成"""
+    buffer: List[bytes] = []
+    size = 0
+    for data_type in data_types:
+        for record in service.get_all(data_type):
+            line = dumps({"type": data_type, "data": record}) + b"\n"
+            buffer.append(line)
+            size += len(line)
+            if size >= CHUNK_SIZE:
+                yield b"".join(buffer)
+                buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def iter_json_array(records: Iterable[Dict]) -> Iterator[str]:
+    """json.dump(records, indent=2) と同じ形式の文字列をレコード単位で生成"""
+    first = True
+    for record in records:
+        body = json.dumps(record, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+        yield ("[\n  " if first else ",\n  ") + body
+        first = False
+    yield "[]" if first else "\n]"
+
+
+def write_zip(service: DataService, data_types: Iterable[str], dest: Path) -> None:
+    """データタイプごとの正規JSONファイルをzipに書き出す (レコード単位で書き込む)"""
+    with zipfile.ZipFile(dest, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for data_type in data_types:
+            with zf.open(DATA_FILES[data_type], "w") as entry:
+                for text in iter_json_array(service.get_all(data_type)):
+                    entry.write(text.encode("utf-8"))
+
+
+class ExportArchives:
+    """リビジョンごとのzipアーカイブをディスクに保持 (Range/再開ダウンロード用)"""
+
+    def __init__(self, service: DataService):
+        self.service = service
+        self.export_dir = service.data_dir / EXPORT_DIR_NAME
+        self._lock = threading.Lock()
+
+    def _key(self, data_types: List[str]) -> str:
+        parts = [self.service.instance_id] + [f"{t}:{self.service.get_revision(t)}" for t in data_types]
+        return hashlib.blake2b("|".join(parts).encode("utf-8"), digest_size=12).hexdigest()
+
+    def get(self, data_types: List[str]) -> Path:
+        """現在のリビジョンのアーカイブを取得 (無ければ作成し、古いものは削除)"""
+        for data_type in data_types:
+            self.service._ensure_loaded(data_type)
+        with self._lock:
+            path = self.export_dir / f"game_data_{self._key(data_types)}.zip"
+            if path.exists():
+                return path
+            self.export_dir.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=self.export_dir, prefix=".export.", suffix=".tmp")
+            os.close(fd)
+            try:
+                write_zip(self.service, data_types, Path(tmp_name))
+                os.replace(tmp_name, path)
+            except BaseException:
+                if os.path.exists(tmp_name):
+                    os.unlink(tmp_name)
+                raise
+            self._remove_stale(path)
+            return path
+
+    def _remove_stale(self, keep: Path) -> None:
+        for old in self.export_dir.glob("game_data_*.zip"):
+            if old != keep:
+                try:
+                    old.unlink()
+                except OSError:
+                    # 配信中などで削除できなければ次回に回す
+                    pass
+
+
+# シングルトンインスタンス
+_archives: Optional[ExportArchives] = None
+
+
+def get_export_archives() -> ExportArchives:
+    """エクスポートアーカイブのシングルトンを取得"""
+    global _archives
+    if _archives is None:
+        _archives = ExportArchives(get_data_service())
+    return _archives
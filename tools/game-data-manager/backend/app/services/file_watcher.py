@@ -0,0 +1,64 @@
+"""データファイル監視 - Unityなど外部からの書き込みをキャッシュに反映"""
+import logging
+import threading
+from typing import Optional
+
+from .storage import file_hash, file_signature
+
+logger = logging.getLogger(__name__)
+
+
+class DataFileWatcher:
+    """データファイルをポーリングし、変更されたタイプだけを再読み込みする
+
+    mtime + サイズで変更を検出し、内容ハッシュがサービスが最後に読み書きした内容と
+    異なる場合のみ再読み込みする。
+    サービス自身の書き込みはストレージが記録したシグネチャと一致するため無視される。
+    """
+
+    def __init__(self, service, interval: float = 1.0):
+        self.service = service
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="data-file-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("data file watcher failed")
+
+    def poll(self) -> None:
+        """全データタイプを1回チェック"""
+        storage = self.service._storage
+        for data_type in storage.data_files:
+            # 未読み込みのタイプは次回アクセス時に読まれるので対象外
+            if not self.service.is_loaded(data_type):
+                continue
+
+            file_path = storage.file_path(data_type)
+            signature = file_signature(file_path)
+            if signature == storage.signatures.get(data_type):
+                continue
+
+            digest = file_hash(file_path)
+            if digest is not None and digest == storage.hashes.get(data_type):
+                # touchされただけで内容は最後に読み書きしたものと同じ
+                storage.signatures[data_type] = signature
+                continue
+
+            logger.info("reloading %s (changed on disk)", data_type)
+            self.service.reload(data_type)
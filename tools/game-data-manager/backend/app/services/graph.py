@@ -0,0 +1,152 @@
+"""依存関係グラフ - 変更のたびに更新する隣接リストと部分グラフの探索"""
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from .maintained_index import MaintainedIndex
+from .references import NODE_PREFIXES, iter_references
+
+# グラフのノードにするデータタイプ -> ラベルに使うフィールド (並びはノード一覧の順)
+GRAPH_NODE_LABELS: Dict[str, str] = {
+    "items": "displayName",
+    "upgrades": "displayName",
+    "gacha_banners": "bannerName",
+    "companies": "displayName",
+    "game_events": "eventName",
+}
+
+# (参照元データタイプ, 参照フィールド) -> エッジの種類
+GRAPH_EDGE_TYPES: Dict[Tuple[str, str], str] = {
+    ("upgrades", "requiredUnlockItemId"): "unlock",
+    ("upgrades", "prerequisiteUpgradeId"): "prerequisite",
+    ("upgrades", "requiredMaterials"): "material",
+    ("gacha_banners", "pool"): "contains",
+    ("companies", "unlockKeyItemId"): "unlock",
+    ("game_events", "prerequisiteEventId"): "prerequisite",
+    ("game_events", "rewardItems"): "reward",
+}
+
+EDGE_TYPES = sorted(set(GRAPH_EDGE_TYPES.values()))
+DIRECTIONS = ("out", "in", "both")
+
+# 種類ごとのノード接頭辞 -> 並び順
+_NODE_ORDER = {NODE_PREFIXES[data_type]: i for i, data_type in enumerate(GRAPH_NODE_LABELS)}
+
+
+class DependencyGraph(MaintainedIndex):
+    """ノードと隣接リスト (出辺・入辺) を保持する依存関係グラフ"""
+
+    def __init__(self, id_fields: Dict[str, str]):
+        super().__init__(id_fields)
+        self._nodes: Dict[str, Dict] = {}
+        # ノード -> [(接続先ノード, エッジの種類)] (同じ参照が複数あればその数だけ)
+        self._out: Dict[str, List[Tuple[str, str]]] = {}
+        # ノード -> {(接続元ノード, エッジの種類): 本数}
+        self._in: Dict[str, Dict[Tuple[str, str], int]] = {}
+        self._full: Optional[Tuple[int, Dict[str, Any]]] = None
+
+    def _add(self, data_type: str, item_id: str, record: Dict) -> None:
+        label_field = GRAPH_NODE_LABELS.get(data_type)
+        if label_field is None:
+            return
+        node = f"{NODE_PREFIXES[data_type]}:{item_id}"
+        self._nodes[node] = {"id": node, "type": NODE_PREFIXES[data_type], "label": record.get(label_field, item_id)}
+        edges = []
+        for ref, target_id in iter_references(data_type, record):
+            edge_type = GRAPH_EDGE_TYPES.get((data_type, ref.field))
+            if edge_type is None:
+                continue
+            target = f"{NODE_PREFIXES[ref.target]}:{target_id}"
+            edges.append((target, edge_type))
+            inbound = self._in.setdefault(target, {})
+            inbound[(node, edge_type)] = inbound.get((node, edge_type), 0) + 1
+        if edges:
+            self._out[node] = edges
+
+    def _remove(self, data_type: str, item_id: str) -> None:
+        if data_type not in GRAPH_NODE_LABELS:
+            return
+        node = f"{NODE_PREFIXES[data_type]}:{item_id}"
+        self._nodes.pop(node, None)
+        for target, edge_type in self._out.pop(node, ()):
+            inbound = self._in[target]
+            inbound[(node, edge_type)] -= 1
+            if not inbound[(node, edge_type)]:
+                del inbound[(node, edge_type)]
+            if not inbound:
+                del self._in[target]
+
+    # ========================================
+    # 問い合わせ
+    # ========================================
+
+    def full(self) -> Dict[str, Any]:
+        """グラフ全体 (変更が無ければ前回の結果を返す)"""
+        with self._lock:
+            if self._full is not None and self._full[0] == self.version:
+                return self._full[1]
+            nodes = sorted(self._nodes.values(), key=lambda n: _NODE_ORDER[n["type"]])
+            edges = [
+                {"from": node["id"], "to": target, "type": edge_type}
+                for node in nodes
+                for target, edge_type in self._out.get(node["id"], ())
+            ]
+            graph = {"nodes": nodes, "edges": edges}
+            self._full = (self.version, graph)
+            return graph
+
+    def has_node(self, node: str) -> bool:
+        return node in self._nodes or node in self._in
+
+    def neighborhood(
+        self,
+        start: str,
+        depth: int = 1,
+        edge_types: Optional[Iterable[str]] = None,
+        direction: str = "both",
+        limit: int = 500,
+    ) -> Dict[str, Any]:
+        """ノードからdepthホップ以内の部分グラフ (指定した種類のエッジのみたどる)"""
+        allowed = set(edge_types) if edge_types else set(EDGE_TYPES)
+        with self._lock:
+            visited: Dict[str, int] = {start: 0}
+            queue = deque([start])
+            truncated = False
+            while queue:
+                node = queue.popleft()
+                hops = visited[node]
+                if hops >= depth:
+                    continue
+                for neighbor in self._neighbors(node, allowed, direction):
+                    if neighbor in visited:
+                        continue
+                    if len(visited) >= limit:
+                        truncated = True
+                        break
+                    visited[neighbor] = hops + 1
+                    queue.append(neighbor)
+
+            nodes = []
+            for node, hops in visited.items():
+                info = self._nodes.get(node)
+                if info is None:
+                    # 参照されているが存在しないノード
+                    prefix, _, raw_id = node.partition(":")
+                    info = {"id": node, "type": prefix, "label": raw_id, "missing": True}
+                nodes.append({**info, "depth": hops})
+            edges = [
+                {"from": node, "to": target, "type": edge_type}
+                for node in visited
+                for target, edge_type in self._out.get(node, ())
+                if edge_type in allowed and target in visited
+            ]
+        return {"center": start, "nodes": nodes, "edges": edges, "truncated": truncated}
+
+    def _neighbors(self, node: str, allowed: Set[str], direction: str) -> Iterable[str]:
+        if direction in ("out", "both"):
+            for target, edge_type in self._out.get(node, ()):
+                if edge_type in allowed:
+                    yield target
+        if direction in ("in", "both"):
+            for source, edge_type in self._in.get(node, {}):
+                if edge_type in allowed:
+                    yield source
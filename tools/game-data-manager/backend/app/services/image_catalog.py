@@ -0,0 +1,318 @@
+"""画像カタログ - カテゴリごとの画像一覧 (サイズ・縦横・ハッシュ・更新時刻) をメモリに保持"""
+import bisect
+import logging
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .image_store import ImageStore
+
+logger = logging.getLogger(__name__)
+
+# 並び替えに使えるフィールド
+CATALOG_SORT_FIELDS = ("name", "size", "mtime", "width", "height")
+# 何回のポーリングごとにフォルダの更新時刻に関わらず全ファイルを確認するか
+# (上書き保存はフォルダの更新時刻を変えないため)
+FULL_SCAN_EVERY = 30
+# 縦横の読み取りに読むファイル先頭のバイト数
+HEADER_SIZE = 64 * 1024
+
+
+# ========================================
+# 画像の縦横 (ヘッダーのみ読む)
+# ========================================
+
+def image_dimensions(path: Path) -> Optional[Tuple[int, int]]:
+    """PNG / GIF / JPEG / WebP のヘッダーから (幅, 高さ) を読む (読めなければNone)"""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(HEADER_SIZE)
+    except OSError:
+        return None
+    try:
+        if head.startswith(b"\x89PNG\r\n\x1a\n"):
+            return struct.unpack(">II", head[16:24])
+        if head[:6] in (b"GIF87a", b"GIF89a"):
+            return struct.unpack("<HH", head[6:10])
+        if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            return _webp_dimensions(head)
+        if head[:2] == b"\xff\xd8":
+            return _jpeg_dimensions(head)
+    except struct.error:
+        pass
+    return None
+
+
+def _webp_dimensions(head: bytes) -> Optional[Tuple[int, int]]:
+    chunk = head[12:16]
+    if chunk == b"VP8 ":
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        b0, b1, b2, b3 = head[21:25]
+        return 1 + (b0 | (b1 & 0x3F) << 8), 1 + (b1 >> 6 | b2 << 2 | (b3 & 0x0F) << 10)
+    if chunk == b"VP8X":
+        return 1 + int.from_bytes(head[24:27], "little"), 1 + int.from_bytes(head[27:30], "little")
+    return None
+
+
+def _jpeg_dimensions(head: bytes) -> Optional[Tuple[int, int]]:
+    pos = 2
+    while pos + 9 < len(head):
+        if head[pos] != 0xFF:
+            return None
+        marker = head[pos + 1]
+        if marker == 0xFF:
+            # 埋め草
+            pos += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        length = struct.unpack(">H", head[pos + 2:pos + 4])[0]
+        # SOF0〜SOF15 (DHT / JPG / DAC を除く)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", head[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + length
+    return None
+
+
+# ========================================
+# カタログ
+# ========================================
+
+class ImageCatalog:
+    """カテゴリごとの画像情報をメモリに保持し、変更のあったファイルだけ更新する
+
+    各カテゴリは初回アクセス時 (またはウォッチャーの起動時) に os.scandir で一度だけ構築する。
+    """
+
+    def __init__(self, store: ImageStore, categories: Iterable[str], extensions: Iterable[str]):
+        self.store = store
+        self.images_dir = store.images_dir
+        self.categories = list(categories)
+        self.extensions = set(extensions)
+        self._lock = threading.Lock()
+        # カテゴリの構築・再走査を直列化
+        self._scan_locks = {category: threading.Lock() for category in self.categories}
+        # カテゴリ -> 名前 -> 画像情報
+        self._entries: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # カテゴリ -> 名前 -> (inode, サイズ, 更新時刻) (変更判定用)
+        self._stats: Dict[str, Dict[str, Tuple[int, int, int]]] = {}
+        # カテゴリ -> 走査時のフォルダの更新時刻
+        self._dir_mtimes: Dict[str, int] = {}
+        # (カテゴリ, 並び順) -> 並び替え済みの一覧 (カテゴリが変わると破棄)
+        self._sorted: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        # カテゴリ -> 名前順の一覧に対応する小文字化した名前 (前方一致の二分探索用)
+        self._name_keys: Dict[str, List[str]] = {}
+
+    def is_loaded(self, category: str) -> bool:
+        return category in self._entries
+
+    def ensure_loaded(self, category: str) -> None:
+        if category not in self._entries:
+            self.refresh(category)
+
+    # ========================================
+    # 更新
+    # ========================================
+
+    def refresh(self, category: str) -> bool:
+        """カテゴリを走査し、追加・変更・削除されたファイルだけ反映 (変更があればTrue)"""
+        directory = self.images_dir / category
+        with self._scan_locks[category]:
+            try:
+                dir_mtime = directory.stat().st_mtime_ns
+            except FileNotFoundError:
+                dir_mtime = 0
+            previous = self._stats.get(category, {})
+            stats: Dict[str, Tuple[int, int, int]] = {}
+            changed: Dict[str, Dict[str, Any]] = {}
+            if dir_mtime:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if not self._is_image(entry.name) or not entry.is_file():
+                            continue
+                        st = entry.stat()
+                        stat = (st.st_ino, st.st_size, st.st_mtime_ns)
+                        stats[entry.name] = stat
+                        if previous.get(entry.name) != stat:
+                            info = self._read(Path(entry.path), st)
+                            if info is None:
+                                del stats[entry.name]
+                            else:
+                                changed[entry.name] = info
+            removed = previous.keys() - stats.keys()
+
+            with self._lock:
+                loaded = category in self._entries
+                entries = self._entries.setdefault(category, {})
+                for name in removed:
+                    entries.pop(name, None)
+                entries.update(changed)
+                self._stats[category] = stats
+                self._dir_mtimes[category] = dir_mtime
+                if changed or removed or not loaded:
+                    self._invalidate(category)
+        return bool(changed or removed)
+
+    def refresh_file(self, category: str, name: str) -> None:
+        """1ファイルだけ反映 (アップロード・削除の直後に呼ぶ)"""
+        if category not in self._entries:
+            self.refresh(category)
+            return
+        path = self.images_dir / category / name
+        with self._scan_locks[category]:
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                st = None
+            info = self._read(path, st) if st is not None and self._is_image(name) else None
+            with self._lock:
+                entries = self._entries[category]
+                stats = self._stats[category]
+                if info is None:
+                    entries.pop(name, None)
+                    stats.pop(name, None)
+                else:
+                    entries[name] = info
+                    stats[name] = (st.st_ino, st.st_size, st.st_mtime_ns)
+                self._invalidate(category)
+
+    def poll(self, full: bool = False) -> None:
+        """フォルダの更新時刻が変わったカテゴリを再走査 (full=Trueなら全カテゴリ)"""
+        for category in self.categories:
+            if category not in self._entries:
+                continue
+            try:
+                dir_mtime = (self.images_dir / category).stat().st_mtime_ns
+            except FileNotFoundError:
+                dir_mtime = 0
+            if full or dir_mtime != self._dir_mtimes.get(category):
+                self.refresh(category)
+
+    def _is_image(self, name: str) -> bool:
+        return not name.startswith(".") and os.path.splitext(name)[1].lower() in self.extensions
+
+    def _read(self, path: Path, st: os.stat_result) -> Optional[Dict[str, Any]]:
+        try:
+            digest = self.store.digest(path)
+        except FileNotFoundError:
+            return None
+        dimensions = image_dimensions(path)
+        return {
+            "name": path.name,
+            "size": st.st_size,
+            "width": dimensions[0] if dimensions else None,
+            "height": dimensions[1] if dimensions else None,
+            "hash": digest,
+            "mtime": st.st_mtime,
+        }
+
+    def _invalidate(self, category: str) -> None:
+        for key in [key for key in self._sorted if key[0] == category]:
+            del self._sorted[key]
+        self._name_keys.pop(category, None)
+
+    # ========================================
+    # 問い合わせ
+    # ========================================
+
+    def query(
+        self,
+        category: str,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        prefix: Optional[str] = None,
+        sort: str = "name",
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """絞り込み・並び替え・ページングした一覧と、絞り込み後の総件数
+
+        sort: 並び替えるフィールド (先頭に - で降順)。prefixは名前の前方一致 (大文字小文字を区別しない)。
+        """
+        with self._lock:
+            ordered = self._ordered(category, sort)
+            if prefix:
+                key = prefix.casefold()
+                if sort == "name":
+                    # 名前順なら二分探索で範囲を求める
+                    names = self._names(category)
+                    start = bisect.bisect_left(names, key)
+                    end = bisect.bisect_left(names, key + "\U0010ffff")
+                    ordered = ordered[start:end]
+                else:
+                    ordered = [entry for entry in ordered if entry["name"].casefold().startswith(key)]
+        total = len(ordered)
+        end = None if limit is None else offset + limit
+        return ordered[offset:end], total
+
+    def _ordered(self, category: str, sort: str) -> List[Dict[str, Any]]:
+        cached = self._sorted.get((category, sort))
+        if cached is not None:
+            return cached
+        field = sort.lstrip("-")
+        if field not in CATALOG_SORT_FIELDS:
+            raise ValueError(f"Invalid sort field: {field}")
+        entries = self._entries.get(category, {}).values()
+        if field == "name":
+            ordered = sorted(entries, key=lambda e: (e["name"].casefold(), e["name"]), reverse=sort.startswith("-"))
+        else:
+            # 値が無いもの (縦横が読めない画像) は常に最後
+            present = [e for e in entries if e[field] is not None]
+            missing = [e for e in entries if e[field] is None]
+            present.sort(key=lambda e: (e[field], e["name"].casefold()), reverse=sort.startswith("-"))
+            missing.sort(key=lambda e: e["name"].casefold())
+            ordered = present + missing
+        self._sorted[(category, sort)] = ordered
+        return ordered
+
+    def _names(self, category: str) -> List[str]:
+        names = self._name_keys.get(category)
+        if names is None:
+            names = [entry["name"].casefold() for entry in self._ordered(category, "name")]
+            self._name_keys[category] = names
+        return names
+
+
+class ImageCatalogWatcher:
+    """画像フォルダをポーリングし、外部で追加・変更・削除された画像をカタログに反映する
+
+    起動直後に全カテゴリを構築し、以降はフォルダの更新時刻が変わったカテゴリだけ再走査する。
+    """
+
+    def __init__(self, catalog: ImageCatalog, interval: float = 2.0):
+        self.catalog = catalog
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="image-catalog-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        for category in self.catalog.categories:
+            if self._stop.is_set():
+                return
+            try:
+                self.catalog.ensure_loaded(category)
+            except Exception:
+                logger.exception("image catalog failed to load %s", category)
+        polls = 0
+        while not self._stop.wait(self.interval):
+            polls += 1
+            try:
+                self.catalog.poll(full=polls % FULL_SCAN_EVERY == 0)
+            except Exception:
+                logger.exception("image catalog watcher failed")
@@ -0,0 +1,260 @@
+"""画像ストア - 内容ハッシュで1度だけ保存し、カテゴリ内のファイル名はハードリンクの別名にする"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+# アップロードの最大サイズ (バイト)
+MAX_UPLOAD_SIZE = int(os.environ.get("GAME_DATA_MAX_IMAGE_SIZE", str(20 * 1024 * 1024)))
+# 読み書きの単位
+CHUNK_SIZE = 1024 * 1024
+# 実体の保存先 (画像フォルダ内)
+BLOB_DIR_NAME = ".blobs"
+# 同名で内容が異なる場合に付けるハッシュの長さ
+NAME_HASH_LENGTH = 8
+# ハッシュを覚えておくファイル数 (超えたら使われていない順に忘れる)
+DIGEST_CACHE_SIZE = int(os.environ.get("GAME_DATA_DIGEST_CACHE_SIZE", "10000"))
+
+
+class ImageTooLargeError(ValueError):
+    """アップロードが上限サイズを超えた"""
+
+    def __init__(self, limit: int):
+        super().__init__(f"Image exceeds the maximum size of {limit} bytes")
+        self.limit = limit
+
+
+def new_hasher():
+    return hashlib.blake2b(digest_size=16)
+
+
+def hash_file(path: Path) -> str:
+    """ファイル内容のハッシュ"""
+    digest = new_hasher()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadWriter:
+    """アップロードを一時ファイルに書きながらサイズとハッシュを数える
+
+    上限を超えた時点で ImageTooLargeError を送出するので、残りを受信・保存しない。
+    """
+
+    def __init__(self, directory: Path, max_size: int):
+        fd, tmp_name = tempfile.mkstemp(dir=directory, prefix=".upload-", suffix=".tmp")
+        self.path = Path(tmp_name)
+        self.max_size = max_size
+        self.size = 0
+        self._file = os.fdopen(fd, "wb")
+        self._hasher = new_hasher()
+
+    def write(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            raise ImageTooLargeError(self.max_size)
+        self._hasher.update(chunk)
+        self._file.write(chunk)
+
+    def hexdigest(self) -> str:
+        return self._hasher.hexdigest()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def discard(self) -> None:
+        """一時ファイルを削除 (登録済みなら何もしない)"""
+        self._file.close()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class ImageStore:
+    """内容ハッシュで重複排除する画像ストア
+
+    実体は .blobs/<ハッシュ先頭2文字>/<ハッシュ> に1つだけ置き、
+    <category>/<ファイル名> はそのハードリンク (リンクできないファイルシステムではコピー) にする。
+    """
+
+    def __init__(self, images_dir: Path, digest_cache_size: int = DIGEST_CACHE_SIZE):
+        self.images_dir = images_dir
+        self.blob_dir = images_dir / BLOB_DIR_NAME
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        # 別名の作成・削除を直列化 (同名の競合判定のため)
+        self._lock = threading.Lock()
+        # (デバイス, inode, サイズ, 更新時刻) -> ハッシュ (別名は実体とinodeを共有するので使い回せる, 古い順)
+        self._digests: "OrderedDict[Tuple[int, int, int, int], str]" = OrderedDict()
+        self._digest_cache_size = digest_cache_size
+        self._digest_lock = threading.Lock()
+
+    def blob_path(self, digest: str) -> Path:
+        return self.blob_dir / digest[:2] / digest
+
+    def digest(self, path: Path) -> str:
+        """ファイルのハッシュ (内容が変わっていなければ前回の結果を使う)"""
+        st = path.stat()
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        with self._digest_lock:
+            digest = self._digests.get(key)
+            if digest is not None:
+                self._digests.move_to_end(key)
+                return digest
+        digest = hash_file(path)
+        with self._digest_lock:
+            self._digests[key] = digest
+            while len(self._digests) > self._digest_cache_size:
+                self._digests.popitem(last=False)
+        return digest
+
+    def _forget_digest(self, path: Path) -> None:
+        """削除・置き換えるファイルのハッシュを忘れる (inodeは再利用されうる)"""
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return
+        if st.st_nlink > 1:
+            # 実体や他の別名と共有しているので残す
+            return
+        with self._digest_lock:
+            self._digests.pop((st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns), None)
+
+    # ========================================
+    # 保存
+    # ========================================
+
+    def begin_upload(self, max_size: int = MAX_UPLOAD_SIZE) -> "UploadWriter":
+        """受信しながら書き込む一時ファイルを用意 (commit_upload か discard で終える)"""
+        return UploadWriter(self.blob_dir, max_size)
+
+    def commit_upload(self, category: str, name: str, writer: "UploadWriter") -> Dict:
+        """書き終えたアップロードを <category>/<name> として登録
+
+        同名のファイルがあり内容も同じならそれを返し、内容が異なれば
+        名前にハッシュを付ける (連番を探さないので衝突しても1回で決まる)。
+        """
+        try:
+            writer.close()
+            digest = writer.hexdigest()
+            with self._lock:
+                stored = self._store_blob(writer.path, digest)
+                path, existed = self._link_unique(self.images_dir / category / name, digest)
+        finally:
+            writer.discard()
+        return {"name": path.name, "size": writer.size, "hash": digest, "deduplicated": existed or not stored}
+
+    def save_file(self, category: str, name: str, src: Path, digest: Optional[str] = None) -> Path:
+        """ファイルを取り込み、<category>/<name> を置き換える (Unity同期用)"""
+        digest = digest or hash_file(src)
+        dest = self.images_dir / category / name
+        fd, tmp_name = tempfile.mkstemp(dir=self.blob_dir, prefix=".import-", suffix=".tmp")
+        os.close(fd)
+        try:
+            if not self.blob_path(digest).exists():
+                shutil.copyfile(src, tmp_name)
+            with self._lock:
+                if not self.blob_path(digest).exists():
+                    self._store_blob(Path(tmp_name), digest)
+                self._replace_link(dest, digest)
+        finally:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+        return dest
+
+    def _store_blob(self, tmp: Path, digest: str) -> bool:
+        """一時ファイルを実体として登録 (既に同じ内容があれば何もしない)"""
+        blob = self.blob_path(digest)
+        if blob.exists():
+            return False
+        blob.parent.mkdir(exist_ok=True)
+        os.replace(tmp, blob)
+        return True
+
+    def _link_unique(self, dest: Path, digest: str) -> Tuple[Path, bool]:
+        """dest (同名で内容が異なれば名前にハッシュを付けたもの) に別名を作る
+
+        戻り値: (別名のパス, 同じ内容の別名が既にあったか)
+        """
+        candidates = (dest, dest.with_name(f"{dest.stem}_{digest[:NAME_HASH_LENGTH]}{dest.suffix}"),
+                      dest.with_name(f"{dest.stem}_{digest}{dest.suffix}"))
+        for candidate in candidates:
+            try:
+                self._link(self.blob_path(digest), candidate)
+                return candidate, False
+            except FileExistsError:
+                if self._same_content(candidate, digest):
+                    return candidate, True
+        raise FileExistsError(f"Could not find a free name for {dest.name}")
+
+    def _replace_link(self, dest: Path, digest: str) -> None:
+        """別名を差し替え (一時名でリンクしてから置き換えるので途中の状態を見せない)"""
+        if dest.exists() and self._same_content(dest, digest):
+            return
+        tmp = dest.with_name(f".{dest.name}.{digest[:NAME_HASH_LENGTH]}.tmp")
+        if tmp.exists():
+            tmp.unlink()
+        self._link(self.blob_path(digest), tmp)
+        old = self._blob_of(dest)
+        self._forget_digest(dest)
+        os.replace(tmp, dest)
+        if old is not None:
+            self._collect(old)
+
+    @staticmethod
+    def _link(blob: Path, dest: Path) -> None:
+        if dest.exists():
+            raise FileExistsError(dest)
+        try:
+            os.link(blob, dest)
+        except FileExistsError:
+            raise
+        except OSError:
+            # ハードリンクできない場合はコピー (重複排除はされない)
+            with open(blob, "rb") as src, open(dest, "xb") as out:
+                shutil.copyfileobj(src, out, CHUNK_SIZE)
+
+    def _same_content(self, path: Path, digest: str) -> bool:
+        try:
+            if path.samefile(self.blob_path(digest)):
+                return True
+            return self.digest(path) == digest
+        except FileNotFoundError:
+            return False
+
+    # ========================================
+    # 削除
+    # ========================================
+
+    def remove(self, category: str, name: str) -> None:
+        """別名を削除し、どこからも使われなくなった実体も削除"""
+        path = self.images_dir / category / name
+        with self._lock:
+            blob = self._blob_of(path)
+            self._forget_digest(path)
+            path.unlink()
+            if blob is not None:
+                self._collect(blob)
+
+    def _blob_of(self, path: Path) -> Optional[Path]:
+        """別名に対応する実体 (ストア外で置かれたファイルならNone)"""
+        try:
+            blob = self.blob_path(self.digest(path))
+            return blob if blob.exists() and path.samefile(blob) else None
+        except FileNotFoundError:
+            return None
+
+    def _collect(self, blob: Path) -> None:
+        """別名が残っていない実体を削除"""
+        try:
+            if blob.stat().st_nlink <= 1:
+                self._forget_digest(blob)
+                blob.unlink()
+        except FileNotFoundError:
+            pass
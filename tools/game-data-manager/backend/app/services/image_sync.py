@@ -0,0 +1,138 @@
+"""Unity画像同期 - マニフェストによる差分コピー"""
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from .image_store import ImageStore, hash_file
+
+# 並列コピーのワーカー数
+SYNC_WORKERS = int(os.environ.get("GAME_DATA_SYNC_WORKERS", "4"))
+# マニフェストの保存先 (画像フォルダ内)
+MANIFEST_DIR_NAME = ".sync"
+
+
+class ImageSync:
+    """カテゴリごとのマニフェスト (名前 -> サイズ, 更新時刻, ハッシュ) を使って変更分だけコピーする
+
+    コピーは画像ストア経由なので、同じ内容のアイコンは実体を共有する。
+    """
+
+    def __init__(self, store: ImageStore, extensions: Iterable[str]):
+        self.store = store
+        self.images_dir = store.images_dir
+        self.extensions = set(extensions)
+        self.manifest_dir = self.images_dir / MANIFEST_DIR_NAME
+        # 同期の同時実行を防ぐ (マニフェストの読み書きが競合するため)
+        self._lock = threading.Lock()
+
+    def _manifest_path(self, category: str) -> Path:
+        return self.manifest_dir / f"{category}.json"
+
+    def _load_manifest(self, category: str) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self._manifest_path(category), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_manifest(self, category: str, manifest: Dict[str, Dict[str, Any]]) -> None:
+        self.manifest_dir.mkdir(parents=True, exist_ok=True)
+        path = self._manifest_path(category)
+        fd, tmp_name = tempfile.mkstemp(dir=self.manifest_dir, prefix=f".{path.name}.", suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_name, path)
+
+    def sync(self, source_root: Path, categories: Iterable[str], prune: bool = False) -> Dict[str, Any]:
+        """Unityの画像フォルダから変更分だけを並列にコピー
+
+        prune: 上流で削除されたファイルをこちらでも削除する (Falseなら報告のみ)
+        """
+        summary = {"copied": 0, "skipped": 0, "removed": 0, "missing_upstream": 0, "errors": [], "categories": {}}
+        with self._lock, ThreadPoolExecutor(max_workers=SYNC_WORKERS) as pool:
+            for category in categories:
+                source_dir = source_root / category
+                if not source_dir.is_dir():
+                    continue
+                result = self._sync_category(pool, category, source_dir, prune)
+                summary["categories"][category] = {k: v for k, v in result.items() if k != "errors"}
+                for key in ("copied", "skipped", "removed", "missing_upstream"):
+                    summary[key] += result[key]
+                summary["errors"].extend(result["errors"])
+        return summary
+
+    def _sync_category(self, pool: ThreadPoolExecutor, category: str, source_dir: Path, prune: bool) -> Dict[str, Any]:
+        dest_dir = self.images_dir / category
+        dest_dir.mkdir(parents=True, exist_ok=True)
+        manifest = self._load_manifest(category)
+        new_manifest: Dict[str, Dict[str, Any]] = {}
+        result = {"copied": 0, "skipped": 0, "removed": 0, "missing_upstream": 0, "errors": []}
+
+        pending = []
+        with os.scandir(source_dir) as entries:
+            for entry in entries:
+                if not entry.is_file() or Path(entry.name).suffix.lower() not in self.extensions:
+                    continue
+                st = entry.stat()
+                previous = manifest.get(entry.name)
+                dest = dest_dir / entry.name
+                if (
+                    previous
+                    and previous["size"] == st.st_size
+                    and previous["mtime_ns"] == st.st_mtime_ns
+                    and _same_size(dest, st.st_size)
+                ):
+                    # サイズと更新時刻が同じなら内容を読まずにスキップ
+                    new_manifest[entry.name] = previous
+                    result["skipped"] += 1
+                    continue
+                pending.append((entry.name, Path(entry.path), st, previous, dest))
+
+        futures = [(name, pool.submit(self._copy_if_changed, category, src, st, previous, dest)) for name, src, st, previous, dest in pending]
+        for name, future in futures:
+            try:
+                record, copied = future.result()
+            except OSError as e:
+                result["errors"].append({"category": category, "name": name, "error": str(e)})
+                if name in manifest:
+                    new_manifest[name] = manifest[name]
+                continue
+            new_manifest[name] = record
+            result["copied" if copied else "skipped"] += 1
+
+        for name in manifest.keys() - new_manifest.keys():
+            # 以前コピーしたが上流から消えたファイル
+            if prune:
+                try:
+                    self.store.remove(category, name)
+                except FileNotFoundError:
+                    pass
+                result["removed"] += 1
+            else:
+                new_manifest[name] = manifest[name]
+                result["missing_upstream"] += 1
+
+        if new_manifest != manifest:
+            self._save_manifest(category, new_manifest)
+        return result
+
+    def _copy_if_changed(self, category: str, src: Path, st: os.stat_result, previous: Optional[Dict[str, Any]], dest: Path):
+        """ハッシュが変わっていればコピー (更新時刻だけ変わった場合はコピーしない)"""
+        digest = hash_file(src)
+        record = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": digest}
+        if previous and previous.get("hash") == digest and _same_size(dest, st.st_size):
+            return record, False
+        self.store.save_file(category, dest.name, src, digest)
+        return record, True
+
+
+def _same_size(path: Path, size: int) -> bool:
+    try:
+        return path.stat().st_size == size
+    except FileNotFoundError:
+        return False
+
@@ -0,0 +1,184 @@
+"""画像バリアント - サムネイル・形式変換をワーカープールで生成し、サイズ上限付きのLRUでディスクにキャッシュ"""
+import asyncio
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+try:
+    from PIL import Image
+except ImportError:  # Pillowが無ければ変換せず元画像を返す
+    Image = None
+
+# 形式 -> (Pillowの形式名, Content-Type)
+VARIANT_FORMATS: Dict[str, tuple] = {
+    "webp": ("WEBP", "image/webp"),
+    "png": ("PNG", "image/png"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+# 指定できる最大の幅・高さ
+MAX_VARIANT_DIMENSION = 2048
+# 生成に使うワーカー数 (画像の縮小はCPUを使うのでI/O用のプールとは分ける)
+VARIANT_WORKERS = int(os.environ.get("GAME_DATA_VARIANT_WORKERS", "2"))
+# キャッシュの上限 (バイト)
+VARIANT_CACHE_SIZE = int(os.environ.get("GAME_DATA_VARIANT_CACHE_SIZE", str(256 * 1024 * 1024)))
+# キャッシュの保存先 (画像フォルダ内)
+VARIANT_DIR_NAME = ".variants"
+# WebP / JPEGの品質
+VARIANT_QUALITY = 85
+# 変換元として受け付ける最大ピクセル数 (巨大な画像・展開爆弾の対策)
+MAX_SOURCE_PIXELS = int(os.environ.get("GAME_DATA_MAX_IMAGE_PIXELS", str(64 * 1024 * 1024)))
+
+if Image is not None:
+    Image.MAX_IMAGE_PIXELS = MAX_SOURCE_PIXELS
+    # 読み込み・変換に失敗したときにPillowが送出する例外
+    _DECODE_ERRORS = (OSError, ValueError, SyntaxError, Image.DecompressionBombError)
+else:
+    _DECODE_ERRORS = (OSError, ValueError, SyntaxError)
+
+
+class VariantError(ValueError):
+    """元画像を読み込めない・変換できない"""
+
+
+def variants_available() -> bool:
+    return Image is not None
+
+
+def variant_name(digest: str, width: Optional[int], height: Optional[int], fmt: str) -> str:
+    """キャッシュのファイル名 (元画像のハッシュ + パラメータ)"""
+    return f"{digest}_{width or 0}x{height or 0}.{fmt}"
+
+
+class ImageVariants:
+    """元画像のハッシュとパラメータをキーにしたバリアントのディスクキャッシュ
+
+    使用順は更新時刻として記録するので、再起動後も古いものから削除される。
+    """
+
+    def __init__(self, images_dir: Path, max_bytes: int = VARIANT_CACHE_SIZE):
+        self.cache_dir = images_dir / VARIANT_DIR_NAME
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # ファイル名 -> サイズ (古い順)
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        # 生成中のファイル名 -> Future (同じバリアントへの同時リクエストは1回だけ生成)
+        self._pending: Dict[str, Future] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._load()
+
+    def _load(self) -> None:
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.startswith("."):
+                    st = entry.stat()
+                    entries.append((st.st_mtime_ns, entry.name, st.st_size))
+        for _, name, size in sorted(entries):
+            self._entries[name] = size
+            self._total += size
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=VARIANT_WORKERS, thread_name_prefix="image-variant")
+        return self._pool
+
+    async def get(self, source: Path, digest: str, width: Optional[int], height: Optional[int], fmt: str) -> Path:
+        """バリアントのパス (キャッシュに無ければワーカープールで生成)"""
+        name = variant_name(digest, width, height, fmt)
+        path = self.cache_dir / name
+        submitted = False
+        with self._lock:
+            if name in self._entries:
+                self._entries.move_to_end(name)
+                hit = True
+            else:
+                hit = False
+                future = self._pending.get(name)
+                if future is None:
+                    future = self._get_pool().submit(self._generate, source, path, width, height, fmt)
+                    self._pending[name] = future
+                    submitted = True
+        if submitted:
+            # 完了済みならコールバックはこの場で呼ばれるので、ロックを離してから登録する
+            future.add_done_callback(lambda done: self._finish(name, done))
+        if hit:
+            try:
+                os.utime(path)
+                return path
+            except FileNotFoundError:
+                # キャッシュが外部で削除された
+                with self._lock:
+                    self._forget(name)
+                return await self.get(source, digest, width, height, fmt)
+        return await asyncio.wrap_future(future)
+
+    def _finish(self, name: str, future: Future) -> None:
+        with self._lock:
+            # 後から登録された同名の生成を消さない
+            if self._pending.get(name) is future:
+                del self._pending[name]
+
+    def _generate(self, source: Path, path: Path, width: Optional[int], height: Optional[int], fmt: str) -> Path:
+        try:
+            self._convert(source, path, width, height, fmt)
+        except _DECODE_ERRORS as e:
+            raise VariantError(f"Image could not be converted: {e}") from e
+
+        size = path.stat().st_size
+        with self._lock:
+            self._forget(path.name)
+            self._entries[path.name] = size
+            self._total += size
+            self._evict(keep=path.name)
+        return path
+
+    def _convert(self, source: Path, path: Path, width: Optional[int], height: Optional[int], fmt: str) -> None:
+        pil_format, _ = VARIANT_FORMATS[fmt]
+        with Image.open(source) as image:
+            # ヘッダーの縦横で判定し、展開する前に拒否する
+            # (Pillowは MAX_IMAGE_PIXELS の2倍までは警告のみなので自前でも確認する)
+            if image.width * image.height > MAX_SOURCE_PIXELS:
+                raise Image.DecompressionBombError(
+                    f"Image size ({image.width}x{image.height}) exceeds {MAX_SOURCE_PIXELS} pixels"
+                )
+            image.load()
+            if width or height:
+                # 縦横比を保って縮小 (拡大はしない)
+                image.thumbnail((width or image.width, height or image.height), Image.LANCZOS)
+            if pil_format == "JPEG":
+                image = image.convert("RGB")
+            elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+                image = image.convert("RGBA")
+            options = {"optimize": True} if pil_format == "PNG" else {"quality": VARIANT_QUALITY}
+            fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, prefix=f".{path.name}.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as out:
+                    image.save(out, pil_format, **options)
+                os.replace(tmp_name, path)
+            finally:
+                if os.path.exists(tmp_name):
+                    os.unlink(tmp_name)
+
+    def _forget(self, name: str) -> None:
+        size = self._entries.pop(name, None)
+        if size is not None:
+            self._total -= size
+
+    def _evict(self, keep: str) -> None:
+        """上限を超えた分を使われていない順に削除"""
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            name = next(iter(self._entries))
+            if name == keep:
+                self._entries.move_to_end(name)
+                continue
+            self._forget(name)
+            try:
+                (self.cache_dir / name).unlink()
+            except FileNotFoundError:
+                pass
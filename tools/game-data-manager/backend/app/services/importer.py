@@ -0,0 +1,297 @@
+"""ストリーミングインポート - NDJSON / zipをレコード単位で検証しながら取り込む"""
+import io
+import json
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Set, TextIO
+
+from .data_service import DATA_FILES, BulkValidationError, DataService, id_type_error
+from .serialization import dumps
+
+IMPORT_FORMATS = ("ndjson", "zip")
+# ジョブに保持するエラーの上限 (件数自体はすべて数える)
+MAX_IMPORT_ERRORS = 1000
+# 状態を保持しておくジョブ数
+MAX_IMPORT_JOBS = 32
+# zip内のJSONを読み込む単位 (文字数)
+READ_CHUNK = 64 * 1024
+
+# エラー位置の単位 (どちらも1始まり: ndjsonは行番号、zipはファイル内の配列要素の番号)
+POSITION_UNITS = {"ndjson": "line", "zip": "entry"}
+
+# zip内のファイル名 -> データタイプ
+_TYPES_BY_FILE = {file_name: data_type for data_type, file_name in DATA_FILES.items()}
+
+
+def iter_json_array(stream: TextIO) -> Iterator[Any]:
+    """JSON配列の要素を先頭から1件ずつ読み込む (配列全体をメモリに載せない)"""
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+    expect = "["
+
+    def fill() -> bool:
+        nonlocal buf, pos, eof
+        chunk = stream.read(READ_CHUNK)
+        buf, pos = buf[pos:] + chunk, 0
+        eof = not chunk
+        return bool(chunk)
+
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n":
+            pos += 1
+        if pos >= len(buf):
+            if fill():
+                continue
+            raise ValueError("Unexpected end of JSON array")
+        char = buf[pos]
+        if expect == "[":
+            if char != "[":
+                raise ValueError("JSON array expected")
+            pos += 1
+            expect = "value"
+        elif expect == "," and char == ",":
+            pos += 1
+            expect = "next"
+        elif expect in ("value", ",") and char == "]":
+            return
+        elif expect in ("value", "next"):
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if not eof and fill():
+                    continue
+                raise
+            if end >= len(buf) and not eof and fill():
+                # 数値などが途中で切れている可能性があるので読み足して再解析
+                continue
+            pos = end
+            expect = ","
+            yield value
+        else:
+            raise ValueError(f"Unexpected character in JSON array: {char!r}")
+
+
+class ImportJob:
+    """インポートの進捗とエラー"""
+
+    def __init__(self, job_id: str, format: str):
+        self.id = job_id
+        self.format = format
+        self.status = "running"   # running / committed / failed
+        self.bytes_received = 0
+        self.processed = 0
+        self.counts: Dict[str, int] = {}
+        self.error_count = 0
+        self.errors: List[Dict] = []
+        self.message: Optional[str] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def add_error(
+        self, data_type: Optional[str], position: int, item_id: Any, errors: List[str], file: Optional[str] = None
+    ) -> None:
+        """エラーを記録 (position は1始まりの行番号 / zip内ファイルの要素番号)"""
+        self.error_count += 1
+        if len(self.errors) < MAX_IMPORT_ERRORS:
+            error = {"type": data_type, "position": position, "id": item_id, "errors": errors}
+            if file is not None:
+                error["file"] = file
+            self.errors.append(error)
+
+    def finish(self, status: str, message: Optional[str] = None) -> None:
+        self.status = status
+        self.message = message
+        self.finished_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "format": self.format,
+            "status": self.status,
+            "bytesReceived": self.bytes_received,
+            "processed": self.processed,
+            "counts": dict(self.counts),
+            "errorCount": self.error_count,
+            # errors[].position の単位 (1始まり)
+            "positionUnit": POSITION_UNITS[self.format],
+            "positionBase": 1,
+            "errors": list(self.errors),
+            "message": self.message,
+            "startedAt": self.started_at,
+            "finishedAt": self.finished_at,
+        }
+
+
+class StreamingImport:
+    """受信したチャンクを順に検証し、一時ファイルに溜めて最後にまとめて反映する
+
+    ndjson: 1行1レコードの {"type": データタイプ, "data": レコード} (エクスポートと同じ形式)
+    zip: データタイプごとの正規JSONファイル (items.json など)
+
+    エラー位置はどちらも1始まりで、ndjsonは行番号、zipはファイル内の配列要素の番号。
+    """
+
+    def __init__(self, service: DataService, job: ImportJob):
+        self.service = service
+        self.job = job
+        self._staging = Path(tempfile.mkdtemp(prefix="game_data_import_"))
+        self._staged: Dict[str, BinaryIO] = {}
+        self._seen: Dict[str, Set[Any]] = {}
+        self._pending = b""
+        self._line = 0
+        self._spool: Optional[BinaryIO] = None
+        if job.format == "zip":
+            self._spool = open(self._staging / "upload.zip", "wb")
+
+    def feed(self, chunk: bytes) -> None:
+        """受信チャンクを処理"""
+        self.job.bytes_received += len(chunk)
+        if self._spool is not None:
+            # zipは末尾の目録が必要なのでディスクに溜めてから読む
+            self._spool.write(chunk)
+            return
+        lines = (self._pending + chunk).split(b"\n")
+        self._pending = lines.pop()
+        for line in lines:
+            self._feed_line(line)
+
+    def _feed_line(self, line: bytes) -> None:
+        self._line += 1
+        if not line.strip():
+            return
+        try:
+            entry = json.loads(line)
+        except ValueError as e:
+            self.job.add_error(None, self._line, None, [f"Invalid JSON: {e}"])
+            return
+        if not isinstance(entry, dict) or entry.get("type") not in DATA_FILES or "data" not in entry:
+            self.job.add_error(None, self._line, None, ['Expected {"type": <data type>, "data": <record>}'])
+            return
+        self._add_record(entry["type"], entry["data"], self._line)
+
+    def _add_record(self, data_type: str, item: Any, position: int, file: Optional[str] = None) -> None:
+        """1件を検証して一時ファイルに書き出す"""
+        self.job.processed += 1
+        id_field = self.service._get_id_field(data_type)
+        item_id = item.get(id_field) if isinstance(item, dict) else None
+        id_error = id_type_error(item_id)
+        if id_error:
+            self.job.add_error(data_type, position, item_id, [id_error], file)
+            return
+        record, errors = self.service.validate_record(data_type, item)
+
+        seen = self._seen.setdefault(data_type, set())
+        if item_id is not None and item_id in seen:
+            errors.append(f"Duplicate ID in batch: {item_id}")
+        seen.add(item_id)
+        if errors:
+            self.job.add_error(data_type, position, item_id, errors, file)
+            return
+
+        self._stage(data_type).write(dumps(record) + b"\n")
+        self.job.counts[data_type] += 1
+
+    def _stage(self, data_type: str) -> BinaryIO:
+        """データタイプの一時ファイル (含まれていたタイプだけが差し替え対象になる)"""
+        staged = self._staged.get(data_type)
+        if staged is None:
+            staged = self._staged[data_type] = open(self._staging / f"{data_type}.ndjson", "wb")
+            self.job.counts.setdefault(data_type, 0)
+        return staged
+
+    def _read_zip(self) -> None:
+        self._spool.close()
+        try:
+            archive = zipfile.ZipFile(self._staging / "upload.zip")
+        except zipfile.BadZipFile as e:
+            raise ValueError(f"Invalid zip file: {e}")
+        with archive:
+            for info in archive.infolist():
+                data_type = _TYPES_BY_FILE.get(Path(info.filename).name)
+                if data_type is None or info.is_dir():
+                    continue
+                # 空の配列でも差し替え対象にする
+                self._stage(data_type)
+                position = 0
+                with archive.open(info) as raw:
+                    stream = io.TextIOWrapper(raw, encoding="utf-8-sig")
+                    try:
+                        for position, item in enumerate(iter_json_array(stream), 1):
+                            self._add_record(data_type, item, position, info.filename)
+                    except ValueError as e:
+                        # 読み込めなかったのは最後に読めた要素の次
+                        self.job.add_error(data_type, position + 1, None, [str(e)], info.filename)
+
+    def finish(self) -> Dict[str, int]:
+        """全件が正しければまとめて反映し、タイプごとの件数を返す"""
+        try:
+            if self._spool is not None:
+                self._read_zip()
+            elif self._pending:
+                self._feed_line(self._pending)
+                self._pending = b""
+            if self.job.error_count:
+                raise BulkValidationError(self.job.errors)
+
+            datasets = {}
+            for data_type, staged in self._staged.items():
+                staged.close()
+                with open(staged.name, "rb") as f:
+                    datasets[data_type] = [json.loads(line) for line in f]
+            result = self.service.replace_validated(datasets)
+        except Exception as e:
+            self.job.finish("failed", str(e))
+            raise
+        self.job.finish("committed")
+        return result
+
+    def close(self) -> None:
+        """一時ファイルを削除 (完了・失敗どちらでも呼ぶ)"""
+        if self.job.status == "running":
+            self.job.finish("failed", "Upload interrupted")
+        for staged in self._staged.values():
+            staged.close()
+        if self._spool is not None:
+            self._spool.close()
+        shutil.rmtree(self._staging, ignore_errors=True)
+
+
+class ImportJobs:
+    """最近のインポートジョブを保持 (進捗の問い合わせ用)"""
+
+    def __init__(self):
+        self._jobs: "OrderedDict[str, ImportJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, format: str, job_id: Optional[str] = None) -> ImportJob:
+        if format not in IMPORT_FORMATS:
+            raise ValueError(f"Invalid format: {format}")
+        job_id = job_id or uuid.uuid4().hex
+        with self._lock:
+            if job_id in self._jobs:
+                raise ValueError(f"Job already exists: {job_id}")
+            job = self._jobs[job_id] = ImportJob(job_id, format)
+            while len(self._jobs) > MAX_IMPORT_JOBS:
+                self._jobs.popitem(last=False)
+        return job
+
+    def get(self, job_id: str) -> Optional[ImportJob]:
+        return self._jobs.get(job_id)
+
+
+# シングルトンインスタンス
+_jobs: Optional[ImportJobs] = None
+
+
+def get_import_jobs() -> ImportJobs:
+    """インポートジョブ一覧のシングルトンを取得"""
+    global _jobs
+    if _jobs is None:
+        _jobs = ImportJobs()
+    return _jobs
@@ -0,0 +1,68 @@
+"""差分更新インデックスの基底 - DataServiceの変更イベントでレコード単位に更新する"""
+import threading
+from typing import Dict, Iterable, Set
+
+
+class MaintainedIndex:
+    """全データから一度だけ構築し、以降は変更イベントの差分で更新するインデックス
+
+    サブクラスは _add / _remove でレコード1件分の登録・解除を実装する。
+    """
+
+    def __init__(self, id_fields: Dict[str, str]):
+        self._id_fields = id_fields
+        # 存在するID
+        self._ids: Dict[str, Set[str]] = {data_type: set() for data_type in id_fields}
+        # 変更のたびに増える版数 (問い合わせ結果のキャッシュ判定)
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def load(self, data_type: str, records: Iterable[Dict]) -> None:
+        """データタイプ全体を登録し直す"""
+        with self._lock:
+            self._reset(data_type, records)
+
+    def apply(self, event: Dict) -> None:
+        """DataServiceの変更イベントを反映"""
+        data_type = event["type"]
+        with self._lock:
+            if event["reset"]:
+                self._reset(data_type, (change["data"] for change in event["changes"]))
+                return
+            for change in event["changes"]:
+                if change.get("prev"):
+                    self._discard(data_type, change["prev"])
+                self._discard(data_type, change["id"])
+                if change["op"] == "put":
+                    self._insert(data_type, change["id"], change["data"])
+            self.version += 1
+
+    def exists(self, data_type: str, item_id: str) -> bool:
+        return item_id in self._ids[data_type]
+
+    def _reset(self, data_type: str, records: Iterable[Dict]) -> None:
+        for item_id in list(self._ids[data_type]):
+            self._discard(data_type, item_id)
+        id_field = self._id_fields[data_type]
+        for record in records:
+            self._insert(data_type, record.get(id_field), record)
+        self.version += 1
+
+    def _insert(self, data_type: str, item_id: str, record: Dict) -> None:
+        if item_id in self._ids[data_type]:
+            # 重複IDは後から登録したレコードで置き換える
+            self._discard(data_type, item_id)
+        self._ids[data_type].add(item_id)
+        self._add(data_type, item_id, record)
+
+    def _discard(self, data_type: str, item_id: str) -> None:
+        if item_id not in self._ids[data_type]:
+            return
+        self._ids[data_type].discard(item_id)
+        self._remove(data_type, item_id)
+
+    def _add(self, data_type: str, item_id: str, record: Dict) -> None:
+        raise NotImplementedError
+
+    def _remove(self, data_type: str, item_id: str) -> None:
+        raise NotImplementedError
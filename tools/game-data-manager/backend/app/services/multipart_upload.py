@@ -0,0 +1,103 @@
+"""multipart/form-data の逐次受信 - ファイルフィールドを受信しながら書き出す (本体全体をスプールしない)"""
+from typing import Callable, List, Optional, Tuple
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart 0.0.12 以前
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from .image_store import UploadWriter
+
+# ファイル以外のフィールドとヘッダーに許す合計バイト数
+MAX_FIELD_BYTES = 64 * 1024
+
+
+class MultipartFileReceiver:
+    """リクエスト本体を受け取った順に解析し、指定フィールドのファイルだけを writer に書き込む
+
+    open_file(ファイル名) はパートのヘッダーを読み終えた時点で呼ばれるので、
+    拡張子の検証などで例外を送出すれば残りの本体を読まずに打ち切れる。
+    """
+
+    def __init__(self, content_type: str, field: str, open_file: Callable[[str], UploadWriter]):
+        mime, params = parse_options_header(content_type)
+        boundary = params.get(b"boundary")
+        if mime != b"multipart/form-data" or not boundary:
+            raise ValueError("Expected multipart/form-data with a boundary")
+        self.field = field
+        self.open_file = open_file
+        self.filename: Optional[str] = None
+        self.writer: Optional[UploadWriter] = None
+        self._headers: List[Tuple[bytes, bytes]] = []
+        self._header_field = b""
+        self._header_value = b""
+        # 現在のパートが対象のファイルか
+        self._receiving = False
+        self._other_bytes = 0
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+        })
+
+    def feed(self, chunk: bytes) -> None:
+        if chunk:
+            self._parser.write(chunk)
+
+    def finish(self) -> Tuple[str, UploadWriter]:
+        """本体を読み終えたら (ファイル名, writer) を返す"""
+        self._parser.finalize()
+        if self.writer is None:
+            raise ValueError(f"No file in field '{self.field}'")
+        return self.filename, self.writer
+
+    def close(self) -> None:
+        """途中で失敗したときに書きかけの一時ファイルを削除"""
+        if self.writer is not None:
+            self.writer.discard()
+
+    # ========================================
+    # パーサーのコールバック
+    # ========================================
+
+    def _count(self, size: int) -> None:
+        self._other_bytes += size
+        if self._other_bytes > MAX_FIELD_BYTES:
+            raise ValueError("Multipart fields other than the file are too large")
+
+    def _on_part_begin(self) -> None:
+        self._headers = []
+        self._receiving = False
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._count(end - start)
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._count(end - start)
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers.append((self._header_field.lower(), self._header_value))
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        disposition = next((value for field, value in self._headers if field == b"content-disposition"), b"")
+        _, options = parse_options_header(disposition)
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        if name != self.field or filename is None or self.writer is not None:
+            return
+        self.filename = filename.decode("utf-8", "replace")
+        self.writer = self.open_file(self.filename)
+        self._receiving = True
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._receiving:
+            self.writer.write(data[start:end])
+        else:
+            self._count(end - start)
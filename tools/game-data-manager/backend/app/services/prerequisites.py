@@ -0,0 +1,159 @@
+"""前提条件チェーン分析 - 循環検出 (Tarjan SCC)、チェーンの深さ、解放順"""
+from typing import Any, Dict, List, Optional
+
+from .references import NODE_PREFIXES
+
+# データタイプ -> 前提レコードを指すフィールド
+PREREQUISITE_FIELDS: Dict[str, str] = {
+    "upgrades": "prerequisiteUpgradeId",
+    "game_events": "prerequisiteEventId",
+    "gacha_banners": "prerequisiteBannerId",
+}
+
+
+def strongly_connected_components(nodes: List[str], edges: Dict[str, List[str]]) -> List[List[str]]:
+    """Tarjanの強連結成分分解 (再帰なし)
+
+    成分は依存先が先になる順 (逆トポロジカル順) で返す。
+    """
+    index: Dict[str, int] = {}
+    lowlink: Dict[str, int] = {}
+    on_stack = set()
+    stack: List[str] = []
+    components: List[List[str]] = []
+    counter = 0
+
+    for root in nodes:
+        if root in index:
+            continue
+        work = [(root, 0)]
+        while work:
+            node, child = work.pop()
+            if child == 0:
+                index[node] = lowlink[node] = counter
+                counter += 1
+                stack.append(node)
+                on_stack.add(node)
+            successors = edges.get(node, ())
+            if child < len(successors):
+                work.append((node, child + 1))
+                succ = successors[child]
+                if succ not in index:
+                    work.append((succ, 0))
+                elif succ in on_stack:
+                    lowlink[node] = min(lowlink[node], index[succ])
+                continue
+            if lowlink[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+    return components
+
+
+def _cycle_order(component: List[str], edges: Dict[str, List[str]]) -> List[str]:
+    """循環を最小IDから前提をたどる順に並べる (各レコードの前提は次の要素)"""
+    members = set(component)
+    start = min(component)
+    order = [start]
+    node = edges[start][0]
+    while node != start and node in members and node not in order:
+        order.append(node)
+        node = edges[node][0]
+    return order
+
+
+def analyze_type(data_type: str, records: List[Dict], id_field: str) -> Dict[str, Any]:
+    """1データタイプの前提チェーンを分析
+
+    depth: 前提をたどった段数 (前提なし = 0、循環に含まれる・循環の先にあるものはNone)
+    """
+    field = PREREQUISITE_FIELDS[data_type]
+    ids = [record.get(id_field) for record in records]
+    known = set(ids)
+    edges: Dict[str, List[str]] = {}
+    levels: Dict[str, int] = {}
+    for record in records:
+        prerequisite = record.get(field)
+        if prerequisite and prerequisite in known:
+            edges[record.get(id_field)] = [prerequisite]
+            if "prerequisiteLevel" in record:
+                levels[record.get(id_field)] = record["prerequisiteLevel"]
+
+    depth: Dict[str, Optional[int]] = {}
+    cycles: List[List[str]] = []
+    for component in strongly_connected_components(ids, edges):
+        node = component[0]
+        if len(component) > 1 or node in edges.get(node, ()):
+            cycles.append(_cycle_order(component, edges))
+            for member in component:
+                depth[member] = None
+            continue
+        successors = edges.get(node)
+        if not successors:
+            depth[node] = 0
+        else:
+            parent = depth[successors[0]]
+            depth[node] = None if parent is None else parent + 1
+
+    return {"field": field, "cycles": cycles, "depth": depth, "levels": levels}
+
+
+def analyze(datasets: Dict[str, List[Dict]], id_fields: Dict[str, str]) -> Dict[str, Any]:
+    """前提チェーンを持つ全データタイプを分析
+
+    戻り値:
+      cycles: 循環ごとのノード一覧
+      types: データタイプ -> {maxDepth, depth: {ID: 段数}, blocked: 循環の先にあるID}
+      order: 解放順 (前提が先に来るトポロジカル順、循環に関係するものは含まない)
+    """
+    result: Dict[str, Any] = {"cycles": [], "types": {}, "order": []}
+    ranked = []
+    for type_order, (data_type, records) in enumerate(datasets.items()):
+        prefix = NODE_PREFIXES[data_type]
+        analysis = analyze_type(data_type, records, id_fields[data_type])
+        in_cycle = {member for cycle in analysis["cycles"] for member in cycle}
+        for cycle in analysis["cycles"]:
+            result["cycles"].append({
+                "type": data_type,
+                "field": analysis["field"],
+                "nodes": [f"{prefix}:{member}" for member in cycle],
+            })
+        depths = analysis["depth"]
+        valid = [d for d in depths.values() if d is not None]
+        result["types"][data_type] = {
+            "maxDepth": max(valid) if valid else 0,
+            "depth": depths,
+            "prerequisiteLevel": analysis["levels"],
+            "blocked": sorted(i for i, d in depths.items() if d is None and i not in in_cycle),
+        }
+        id_field = id_fields[data_type]
+        ranked.extend(
+            (depths[record.get(id_field)], type_order, position, f"{prefix}:{record.get(id_field)}")
+            for position, record in enumerate(records)
+            if depths.get(record.get(id_field)) is not None
+        )
+    result["order"] = [node for _, _, _, node in sorted(ranked)]
+    return result
+
+
+def cycle_errors(analysis: Dict[str, Any]) -> List[Dict]:
+    """整合性チェック用: 循環に含まれるレコードごとのエラー (missing_idは循環を作っている前提ID)"""
+    errors = []
+    for cycle in analysis["cycles"]:
+        nodes = cycle["nodes"]
+        for i, node in enumerate(nodes):
+            errors.append({
+                "source": node,
+                "field": cycle["field"],
+                "missing_id": nodes[(i + 1) % len(nodes)].partition(":")[2],
+                "cycle": nodes,
+            })
+    return errors
@@ -0,0 +1,259 @@
+"""一覧クエリ - フィールド単位のインデックスによる絞り込み・並び替え・ページング"""
+import json
+import math
+import threading
+from bisect import bisect_left, insort
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# 範囲フィルタの演算子 (field__gte=10 など)
+RANGE_OPERATORS = ("gte", "gt", "lte", "lt")
+
+# 値の種類 (並び替え時の優先順)
+_NUMBER, _STRING, _OTHER = 0, 1, 2
+
+
+def _rank(value: Any) -> int:
+    if isinstance(value, (int, float)):
+        return _NUMBER
+    if isinstance(value, str):
+        return _STRING
+    return _OTHER
+
+
+def _sort_key(value: Any) -> Tuple:
+    rank = _rank(value)
+    if rank == _OTHER:
+        return (rank, "" if value is None else json.dumps(value, sort_keys=True))
+    return (rank, value)
+
+
+def _hashable(value: Any) -> Any:
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, sort_keys=True)
+    return value
+
+
+class FieldIndex:
+    """1フィールド分のインデックス (等値: 値 -> 連番, 範囲/並び替え: (値, 連番) の昇順リスト)
+
+    連番はTableIndexがレコードに振る一覧上の並び順で、レコードの追加・削除ごとに差分更新する。
+    """
+
+    def __init__(self, records: Dict[int, Dict], field: str):
+        self.name = field
+        self.eq: Dict[Any, Set[int]] = {}
+        self.entries: List[Tuple[Tuple, int]] = []
+        # 値の種類ごとの件数 (None以外) と真偽値の件数
+        self._ranks: Dict[int, int] = {}
+        self._bools = 0
+        for seq, record in records.items():
+            self._count(record.get(field), 1)
+            self.eq.setdefault(_hashable(record.get(field)), set()).add(seq)
+            self.entries.append((_sort_key(record.get(field)), seq))
+        self.entries.sort()
+
+    @property
+    def rank(self) -> int:
+        """フィールドの主な値の種類 (クエリ文字列の型変換に使用)"""
+        return max(self._ranks, key=self._ranks.get) if self._ranks else _STRING
+
+    def add(self, seq: int, record: Dict) -> None:
+        value = record.get(self.name)
+        self._count(value, 1)
+        self.eq.setdefault(_hashable(value), set()).add(seq)
+        insort(self.entries, (_sort_key(value), seq))
+
+    def remove(self, seq: int, record: Dict) -> None:
+        value = record.get(self.name)
+        self._count(value, -1)
+        key = _hashable(value)
+        positions = self.eq[key]
+        positions.discard(seq)
+        if not positions:
+            del self.eq[key]
+        del self.entries[bisect_left(self.entries, (_sort_key(value), seq))]
+
+    def _count(self, value: Any, delta: int) -> None:
+        if isinstance(value, bool):
+            self._bools += delta
+        if value is not None:
+            rank = _rank(value)
+            count = self._ranks.get(rank, 0) + delta
+            if count:
+                self._ranks[rank] = count
+            else:
+                del self._ranks[rank]
+
+    def coerce(self, raw: str) -> Any:
+        """クエリ文字列をフィールドの型に変換"""
+        if self._bools:
+            return raw.lower() in ("true", "1", "yes")
+        if self.rank == _NUMBER:
+            try:
+                return float(raw)
+            except ValueError:
+                raise ValueError(f"Not a number: {raw}")
+        return raw
+
+    def match_eq(self, values: Iterable[Any]) -> Set[int]:
+        positions: Set[int] = set()
+        for value in values:
+            positions.update(self.eq.get(value, ()))
+        return positions
+
+    def match_range(self, op: str, value: Any) -> Set[int]:
+        key = _sort_key(value)
+        # 同じ種類の値の範囲内でのみ比較する (Noneなどを含めない)
+        lo = bisect_left(self.entries, ((key[0],),))
+        hi = bisect_left(self.entries, ((key[0] + 1,),))
+        # (key,) は同じ値のどのエントリよりも前、(key, inf) は後ろに並ぶ
+        if op == "gte":
+            lo = bisect_left(self.entries, (key,), lo, hi)
+        elif op == "gt":
+            lo = bisect_left(self.entries, (key, math.inf), lo, hi)
+        elif op == "lte":
+            hi = bisect_left(self.entries, (key, math.inf), lo, hi)
+        elif op == "lt":
+            hi = bisect_left(self.entries, (key,), lo, hi)
+        return {seq for _, seq in self.entries[lo:hi]}
+
+
+class TableIndex:
+    """1データタイプ分のクエリ用インデックス (DataServiceの変更イベントで差分更新する)
+
+    レコードには一覧上の並び順を表す連番を振り、フィールドごとのインデックスは初回の利用時に作る。
+    重複IDはキャッシュの主キーインデックスと同じく先頭の出現を更新・削除の対象にする。
+    """
+
+    def __init__(self, records: Iterable[Dict], id_field: str):
+        self.id_field = id_field
+        # フィールドのインデックス作成を直列化 (問い合わせは読み込みロック中に並行して行われる)
+        self._lock = threading.Lock()
+        self._reset(records)
+
+    def _reset(self, records: Iterable[Dict]) -> None:
+        # 連番 -> レコード (連番の昇順 = 一覧の並び順)
+        self.records: Dict[int, Dict] = {}
+        # ID -> 連番 (重複IDは出現順)
+        self._seqs: Dict[Any, List[int]] = {}
+        self._fields: Dict[str, FieldIndex] = {}
+        self._next_seq = 0
+        for record in records:
+            self._append(record)
+
+    def apply(self, event: Dict) -> None:
+        """変更イベントを反映 (書き込みロック中に呼ばれる)"""
+        if event["reset"]:
+            self._reset(change["data"] for change in event["changes"])
+            return
+        for change in event["changes"]:
+            if change["op"] == "put":
+                self._put(change["id"], change["data"], change.get("prev"))
+            else:
+                self._delete(change["id"])
+
+    def _append(self, record: Dict) -> None:
+        seq = self._next_seq
+        self._next_seq += 1
+        self.records[seq] = record
+        self._seqs.setdefault(record.get(self.id_field), []).append(seq)
+        for index in self._fields.values():
+            index.add(seq, record)
+
+    def _put(self, item_id: Any, record: Dict, prev: Optional[Any] = None) -> None:
+        """作成・更新・ID変更 (既存のレコードは一覧上の位置を保つ)"""
+        source = prev if prev is not None and prev in self._seqs else item_id
+        seqs = self._seqs.get(source)
+        if not seqs:
+            self._append(record)
+            return
+        seq = seqs[0]
+        old = self.records[seq]
+        for index in self._fields.values():
+            index.remove(seq, old)
+            index.add(seq, record)
+        self.records[seq] = record
+        if source != item_id:
+            self._unlink(source, seq)
+            insort(self._seqs.setdefault(item_id, []), seq)
+
+    def _delete(self, item_id: Any) -> None:
+        seqs = self._seqs.get(item_id)
+        if not seqs:
+            return
+        seq = seqs[0]
+        self._unlink(item_id, seq)
+        record = self.records.pop(seq)
+        for index in self._fields.values():
+            index.remove(seq, record)
+
+    def _unlink(self, item_id: Any, seq: int) -> None:
+        seqs = self._seqs[item_id]
+        seqs.remove(seq)
+        if not seqs:
+            del self._seqs[item_id]
+
+    def field(self, name: str) -> FieldIndex:
+        index = self._fields.get(name)
+        if index is None:
+            with self._lock:
+                index = self._fields.get(name)
+                if index is None:
+                    index = self._fields[name] = FieldIndex(self.records, name)
+        return index
+
+    def query(
+        self,
+        filters: List[Tuple[str, str, List[str]]],
+        sort: Optional[str] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> Tuple[int, List[Dict]]:
+        """絞り込み・並び替え・ページングを行い (総件数, ページ) を返す
+
+        filters: (フィールド, 演算子 "eq"/"gte"/"gt"/"lte"/"lt", 値リスト)
+        sort: フィールド名 (先頭に "-" で降順)
+        """
+        candidates: Optional[Set[int]] = None
+        for field, op, raw_values in filters:
+            index = self.field(field)
+            if op == "eq":
+                matched = index.match_eq(index.coerce(v) for v in raw_values)
+            else:
+                matched = set.intersection(*(index.match_range(op, index.coerce(v)) for v in raw_values))
+            candidates = matched if candidates is None else candidates & matched
+            if not candidates:
+                return 0, []
+
+        total = len(self.records) if candidates is None else len(candidates)
+        end = None if limit is None else offset + limit
+
+        if sort:
+            entries = self.field(sort.lstrip("-")).entries
+            # 降順はコピーせずに逆順にたどる
+            ordered = reversed(entries) if sort.startswith("-") else iter(entries)
+            seqs = (seq for _, seq in ordered if candidates is None or seq in candidates)
+            return total, [self.records[seq] for seq in islice(seqs, offset, end)]
+
+        if candidates is None:
+            return total, list(islice(self.records.values(), offset, end))
+        return total, [self.records[seq] for seq in sorted(candidates)[offset:end]]
+
+
+def parse_filters(params: Iterable[Tuple[str, str]]) -> List[Tuple[str, str, List[str]]]:
+    """クエリパラメータをフィルタ条件に変換 (rarity=Star5, sortOrder__gte=10 など)"""
+    grouped: Dict[Tuple[str, str], List[str]] = {}
+    for key, value in params:
+        field, _, op = key.partition("__")
+        if not op:
+            op = "eq"
+        elif op not in RANGE_OPERATORS:
+            raise ValueError(f"Unknown filter operator: {op}")
+        grouped.setdefault((field, op), []).append(value)
+    return [(field, op, values) for (field, op), values in grouped.items()]
+
+
+def project(records: List[Dict], fields: List[str]) -> List[Dict]:
+    """指定フィールドだけを取り出す"""
+    return [{f: r[f] for f in fields if f in r} for r in records]
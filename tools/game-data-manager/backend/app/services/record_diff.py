@@ -0,0 +1,19 @@
+"""レコード比較 - 正規化ハッシュとフィールド単位の差分"""
+import hashlib
+import json
+from typing import Any, Dict
+
+
+def record_hash(record: Dict) -> str:
+    """キー順を正規化したレコードのハッシュ"""
+    canonical = json.dumps(record, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def diff_fields(old: Dict, new: Dict) -> Dict[str, Dict[str, Any]]:
+    """トップレベルのフィールド単位で差分を取得"""
+    changes = {}
+    for key in old.keys() | new.keys():
+        if old.get(key) != new.get(key):
+            changes[key] = {"old": old.get(key), "new": new.get(key)}
+    return dict(sorted(changes.items()))
@@ -0,0 +1,80 @@
+"""参照インデックス - 変更のたびに更新する正引き・逆引き参照と未解決参照の集合"""
+from typing import Dict, List, Optional, Set, Tuple
+
+from .maintained_index import MaintainedIndex
+from .references import MISSING_BUCKETS, NODE_PREFIXES, ReferenceField, iter_references
+
+# (データタイプ, ID)
+RecordKey = Tuple[str, str]
+# (参照元データタイプ, 参照元ID, 参照フィールド)
+InboundKey = Tuple[str, str, str]
+
+
+class ReferenceIndex(MaintainedIndex):
+    """レコード間の参照を保持し、未解決の参照 (参照先が存在しない) を常に把握する"""
+
+    def __init__(self, id_fields: Dict[str, str]):
+        super().__init__(id_fields)
+        # 参照元 -> [(参照定義, 参照先ID)]
+        self._forward: Dict[RecordKey, List[Tuple[ReferenceField, str]]] = {}
+        # 参照先 -> {(参照元タイプ, 参照元ID, フィールド): 参照数}
+        self._reverse: Dict[RecordKey, Dict[InboundKey, int]] = {}
+        # 参照されているが存在しない参照先
+        self._missing: Set[RecordKey] = set()
+        self._report: Optional[Tuple[int, Dict[str, List[Dict]]]] = None
+
+    def _add(self, data_type: str, item_id: str, record: Dict) -> None:
+        self._missing.discard((data_type, item_id))
+        refs = list(iter_references(data_type, record))
+        if not refs:
+            return
+        self._forward[(data_type, item_id)] = refs
+        for ref, target_id in refs:
+            target = (ref.target, target_id)
+            inbound = self._reverse.setdefault(target, {})
+            key = (data_type, item_id, ref.field)
+            inbound[key] = inbound.get(key, 0) + 1
+            if target_id not in self._ids[ref.target]:
+                self._missing.add(target)
+
+    def _remove(self, data_type: str, item_id: str) -> None:
+        for ref, target_id in self._forward.pop((data_type, item_id), ()):
+            target = (ref.target, target_id)
+            inbound = self._reverse[target]
+            key = (data_type, item_id, ref.field)
+            inbound[key] -= 1
+            if not inbound[key]:
+                del inbound[key]
+            if not inbound:
+                del self._reverse[target]
+                self._missing.discard(target)
+        if (data_type, item_id) in self._reverse:
+            self._missing.add((data_type, item_id))
+
+    # ========================================
+    # 問い合わせ
+    # ========================================
+
+    def inbound(self, data_type: str, item_id: str) -> List[Tuple[str, str, str, int]]:
+        """レコードを参照している (参照元タイプ, 参照元ID, フィールド, 参照数) の一覧"""
+        with self._lock:
+            inbound = self._reverse.get((data_type, item_id), {})
+            return [(source, source_id, field, count) for (source, source_id, field), count in inbound.items()]
+
+    def report(self) -> Dict[str, List[Dict]]:
+        """未解決の参照を参照先タイプごとに分類して返す (変更が無ければ前回の結果を返す)"""
+        with self._lock:
+            if self._report is not None and self._report[0] == self.version:
+                return self._report[1]
+            errors: Dict[str, List[Dict]] = {bucket: [] for bucket in MISSING_BUCKETS.values()}
+            for target_type, target_id in sorted(self._missing):
+                bucket = errors[MISSING_BUCKETS[target_type]]
+                for (source, source_id, field), count in sorted(self._reverse[(target_type, target_id)].items()):
+                    entry = {
+                        "source": f"{NODE_PREFIXES[source]}:{source_id}",
+                        "field": field,
+                        "missing_id": target_id,
+                    }
+                    bucket.extend(dict(entry) for _ in range(count))
+            self._report = (self.version, errors)
+            return errors
@@ -0,0 +1,104 @@
+"""参照定義 - データタイプ間の参照フィールド"""
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+
+class ReferenceField(NamedTuple):
+    """参照フィールドの定義"""
+    source: str                 # 参照元データタイプ
+    field: str                  # 参照元フィールド (JSONのキー名)
+    target: str                 # 参照先データタイプ
+    key: Optional[str] = None   # オブジェクト配列の場合、要素内のIDキー
+    many: bool = False          # 配列かどうか
+
+
+REFERENCE_FIELDS: List[ReferenceField] = [
+    # アイテム
+    ReferenceField("items", "convertToItemId", "items"),
+    # アップグレード
+    ReferenceField("upgrades", "requiredUnlockItemId", "items"),
+    ReferenceField("upgrades", "prerequisiteUpgradeId", "upgrades"),
+    ReferenceField("upgrades", "requiredMaterials", "items", key="itemId", many=True),
+    ReferenceField("upgrades", "relatedStockId", "stocks"),
+    # ガチャ
+    ReferenceField("gacha_banners", "pool", "items", key="itemId", many=True),
+    ReferenceField("gacha_banners", "pickupItemIds", "items", many=True),
+    ReferenceField("gacha_banners", "prerequisiteBannerId", "gacha_banners"),
+    ReferenceField("gacha_banners", "requiredUnlockItemId", "items"),
+    # 企業・株式
+    ReferenceField("companies", "unlockKeyItemId", "items"),
+    ReferenceField("stocks", "companyId", "companies"),
+    ReferenceField("stock_prestiges", "targetStockId", "stocks"),
+    ReferenceField("market_events", "companyImpacts", "companies", key="companyId", many=True),
+    # ゲームイベント
+    ReferenceField("game_events", "prerequisiteEventId", "game_events"),
+    ReferenceField("game_events", "rewardItems", "items", key="itemId", many=True),
+]
+
+# データタイプ -> 整合性チェック結果などで使うノード名の接頭辞 ("item:xxx" など)
+NODE_PREFIXES: Dict[str, str] = {
+    "items": "item",
+    "upgrades": "upgrade",
+    "gacha_banners": "gacha",
+    "companies": "company",
+    "stocks": "stock",
+    "stock_prestiges": "stock_prestige",
+    "market_events": "market_event",
+    "game_events": "event",
+}
+
+# 参照先データタイプ -> 整合性チェック結果の分類
+MISSING_BUCKETS: Dict[str, str] = {
+    "items": "missing_items",
+    "upgrades": "missing_upgrades",
+    "companies": "missing_companies",
+    "stocks": "missing_stocks",
+    "game_events": "missing_events",
+    "gacha_banners": "missing_banners",
+}
+
+# 参照元データタイプ -> 参照フィールド一覧
+REFERENCES_BY_SOURCE: Dict[str, List[ReferenceField]] = {}
+for _ref in REFERENCE_FIELDS:
+    REFERENCES_BY_SOURCE.setdefault(_ref.source, []).append(_ref)
+
+
+def iter_references(data_type: str, record: Dict) -> Iterator[Tuple[ReferenceField, str]]:
+    """レコードが持つ参照を (参照定義, 参照先ID) で列挙"""
+    for ref in REFERENCES_BY_SOURCE.get(data_type, []):
+        value = record.get(ref.field)
+        if not value:
+            continue
+        values = value if ref.many else [value]
+        for v in values:
+            target_id = v.get(ref.key) if ref.key and isinstance(v, dict) else v
+            if target_id:
+                yield ref, target_id
+
+
+def rewrite_references(record: Dict, ref: ReferenceField, old_id: str, new_id: Optional[str]) -> int:
+    """レコード内の参照を付け替え (new_idがNoneなら参照を取り除く)、変更した参照数を返す"""
+    value = record.get(ref.field)
+    if not value:
+        return 0
+    if not ref.many:
+        if value != old_id:
+            return 0
+        if new_id is None:
+            del record[ref.field]
+        else:
+            record[ref.field] = new_id
+        return 1
+
+    rewritten = []
+    count = 0
+    for v in value:
+        target_id = v.get(ref.key) if ref.key and isinstance(v, dict) else v
+        if target_id != old_id:
+            rewritten.append(v)
+            continue
+        count += 1
+        if new_id is not None:
+            rewritten.append({**v, ref.key: new_id} if ref.key else new_id)
+    if count:
+        record[ref.field] = rewritten
+    return count
@@ -0,0 +1,143 @@
+"""全文検索 - 文字n-gramの転置インデックス (日本語も分かち書きなしで検索できる)"""
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .maintained_index import MaintainedIndex
+
+# 検索対象フィールド -> 重み (名前 > 説明文)
+SEARCH_FIELDS: Dict[str, float] = {
+    "displayName": 3.0,
+    "eventName": 3.0,
+    "bannerName": 3.0,
+    "description": 1.0,
+    "notificationText": 1.0,
+}
+# IDの重み
+ID_WEIGHT = 2.0
+# 転置インデックスのn-gram長
+NGRAM = 2
+
+# カタカナ -> ひらがな (表記ゆれを吸収)
+_KATA_TO_HIRA = {code: code - 0x60 for code in range(ord("ァ"), ord("ヶ") + 1)}
+
+# (データタイプ, ID)
+DocKey = Tuple[str, str]
+
+
+def normalize(text: str) -> str:
+    """検索用の正規化 (NFKCで全角/半角を統一、小文字化、カタカナをひらがなに)"""
+    return unicodedata.normalize("NFKC", text).lower().translate(_KATA_TO_HIRA)
+
+
+def ngrams(text: str) -> Set[str]:
+    """文字n-gram (n未満の短い文字列はそのまま)"""
+    if len(text) < NGRAM:
+        return {text} if text else set()
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+class SearchIndex(MaintainedIndex):
+    """全データタイプの名前・説明文の転置インデックス"""
+
+    def __init__(self, id_fields: Dict[str, str]):
+        super().__init__(id_fields)
+        # n-gram -> 含むドキュメント (1文字の検索用に1文字単位も持つ)
+        self._postings: Dict[str, Set[DocKey]] = {}
+        # ドキュメント -> [(フィールド, 正規化済みテキスト, 重み)]
+        self._docs: Dict[DocKey, List[Tuple[str, str, float]]] = {}
+        self._labels: Dict[DocKey, str] = {}
+
+    def _add(self, data_type: str, item_id: str, record: Dict) -> None:
+        key = (data_type, item_id)
+        fields = [(self._id_fields[data_type], normalize(str(item_id)), ID_WEIGHT)]
+        label = None
+        for field, weight in SEARCH_FIELDS.items():
+            value = record.get(field)
+            if isinstance(value, str) and value:
+                fields.append((field, normalize(value), weight))
+                if label is None and weight == max(SEARCH_FIELDS.values()):
+                    label = value
+        self._docs[key] = fields
+        self._labels[key] = label or str(item_id)
+        for gram in self._grams(fields):
+            self._postings.setdefault(gram, set()).add(key)
+
+    def _remove(self, data_type: str, item_id: str) -> None:
+        key = (data_type, item_id)
+        fields = self._docs.pop(key, None)
+        self._labels.pop(key, None)
+        if fields is None:
+            return
+        for gram in self._grams(fields):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(key)
+                if not posting:
+                    del self._postings[gram]
+
+    @staticmethod
+    def _grams(fields: Iterable[Tuple[str, str, float]]) -> Set[str]:
+        grams: Set[str] = set()
+        for _, text, _ in fields:
+            grams |= ngrams(text)
+            grams |= set(text)
+        return grams
+
+    def search(self, query: str, data_types: Optional[Iterable[str]] = None, limit: int = 20) -> List[Dict]:
+        """クエリを含むレコードをスコア順に返す (空白区切りの語はすべて含むものだけ)"""
+        terms = [normalize(term) for term in query.split()]
+        terms = [term for term in terms if term]
+        if not terms:
+            return []
+        allowed = set(data_types) if data_types else None
+
+        with self._lock:
+            candidates: Optional[Set[DocKey]] = None
+            # 出現数の少ないn-gramから絞り込む
+            grams = sorted({g for term in terms for g in ngrams(term)}, key=lambda g: len(self._postings.get(g, ())))
+            for gram in grams:
+                posting = self._postings.get(gram)
+                if not posting:
+                    return []
+                candidates = set(posting) if candidates is None else candidates & posting
+                if not candidates:
+                    return []
+
+            hits = []
+            for key in candidates:
+                if allowed is not None and key[0] not in allowed:
+                    continue
+                score, field = self._score(self._docs[key], terms)
+                if score:
+                    hits.append((score, key, field))
+            hits.sort(key=lambda hit: (-hit[0], hit[1]))
+            return [
+                {"type": key[0], "id": key[1], "label": self._labels[key], "field": field, "score": round(score, 3)}
+                for score, key, field in hits[:limit]
+            ]
+
+    @staticmethod
+    def _score(fields: List[Tuple[str, str, float]], terms: List[str]) -> Tuple[float, Optional[str]]:
+        """全語を含む場合のスコア (完全一致・前方一致・短いテキストほど高い) と最も効いたフィールド"""
+        total = 0.0
+        best_field, best = None, 0.0
+        for term in terms:
+            term_best = 0.0
+            for field, text, weight in fields:
+                pos = text.find(term)
+                if pos < 0:
+                    continue
+                score = weight * (1.0 + len(term) / len(text))
+                if text == term:
+                    score *= 2.0
+                elif pos == 0:
+                    score *= 1.5
+                if score > term_best:
+                    term_best = score
+                if score > best:
+                    best, best_field = score, field
+            if not term_best:
+                # n-gramは一致したが連続した文字列としては含まれない
+                return 0.0, None
+            total += term_best
+        return total, best_field
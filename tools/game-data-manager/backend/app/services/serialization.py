@@ -0,0 +1,82 @@
+"""レスポンス用シリアライズ - 高速JSONエンコードと圧縮済みバイト列のキャッシュ"""
+import gzip
+import json
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # orjsonが無ければ標準のjsonを使う
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # brotliが無ければgzipのみ
+    brotli = None
+
+# これより小さいレスポンスは圧縮しない (バイト)
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def dumps(obj: Any) -> bytes:
+    """JSONをUTF-8バイト列にエンコード"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def supported_encodings() -> Tuple[str, ...]:
+    """利用可能なContent-Encoding (優先順)"""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Accept-Encodingヘッダーから使うエンコーディングを選ぶ"""
+    if not accept_encoding:
+        return None
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.add(name.strip().lower())
+    for encoding in supported_encodings():
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+class SerializedBody:
+    """エンコード済みのJSON本体 (圧縮版は初回要求時に作って保持する)"""
+
+    def __init__(self, plain: bytes, revision: Any = None):
+        self.plain = plain
+        self.revision = revision
+        self._encoded: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+        """指定エンコーディングの本体を返す (小さい本体は圧縮しない)"""
+        if encoding is None or len(self.plain) < MIN_COMPRESS_SIZE:
+            return self.plain, None
+        data = self._encoded.get(encoding)
+        if data is None:
+            with self._lock:
+                data = self._encoded.get(encoding)
+                if data is None:
+                    data = self._encoded[encoding] = _compress(self.plain, encoding)
+        return data, encoding
+
+
+def join_object(fragments: Iterable[Tuple[str, bytes]]) -> bytes:
+    """エンコード済みの値から {"key": value, ...} のJSONを組み立てる"""
+    parts = [dumps(key) + b":" + value for key, value in fragments]
+    return b"{" + b",".join(parts) + b"}"
@@ -0,0 +1,501 @@
+"""ストレージバックエンド - データファイルの永続化方式"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ファイルの同一性判定用シグネチャ (mtime_ns, size)
+FileSignature = Tuple[int, int]
+
+
+def file_signature(file_path: Path) -> Optional[FileSignature]:
+    """ファイルのシグネチャを取得 (存在しなければNone)"""
+    try:
+        st = file_path.stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def content_hash(content: bytes) -> str:
+    """ファイル内容のハッシュ (外部変更の判定用)"""
+    return hashlib.blake2b(content).hexdigest()
+
+
+def file_hash(file_path: Path) -> Optional[str]:
+    """ファイル内容のハッシュ (存在しなければNone)"""
+    digest = hashlib.blake2b()
+    try:
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+def atomic_write_json(file_path: Path, data: List[Dict]) -> str:
+    """一時ファイル + renameでJSONをアトミックに書き込み、書いた内容のハッシュを返す"""
+    text = json.dumps(data, ensure_ascii=False, indent=2)
+    fd, tmp_name = tempfile.mkstemp(dir=file_path.parent, prefix=f".{file_path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, file_path)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+    # テキストモードでは改行がOSの改行コードで書かれる
+    return content_hash(text.replace("\n", os.linesep).encode("utf-8"))
+
+
+class JsonStorage:
+    """JSONファイル全体を書き換えるストレージ (既定)"""
+
+    def __init__(self, data_dir: Path, data_files: Dict[str, str], id_field_of: Callable[[str], str]):
+        self.data_dir = data_dir
+        self.data_files = data_files
+        self.id_field_of = id_field_of
+        # 最後に自分で読み書きした時点のシグネチャ (外部変更の検出用)
+        self.signatures: Dict[str, Optional[FileSignature]] = {}
+        # 最後に自分で読み書きした内容のハッシュ (touchされただけの変更を無視するため)
+        self.hashes: Dict[str, Optional[str]] = {}
+
+    def file_path(self, data_type: str) -> Path:
+        """データタイプに対応する正規JSONファイルのパス"""
+        return self.data_dir / self.data_files[data_type]
+
+    def _read_file(self, data_type: str) -> List[Dict]:
+        file_path = self.file_path(data_type)
+        if not file_path.exists():
+            self.signatures[data_type] = None
+            self.hashes[data_type] = None
+            return []
+        with open(file_path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            content = f.read()
+        self.signatures[data_type] = (st.st_mtime_ns, st.st_size)
+        self.hashes[data_type] = content_hash(content)
+        return json.loads(content.decode('utf-8'))
+
+    def _write_file(self, data_type: str, data: List[Dict]) -> None:
+        file_path = self.file_path(data_type)
+        self.hashes[data_type] = atomic_write_json(file_path, data)
+        self.signatures[data_type] = file_signature(file_path)
+
+    def load(self, data_type: str) -> List[Dict]:
+        """データを読み込み"""
+        return self._read_file(data_type)
+
+    def reload(self, data_type: str) -> List[Dict]:
+        """外部で書き換えられた正規JSONを読み込み (ファイルの内容を正とする)"""
+        return self.load(data_type)
+
+    def commit(self, data_type: str, data: List[Dict], changes: List[Dict]) -> None:
+        """変更を書き込み (changes: put/delレコード)"""
+        self._write_file(data_type, data)
+
+    def replace(self, data_type: str, data: List[Dict]) -> None:
+        """データ全体をアトミックに差し替え"""
+        self._write_file(data_type, data)
+
+    def close(self) -> None:
+        """終了処理"""
+
+
+class JournalStorage(JsonStorage):
+    """追記型ジャーナル + バックグラウンドコンパクションのストレージ
+
+    変更は journal/<type>.jsonl に1行ずつ追記し、一定間隔で正規JSONへ畳み込む。
+    起動時は正規JSON + ジャーナルを再生して復元する。
+    全体の差し替えは reset エントリとしてジャーナルに記録してから正規JSONを書くので、
+    途中で落ちても再生結果は差し替え後のデータになる。
+    """
+
+    def __init__(
+        self,
+        data_dir: Path,
+        data_files: Dict[str, str],
+        id_field_of: Callable[[str], str],
+        compact_interval: float = 5.0,
+    ):
+        super().__init__(data_dir, data_files, id_field_of)
+        self.journal_dir = data_dir / "journal"
+        self.journal_dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # 正規JSONの書き込みを直列化 (コンパクションと差し替えの競合防止)
+        self._file_lock = threading.Lock()
+        # コンパクション待ちのデータ (データタイプ -> 最新リストへの参照)
+        self._dirty: Dict[str, List[Dict]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if compact_interval > 0:
+            self._thread = threading.Thread(
+                target=self._compact_loop, args=(compact_interval,),
+                name="journal-compactor", daemon=True,
+            )
+            self._thread.start()
+
+    def _journal_path(self, data_type: str) -> Path:
+        return self.journal_dir / f"{data_type}.jsonl"
+
+    def _compacting_path(self, data_type: str) -> Path:
+        return self.journal_dir / f"{data_type}.compacting.jsonl"
+
+    # ========================================
+    # 読み込み (ジャーナル再生)
+    # ========================================
+
+    def load(self, data_type: str) -> List[Dict]:
+        data = self._read_file(data_type)
+        id_field = self.id_field_of(data_type)
+        index: Dict[str, int] = {}
+        for i, d in enumerate(data):
+            index.setdefault(d.get(id_field), i)
+
+        replayed = False
+        for path in (self._compacting_path(data_type), self._journal_path(data_type)):
+            for entry in self._read_journal(path):
+                self._apply(data, index, id_field, entry)
+                replayed = True
+
+        if replayed:
+            with self._lock:
+                self._dirty[data_type] = data
+        return data
+
+    def reload(self, data_type: str) -> List[Dict]:
+        """外部で書き換えられた正規JSONを読み込み
+
+        未反映のジャーナルは書き換え前のファイルに対する変更なので、再生せずに破棄する
+        (再生すると外部で追加し直したレコードが古い del で消えるなど、外部の変更を上書きしてしまう)。
+        """
+        with self._file_lock, self._lock:
+            discarded = sum(
+                len(self._read_journal(path))
+                for path in (self._compacting_path(data_type), self._journal_path(data_type))
+            )
+            if discarded:
+                logger.warning("discarding %d journal entries for %s (file changed on disk)", discarded, data_type)
+            self._dirty.pop(data_type, None)
+            self._compacting_path(data_type).unlink(missing_ok=True)
+            self._journal_path(data_type).unlink(missing_ok=True)
+            return self._read_file(data_type)
+
+    def _read_journal(self, path: Path) -> List[Dict]:
+        """ジャーナルを読み込み (書き込み途中の末尾行は切り捨て)"""
+        if not path.exists():
+            return []
+        entries = []
+        valid_size = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    break
+                valid_size += len(line)
+        if valid_size != path.stat().st_size:
+            with open(path, 'r+b') as f:
+                f.truncate(valid_size)
+        return entries
+
+    @staticmethod
+    def _apply(data: List[Dict], index: Dict[str, int], id_field: str, entry: Dict) -> None:
+        """ジャーナル1件をリストに適用 (冪等)"""
+        if entry.get("op") == "reset":
+            # それ以前のエントリは差し替えで無効
+            data[:] = entry["data"]
+            index.clear()
+            for i, d in enumerate(data):
+                index.setdefault(d.get(id_field), i)
+            return
+
+        item_id = entry.get("id")
+        if entry.get("op") == "del":
+            pos = index.pop(item_id, None)
+            if pos is not None:
+                data.pop(pos)
+                for i in range(pos, len(data)):
+                    index[data[i].get(id_field)] = i
+            return
+
+        record = entry["data"]
+        prev = entry.get("prev", item_id)
+        pos = index.get(prev)
+        if pos is None:
+            pos = index.get(item_id)
+        if pos is None:
+            data.append(record)
+            index[item_id] = len(data) - 1
+        else:
+            index.pop(prev, None)
+            data[pos] = record
+            index[item_id] = pos
+
+    # ========================================
+    # 書き込み
+    # ========================================
+
+    def _append(self, data_type: str, entries: List[Dict]) -> None:
+        """ジャーナルに追記してfsync (呼び出し側で self._lock を保持)"""
+        payload = "".join(
+            json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+            for entry in entries
+        ).encode("utf-8")
+        with open(self._journal_path(data_type), 'ab') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def commit(self, data_type: str, data: List[Dict], changes: List[Dict]) -> None:
+        with self._lock:
+            self._append(data_type, changes)
+            self._dirty[data_type] = data
+            # 畳み込むまで正規JSONは最新の内容ではない
+            self.hashes[data_type] = None
+
+    def replace(self, data_type: str, data: List[Dict]) -> None:
+        with self._file_lock, self._lock:
+            # 先に差し替えをジャーナルに記録する (正規JSONの書き込み後・ジャーナル削除前に落ちても
+            # 再生は reset で終わるので、古いエントリが差し替え後のデータに適用されることはない)
+            self._append(data_type, [{"op": "reset", "data": data}])
+            self._write_file(data_type, data)
+            # 差し替え前のジャーナルは不要
+            self._dirty.pop(data_type, None)
+            self._journal_path(data_type).unlink(missing_ok=True)
+            self._compacting_path(data_type).unlink(missing_ok=True)
+
+    # ========================================
+    # コンパクション
+    # ========================================
+
+    def compact(self, data_type: Optional[str] = None) -> None:
+        """ジャーナルを正規JSONへ畳み込む"""
+        with self._file_lock:
+            with self._lock:
+                targets = [data_type] if data_type else list(self._dirty)
+                pending = []
+                for t in targets:
+                    data = self._dirty.pop(t, None)
+                    if data is None:
+                        continue
+                    journal = self._journal_path(t)
+                    compacting = self._compacting_path(t)
+                    # 畳み込み中の追記は新しいジャーナルへ
+                    if journal.exists() and not compacting.exists():
+                        os.replace(journal, compacting)
+                    pending.append((t, list(data)))
+
+            for t, snapshot in pending:
+                self._write_file(t, snapshot)
+                self._compacting_path(t).unlink(missing_ok=True)
+
+    def _compact_loop(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            self.compact()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.compact()
+
+
+class SqliteStorage(JsonStorage):
+    """SQLiteファイルに1レコード1行で保存するストレージ
+
+    レコードはJSON文字列として (データタイプ, ID) を主キーに保存する。
+    Unity向けの正規JSONは一定間隔でバックグラウンド出力する。
+    正規JSONが外部で書き換えられていた場合は、読み込み時にそちらを取り込む。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS records (
+        data_type TEXT NOT NULL,
+        id TEXT NOT NULL,
+        pos INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (data_type, id)
+    );
+    CREATE INDEX IF NOT EXISTS records_pos ON records (data_type, pos);
+    CREATE TABLE IF NOT EXISTS files (
+        data_type TEXT PRIMARY KEY,
+        mtime_ns INTEGER,
+        size INTEGER,
+        dirty INTEGER NOT NULL DEFAULT 0
+    );
+    """
+
+    def __init__(
+        self,
+        data_dir: Path,
+        data_files: Dict[str, str],
+        id_field_of: Callable[[str], str],
+        export_interval: float = 5.0,
+        db_name: str = "game_data.sqlite3",
+    ):
+        super().__init__(data_dir, data_files, id_field_of)
+        self._conn = sqlite3.connect(data_dir / db_name, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._lock = threading.Lock()
+        # 正規JSONの出力待ちデータタイプ (files.dirty にも記録し、出力前に終了しても次回起動時に出力する)
+        self._dirty: set = set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if export_interval > 0:
+            self._thread = threading.Thread(
+                target=self._export_loop, args=(export_interval,),
+                name="sqlite-exporter", daemon=True,
+            )
+            self._thread.start()
+
+    # ========================================
+    # 読み込み
+    # ========================================
+
+    def load(self, data_type: str) -> List[Dict]:
+        file_path = self.file_path(data_type)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT mtime_ns, size, dirty FROM files WHERE data_type = ?", (data_type,)
+            ).fetchone()
+            signature = file_signature(file_path)
+            if signature is not None and (row is None or tuple(row[:2]) != signature):
+                # 正規JSONが新しい (初回 or 外部で書き換え) → 取り込む
+                data = self._read_file(data_type)
+                with self._conn:
+                    self._replace_rows(data_type, data)
+                    self._record_file(data_type)
+                self._dirty.discard(data_type)
+                return data
+
+            rows = self._conn.execute(
+                "SELECT data FROM records WHERE data_type = ? ORDER BY pos", (data_type,)
+            ).fetchall()
+            self.signatures[data_type] = signature
+            self.hashes[data_type] = file_hash(file_path)
+            if (row is not None and row[2]) or (signature is None and rows):
+                # 前回の出力前に終了した、または正規JSONが無い → 次の出力で書き出す
+                self._dirty.add(data_type)
+            return [json.loads(r[0]) for r in rows]
+
+    # ========================================
+    # 書き込み
+    # ========================================
+
+    def commit(self, data_type: str, data: List[Dict], changes: List[Dict]) -> None:
+        with self._lock, self._conn:
+            for change in changes:
+                if change["op"] == "del":
+                    self._delete_row(data_type, change["id"])
+                else:
+                    self._put_row(data_type, change["id"], change["data"], change.get("prev"))
+            self._conn.execute(
+                "INSERT INTO files (data_type, dirty) VALUES (?, 1) "
+                "ON CONFLICT (data_type) DO UPDATE SET dirty = 1",
+                (data_type,),
+            )
+            self._dirty.add(data_type)
+            # 出力するまで正規JSONは最新の内容ではない
+            self.hashes[data_type] = None
+
+    def replace(self, data_type: str, data: List[Dict]) -> None:
+        with self._lock:
+            with self._conn:
+                self._replace_rows(data_type, data)
+            self._write_file(data_type, data)
+            with self._conn:
+                self._record_file(data_type)
+            self._dirty.discard(data_type)
+
+    def _put_row(self, data_type: str, item_id: str, record: Dict, prev: Optional[str]) -> None:
+        old_id = prev or item_id
+        row = self._conn.execute(
+            "SELECT pos FROM records WHERE data_type = ? AND id = ?", (data_type, old_id)
+        ).fetchone()
+        if row is None:
+            pos = self._conn.execute(
+                "SELECT COALESCE(MAX(pos), -1) + 1 FROM records WHERE data_type = ?", (data_type,)
+            ).fetchone()[0]
+        else:
+            pos = row[0]
+            self._delete_row(data_type, old_id)
+        self._insert_row(data_type, item_id, pos, record)
+
+    def _insert_row(self, data_type: str, item_id: str, pos: int, record: Dict) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO records (data_type, id, pos, data) VALUES (?, ?, ?, ?)",
+            (data_type, item_id, pos, json.dumps(record, ensure_ascii=False, separators=(",", ":"))),
+        )
+
+    def _delete_row(self, data_type: str, item_id: str) -> None:
+        self._conn.execute("DELETE FROM records WHERE data_type = ? AND id = ?", (data_type, item_id))
+
+    def _replace_rows(self, data_type: str, data: List[Dict]) -> None:
+        self._conn.execute("DELETE FROM records WHERE data_type = ?", (data_type,))
+        id_field = self.id_field_of(data_type)
+        for pos, record in enumerate(data):
+            self._insert_row(data_type, record.get(id_field), pos, record)
+
+    def _record_file(self, data_type: str) -> None:
+        """正規JSONのシグネチャを記録し、出力済みにする (次回読み込み時の外部変更検出用)"""
+        signature = self.signatures.get(data_type)
+        if signature is None:
+            self._conn.execute("DELETE FROM files WHERE data_type = ?", (data_type,))
+        else:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (data_type, mtime_ns, size, dirty) VALUES (?, ?, ?, 0)",
+                (data_type, *signature),
+            )
+
+    # ========================================
+    # 正規JSONの出力
+    # ========================================
+
+    def export(self, data_type: Optional[str] = None) -> None:
+        """SQLiteの内容を正規JSONへ書き出す"""
+        with self._lock:
+            targets = [data_type] if data_type else sorted(self._dirty)
+            for t in targets:
+                rows = self._conn.execute(
+                    "SELECT data FROM records WHERE data_type = ? ORDER BY pos", (t,)
+                ).fetchall()
+                self._write_file(t, [json.loads(r[0]) for r in rows])
+                with self._conn:
+                    self._record_file(t)
+                self._dirty.discard(t)
+
+    def _export_loop(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            self.export()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.export()
+        self._conn.close()
+
+
+# ストレージ方式の登録
+STORAGE_BACKENDS = {
+    "json": JsonStorage,
+    "journal": JournalStorage,
+    "sqlite": SqliteStorage,
+}
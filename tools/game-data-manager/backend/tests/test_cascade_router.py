@@ -0,0 +1,40 @@
+"""カスケード改名・削除APIのステータスコードのテスト"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routers.data_router import router
+from app.services import data_service
+from app.services.data_service import DataService
+
+
+def _item(item_id):
+    return {"id": item_id, "displayName": item_id, "type": "Material", "rarity": "Star1"}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    service = DataService(str(tmp_path), "json")
+    service.create("items", _item("a"))
+    service.create("items", _item("b"))
+    monkeypatch.setattr(data_service, "_service", service)
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
+
+
+def test_cascade_missing_record_is_404(client):
+    assert client.delete("/api/data/items/missing", params={"cascade": True}).status_code == 404
+    assert client.post("/api/data/items/missing/rename", json={"newId": "c"}).status_code == 404
+
+
+def test_rename_conflict_is_400(client):
+    assert client.post("/api/data/items/a/rename", json={"newId": "b"}).status_code == 400
+    assert client.post("/api/data/items/a/rename", json={}).status_code == 400
+
+
+def test_rename_and_cascade_delete(client):
+    response = client.post("/api/data/items/a/rename", json={"newId": "c"})
+    assert response.status_code == 200
+    assert response.json()["id"] == "c"
+    assert client.delete("/api/data/items/c", params={"cascade": True}).status_code == 200
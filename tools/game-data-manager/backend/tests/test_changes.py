@@ -0,0 +1,36 @@
+"""変更差分 (/changes) のテスト"""
+from app.services.data_service import DataService
+
+
+def _item(item_id):
+    return {"id": item_id, "displayName": item_id, "type": "Material", "rarity": "Star1"}
+
+
+def test_changes_after_restart_require_full_resync(tmp_path):
+    service = DataService(str(tmp_path), "json")
+    for n in range(3):
+        service.create("items", _item(f"i{n}"))
+    before = service.get_changes(0)
+    assert before["full_resync"] is False
+    instance, since = before["instance"], before["seq"]
+
+    # 再起動後、シーケンスが以前の値を超えるまで変更される
+    restarted = DataService(str(tmp_path), "json")
+    for n in range(5):
+        restarted.create("items", _item(f"j{n}"))
+    assert restarted.changelog.seq > since
+
+    changes = restarted.get_changes(since, instance)
+    assert changes["full_resync"] is True
+    assert changes["instance"] == restarted.instance_id
+
+
+def test_changes_with_matching_instance(tmp_path):
+    service = DataService(str(tmp_path), "json")
+    service.create("items", _item("a"))
+    first = service.get_changes(0)
+    service.create("items", _item("b"))
+
+    changes = service.get_changes(first["seq"], first["instance"])
+    assert changes["full_resync"] is False
+    assert [r["id"] for r in changes["changes"]["items"]["upserted"]] == ["b"]
@@ -0,0 +1,56 @@
+"""外部でのデータファイル書き換えのテスト"""
+import json
+
+import pytest
+
+from app.services.data_service import DataService
+from app.services.file_watcher import DataFileWatcher
+
+
+def _item(item_id):
+    return {"id": item_id, "displayName": item_id, "type": "Material", "rarity": "Star1"}
+
+
+@pytest.fixture
+def journal_service(tmp_path):
+    service = DataService(str(tmp_path), "journal")
+    # バックグラウンドのコンパクションを止め、ジャーナルに未反映の変更を残す
+    service._storage._stop.set()
+    service._storage._thread.join()
+    yield service
+    service.close()
+
+
+def test_external_rewrite_discards_pending_journal(journal_service, tmp_path):
+    service = journal_service
+    service.create("items", _item("a"))
+    service._storage.compact("items")
+    service.delete("items", "a")  # 畳み込まれずジャーナルに残る
+
+    # Unity側で a を戻し、b を追加して書き換える
+    (tmp_path / "items.json").write_text(
+        json.dumps([_item("a"), _item("b")], ensure_ascii=False), encoding="utf-8"
+    )
+    DataFileWatcher(service).poll()
+
+    assert [r["id"] for r in service.get_all("items")] == ["a", "b"]
+    assert not service._storage._journal_path("items").exists()
+
+    # 再起動しても古いジャーナルは再生されない
+    restarted = DataService(str(tmp_path), "journal")
+    try:
+        assert [r["id"] for r in restarted.get_all("items")] == ["a", "b"]
+    finally:
+        restarted.close()
+
+
+@pytest.mark.parametrize("mode", ["json", "sqlite"])
+def test_external_rewrite_is_reloaded(tmp_path, mode):
+    service = DataService(str(tmp_path), mode)
+    try:
+        service.create("items", _item("a"))
+        (tmp_path / "items.json").write_text(json.dumps([_item("b")]), encoding="utf-8")
+        DataFileWatcher(service).poll()
+        assert [r["id"] for r in service.get_all("items")] == ["b"]
+    finally:
+        service.close()
@@ -0,0 +1,31 @@
+"""画像ストアのテスト"""
+from app.services.image_store import ImageStore
+
+
+def test_digest_memo_is_bounded(tmp_path):
+    store = ImageStore(tmp_path, digest_cache_size=2)
+    paths = []
+    for n in range(4):
+        path = tmp_path / f"{n}.png"
+        path.write_bytes(bytes([n]) * 10)
+        paths.append(path)
+        store.digest(path)
+    assert len(store._digests) == 2
+    # 忘れたファイルも再計算で同じハッシュになる
+    assert store.digest(paths[0]) == store.digest(paths[0])
+    assert len(store._digests) == 2
+
+
+def test_remove_forgets_digests(tmp_path):
+    store = ImageStore(tmp_path)
+    (tmp_path / "items").mkdir()
+    for name, content in (("a.png", b"a"), ("b.png", b"b")):
+        writer = store.begin_upload()
+        writer.write(content)
+        store.commit_upload("items", name, writer)
+        store.digest(tmp_path / "items" / name)
+    assert store._digests
+
+    store.remove("items", "a.png")
+    store.remove("items", "b.png")
+    assert not store._digests
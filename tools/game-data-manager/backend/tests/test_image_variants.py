@@ -0,0 +1,64 @@
+"""画像バリアントのテスト"""
+import asyncio
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip("PIL")
+
+from app.services.image_variants import ImageVariants, VariantError  # noqa: E402
+
+
+class InlineExecutor:
+    """submit した時点で実行を終える (完了済みのFutureを返す) Executor"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def _get_in_thread(variants, source, timeout=5.0):
+    """別スレッドで get を実行し、(結果, 例外) を返す (固まったら失敗)"""
+    result = {}
+
+    def run():
+        try:
+            result["value"] = asyncio.run(variants.get(source, "corrupt", 64, None, "webp"))
+        except Exception as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "variant request deadlocked"
+    return result.get("value"), result.get("error")
+
+
+def test_corrupt_source_twice_does_not_deadlock(tmp_path):
+    source = tmp_path / "broken.png"
+    source.write_bytes(b"\x89PNG\r\n\x1a\nnot really a png")
+    variants = ImageVariants(tmp_path / "images")
+    # 変換が即座に失敗して完了済みになる状況を再現する
+    variants._pool = InlineExecutor()
+
+    for _ in range(2):
+        value, error = _get_in_thread(variants, source)
+        assert value is None
+        assert isinstance(error, VariantError)
+    assert variants._pending == {}
+
+
+def test_corrupt_source_twice_with_worker_pool(tmp_path):
+    source = tmp_path / "broken.png"
+    source.write_bytes(b"garbage")
+    variants = ImageVariants(tmp_path / "images")
+
+    for _ in range(2):
+        _, error = _get_in_thread(variants, source)
+        assert isinstance(error, VariantError)
+    assert variants._pending == {}
@@ -0,0 +1,60 @@
+"""ストリーミングインポートのテスト"""
+import io
+import json
+import zipfile
+
+import pytest
+
+from app.services.data_service import BulkValidationError, DataService
+from app.services.importer import ImportJob, StreamingImport
+
+
+def _item(item_id):
+    return {"id": item_id, "displayName": item_id, "type": "Material", "rarity": "Star1"}
+
+
+def _run(service, format, body):
+    job = ImportJob("job", format)
+    importer = StreamingImport(service, job)
+    try:
+        importer.feed(body)
+        with pytest.raises(BulkValidationError):
+            importer.finish()
+    finally:
+        importer.close()
+    return job.to_dict()
+
+
+def test_error_positions_are_one_based_in_both_formats(tmp_path):
+    service = DataService(str(tmp_path), "json")
+    items = [_item("a"), {"id": "b"}, _item("c")]
+
+    lines = [json.dumps({"type": "items", "data": item}) for item in items]
+    ndjson = _run(service, "ndjson", "\n".join(lines).encode())
+    assert (ndjson["positionUnit"], ndjson["positionBase"]) == ("line", 1)
+    assert [e["position"] for e in ndjson["errors"]] == [2]
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as archive:
+        archive.writestr("items.json", json.dumps(items))
+    zipped = _run(service, "zip", buf.getvalue())
+    assert (zipped["positionUnit"], zipped["positionBase"]) == ("entry", 1)
+    assert [(e["file"], e["position"]) for e in zipped["errors"]] == [("items.json", 2)]
+
+
+def test_unhashable_id_is_a_row_error(tmp_path):
+    service = DataService(str(tmp_path), "json")
+    service.create("items", _item("a"))
+    bad = {**_item("x"), "id": ["x"]}
+
+    lines = [json.dumps({"type": "items", "data": item}) for item in (bad, _item("b"))]
+    job = _run(service, "ndjson", "\n".join(lines).encode())
+    assert [(e["position"], e["id"]) for e in job["errors"]] == [(1, ["x"])]
+
+    diff = service.diff_all({"items": [_item("a"), bad, {**_item("y"), "id": {"k": 1}}]})["items"]
+    assert [e["index"] for e in diff["errors"]] == [1, 2]
+    assert diff["unchanged"] == 1
+
+    with pytest.raises(BulkValidationError) as e:
+        service.bulk_create("items", [bad, _item("b")])
+    assert [err["index"] for err in e.value.errors] == [0]
@@ -7,8 +7,11 @@ import { CompaniesPage } from './pages/CompaniesPage'
 import { EventsPage } from './pages/EventsPage'
 import { GraphPage } from './pages/GraphPage'
 import { ValidationPage } from './pages/ValidationPage'
+import { useDataEvents } from './hooks/useDataQuery'
 
 function App() {
+  useDataEvents()
+
   return (
     <Routes>
       <Route path="/" element={<Layout />}>
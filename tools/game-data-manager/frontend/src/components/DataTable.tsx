@@ -1,5 +1,12 @@
-import { useState } from 'react';
+import { useEffect, useState } from 'react';
 import clsx from 'clsx';
+import { useSearch } from '../hooks/useDataQuery';
+import type { DataType } from '../types';
+
+// 入力が止まってからサーバー検索するまでの時間
+const SEARCH_DEBOUNCE_MS = 250;
+// サーバー検索で取得する最大件数
+const SEARCH_LIMIT = 200;
 
 interface Column<T> {
   key: keyof T | string;
@@ -15,6 +22,8 @@ interface DataTableProps<T> {
   onEdit?: (item: T) => void;
   onDelete?: (id: string) => void;
   onRowClick?: (item: T) => void;
+  // 指定するとサーバーの横断検索 (表記ゆれを吸収) の結果も検索に使う
+  searchType?: DataType;
 }
 
 export function DataTable<T extends Record<string, unknown>>({
@@ -24,12 +33,28 @@ export function DataTable<T extends Record<string, unknown>>({
   onEdit,
   onDelete,
   onRowClick,
+  searchType,
 }: DataTableProps<T>) {
   const [sortKey, setSortKey] = useState<string | null>(null);
   const [sortAsc, setSortAsc] = useState(true);
   const [filter, setFilter] = useState('');
+  const [query, setQuery] = useState('');
+
+  useEffect(() => {
+    const timer = setTimeout(() => setQuery(filter.trim()), SEARCH_DEBOUNCE_MS);
+    return () => clearTimeout(timer);
+  }, [filter]);
+
+  const { data: hits } = useSearch(
+    searchType ? query : '',
+    searchType ? [searchType] : undefined,
+    SEARCH_LIMIT
+  );
+  const hitIds = new Set(hits?.map((hit) => hit.id));
 
+  // 表示中の値での部分一致か、サーバー検索の結果に含まれる行
   const filteredData = data.filter((item) =>
+    hitIds.has(String(item[idField])) ||
     Object.values(item).some((val) =>
       String(val).toLowerCase().includes(filter.toLowerCase())
     )
@@ -5,9 +5,18 @@ import { Button } from './Button';
 interface ImageInfo {
   name: string;
   path: string;
+  // 内容ハッシュ付きURL (ブラウザが長期間キャッシュできる)
+  url: string;
   size: number;
+  width: number | null;
+  height: number | null;
+  hash: string;
+  mtime: number;
 }
 
+// 一覧のプレビューは縮小版を使う (元画像が大きくても軽く表示する)
+const THUMBNAIL_QUERY = 'w=128&format=webp';
+
 interface ImagePickerProps {
   value?: string;
   onChange: (path: string | undefined) => void;
@@ -145,8 +154,9 @@ export function ImagePicker({ value, onChange, category, label = '画像' }: Ima
                   `}
                 >
                   <img
-                    src={img.path}
+                    src={`${img.url}&${THUMBNAIL_QUERY}`}
                     alt={img.name}
+                    loading="lazy"
                     className="w-full h-full object-cover"
                   />
                   {value === img.path && (
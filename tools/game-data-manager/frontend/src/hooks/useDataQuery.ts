@@ -1,6 +1,41 @@
+import { useEffect } from 'react';
 import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query';
 import * as api from '../utils/api';
-import type { DataType } from '../types';
+import type { DataChangeEvent, DataType, GraphNeighborhoodParams } from '../types';
+
+// データ変更の通知を購読し、変更されたタイプに依存するクエリを無効化する
+// (アプリ全体で1回だけ呼ぶ。接続中はキャッシュが古くならないので定期的な再取得は不要)
+export function useDataEvents() {
+  const queryClient = useQueryClient();
+
+  useEffect(() => {
+    const source = new EventSource(api.DATA_EVENTS_URL);
+    let disconnected = false;
+
+    const handleChange = (e: MessageEvent<string>) => {
+      const event: DataChangeEvent = JSON.parse(e.data);
+      queryClient.invalidateQueries({ queryKey: [event.type] });
+      // 横断的なクエリは全タイプのデータに依存する
+      queryClient.invalidateQueries({ queryKey: ['search'] });
+      queryClient.invalidateQueries({ queryKey: ['graph'] });
+      queryClient.invalidateQueries({ queryKey: ['validation'] });
+    };
+
+    source.addEventListener('mutation', handleChange);
+    source.addEventListener('resync', handleChange);
+    source.onerror = () => {
+      disconnected = true;
+    };
+    source.onopen = () => {
+      // 切断中の変更は届かないので、再接続したら全て取り直す
+      if (disconnected) {
+        disconnected = false;
+        queryClient.invalidateQueries();
+      }
+    };
+    return () => source.close();
+  }, [queryClient]);
+}
 
 export function useDataList<T>(dataType: DataType) {
   return useQuery({
@@ -23,6 +58,7 @@ export function useCreateData<T>(dataType: DataType) {
     mutationFn: (item: Partial<T>) => api.create<T>(dataType, item),
     onSuccess: () => {
       queryClient.invalidateQueries({ queryKey: [dataType] });
+      queryClient.invalidateQueries({ queryKey: ['search'] });
     },
   });
 }
@@ -34,6 +70,7 @@ export function useUpdateData<T>(dataType: DataType) {
       api.update<T>(dataType, id, item),
     onSuccess: () => {
       queryClient.invalidateQueries({ queryKey: [dataType] });
+      queryClient.invalidateQueries({ queryKey: ['search'] });
     },
   });
 }
@@ -44,6 +81,7 @@ export function useDeleteData(dataType: DataType) {
     mutationFn: (id: string) => api.deleteItem(dataType, id),
     onSuccess: () => {
       queryClient.invalidateQueries({ queryKey: [dataType] });
+      queryClient.invalidateQueries({ queryKey: ['search'] });
     },
   });
 }
@@ -55,9 +93,26 @@ export function useValidation() {
   });
 }
 
-export function useDependencyGraph() {
+export function useSearch(q: string, types?: DataType[], limit?: number) {
+  return useQuery({
+    queryKey: ['search', q, types, limit],
+    queryFn: () => api.search(q, types, limit),
+    enabled: q.length > 0,
+  });
+}
+
+export function useDependencyGraph(enabled = true) {
   return useQuery({
     queryKey: ['graph'],
     queryFn: api.getDependencyGraph,
+    enabled,
+  });
+}
+
+export function useGraphNeighborhood(node: string | null, params: GraphNeighborhoodParams = {}) {
+  return useQuery({
+    queryKey: ['graph', 'neighborhood', node, params],
+    queryFn: () => api.getGraphNeighborhood(node as string, params),
+    enabled: !!node,
   });
 }
@@ -8,7 +8,9 @@ import './index.css'
 const queryClient = new QueryClient({
   defaultOptions: {
     queries: {
-      staleTime: 1000 * 60, // 1分
+      // 変更はServer-Sent Eventsで通知されるので (useDataEvents)、時間やフォーカスでは再取得しない
+      staleTime: Infinity,
+      refetchOnWindowFocus: false,
       retry: 1,
     },
   },
@@ -133,6 +133,7 @@ export function CompaniesPage() {
         data={companies}
         columns={columns}
         idField="id"
+        searchType="companies"
         onEdit={openEditModal}
         onDelete={(id) => deleteMutation.mutate(id)}
       />
@@ -128,6 +128,7 @@ export function EventsPage() {
         data={events}
         columns={columns}
         idField="eventId"
+        searchType="game_events"
         onEdit={openEditModal}
         onDelete={(id) => deleteMutation.mutate(id)}
       />
@@ -127,6 +127,7 @@ export function GachaPage() {
         data={banners}
         columns={columns}
         idField="bannerId"
+        searchType="gacha_banners"
         onEdit={openEditModal}
         onDelete={(id) => deleteMutation.mutate(id)}
       />
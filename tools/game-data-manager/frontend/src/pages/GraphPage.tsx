@@ -1,5 +1,6 @@
-import { useRef, useEffect, useCallback } from 'react';
-import { useDependencyGraph } from '../hooks/useDataQuery';
+import { useRef, useEffect, useCallback, useState } from 'react';
+import { useDependencyGraph, useGraphNeighborhood, useSearch } from '../hooks/useDataQuery';
+import type { DataType, GraphNode, GraphNeighborhoodNode, GraphNeighborhoodParams } from '../types';
 
 // グラフの色設定
 const NODE_COLORS: Record<string, string> = {
@@ -18,12 +19,98 @@ const EDGE_COLORS: Record<string, string> = {
   reward: '#a78bfa',
 };
 
+type GraphDirection = NonNullable<GraphNeighborhoodParams['direction']>;
+
+const DIRECTION_LABELS: Record<GraphDirection, string> = {
+  both: '両方向',
+  out: '参照先',
+  in: '参照元',
+};
+
+const DEPTH_OPTIONS = [1, 2, 3, 4, 5];
+
+// グラフのノードになるデータタイプ -> ノードIDの接頭辞
+const GRAPH_NODE_PREFIXES: Partial<Record<DataType, string>> = {
+  items: 'item',
+  upgrades: 'upgrade',
+  gacha_banners: 'gacha',
+  companies: 'company',
+  game_events: 'event',
+};
+
+const GRAPH_NODE_TYPES = Object.keys(GRAPH_NODE_PREFIXES) as DataType[];
+
+// 入力が止まってから検索するまでの時間
+const SEARCH_DEBOUNCE_MS = 250;
+
+// 描画するノード (周辺表示では起点からの距離と未定義フラグが付く)
+type DrawNode = GraphNode & Partial<Pick<GraphNeighborhoodNode, 'depth' | 'missing'>>;
+
+interface PositionedNode extends DrawNode {
+  x: number;
+  y: number;
+}
+
+// クリック判定の半径
+const HIT_RADIUS = 10;
+
+// 全体表示は円形、周辺表示は起点からの距離ごとの同心円に配置
+function layoutNodes(nodes: DrawNode[], width: number, height: number, focused: boolean): PositionedNode[] {
+  const radius = Math.min(width, height) * 0.4;
+  if (!focused) {
+    return nodes.map((node, i) => {
+      const angle = (2 * Math.PI * i) / nodes.length;
+      return {
+        ...node,
+        x: width / 2 + radius * 0.875 * Math.cos(angle),
+        y: height / 2 + radius * 0.875 * Math.sin(angle),
+      };
+    });
+  }
+
+  const rings = new Map<number, DrawNode[]>();
+  nodes.forEach((node) => {
+    const depth = node.depth ?? 0;
+    rings.set(depth, [...(rings.get(depth) || []), node]);
+  });
+  const maxDepth = Math.max(1, ...rings.keys());
+  return [...rings.entries()].flatMap(([depth, ring]) =>
+    ring.map((node, i) => {
+      const angle = (2 * Math.PI * i) / ring.length;
+      const r = (radius * depth) / maxDepth;
+      return {
+        ...node,
+        x: width / 2 + r * Math.cos(angle),
+        y: height / 2 + r * Math.sin(angle),
+      };
+    })
+  );
+}
+
 export function GraphPage() {
-  const { data: graph, isLoading, error } = useDependencyGraph();
+  // 起点ノード (選ぶまでは部分グラフも取得しない)
+  const [focus, setFocus] = useState<string | null>(null);
+  const [depth, setDepth] = useState(1);
+  const [direction, setDirection] = useState<GraphDirection>('both');
+  // 全体グラフは明示的に選んだときだけ取得する
+  const [showAll, setShowAll] = useState(false);
+  const [filter, setFilter] = useState('');
+  const [query, setQuery] = useState('');
+
+  useEffect(() => {
+    const timer = setTimeout(() => setQuery(filter.trim()), SEARCH_DEBOUNCE_MS);
+    return () => clearTimeout(timer);
+  }, [filter]);
+
+  const { data: hits = [] } = useSearch(query, GRAPH_NODE_TYPES);
+  const fullGraph = useDependencyGraph(showAll && !focus);
+  const neighborhood = useGraphNeighborhood(focus, { depth, direction });
+  const { data: graph, isLoading, error } = focus ? neighborhood : fullGraph;
+  const hasGraph = !!focus || showAll;
   const canvasRef = useRef<HTMLCanvasElement>(null);
   const containerRef = useRef<HTMLDivElement>(null);
+  const positionsRef = useRef<PositionedNode[]>([]);
 
-  // シンプルなフォースレイアウト
   const drawGraph = useCallback(() => {
     if (!graph || !canvasRef.current || !containerRef.current) return;
 
@@ -35,16 +122,8 @@ export function GraphPage() {
     canvas.width = width;
     canvas.height = height;
 
-    // ノード位置を初期化（円形配置）
-    const nodes = graph.nodes.map((node, i) => {
-      const angle = (2 * Math.PI * i) / graph.nodes.length;
-      const radius = Math.min(width, height) * 0.35;
-      return {
-        ...node,
-        x: width / 2 + radius * Math.cos(angle),
-        y: height / 2 + radius * Math.sin(angle),
-      };
-    });
+    const nodes = layoutNodes(graph.nodes, width, height, !!focus);
+    positionsRef.current = nodes;
 
     // ノードIDからインデックスへのマップ
     const nodeMap = new Map(nodes.map((n, i) => [n.id, i]));
@@ -67,19 +146,19 @@ export function GraphPage() {
       ctx.lineTo(to.x, to.y);
       ctx.strokeStyle = EDGE_COLORS[edge.type] || '#666';
       ctx.lineWidth = 1;
-      ctx.globalAlpha = 0.3;
+      ctx.globalAlpha = focus ? 0.7 : 0.3;
       ctx.stroke();
       ctx.globalAlpha = 1;
     });
 
-    // ノードを描画
+    // ノードを描画 (起点は大きく、存在しない参照先は灰色)
     nodes.forEach((node) => {
       ctx.beginPath();
-      ctx.arc(node.x, node.y, 8, 0, 2 * Math.PI);
-      ctx.fillStyle = NODE_COLORS[node.type] || '#888';
+      ctx.arc(node.x, node.y, node.id === focus ? 12 : 8, 0, 2 * Math.PI);
+      ctx.fillStyle = node.missing ? '#555' : NODE_COLORS[node.type] || '#888';
       ctx.fill();
       ctx.strokeStyle = '#fff';
-      ctx.lineWidth = 1;
+      ctx.lineWidth = node.id === focus ? 2 : 1;
       ctx.stroke();
 
       // ラベル
@@ -88,7 +167,7 @@ export function GraphPage() {
       ctx.textAlign = 'center';
       ctx.fillText(node.label.substring(0, 15), node.x, node.y + 20);
     });
-  }, [graph]);
+  }, [graph, focus]);
 
   useEffect(() => {
     drawGraph();
@@ -96,13 +175,25 @@ export function GraphPage() {
     return () => window.removeEventListener('resize', drawGraph);
   }, [drawGraph]);
 
-  if (isLoading) {
-    return <div className="text-center py-8">読み込み中...</div>;
-  }
+  // クリックしたノードを起点に周辺だけを表示
+  const handleCanvasClick = (e: React.MouseEvent<HTMLCanvasElement>) => {
+    const rect = e.currentTarget.getBoundingClientRect();
+    const x = e.clientX - rect.left;
+    const y = e.clientY - rect.top;
+    const hit = positionsRef.current.find(
+      (node) => (node.x - x) ** 2 + (node.y - y) ** 2 <= HIT_RADIUS ** 2
+    );
+    if (hit && !hit.missing) {
+      setFocus(hit.id);
+    }
+  };
 
-  if (error) {
-    return <div className="text-center py-8 text-red-500">エラーが発生しました</div>;
-  }
+  const selectNode = (node: string) => {
+    setFocus(node);
+    setFilter('');
+  };
+
+  const focusLabel = neighborhood.data?.nodes.find((node) => node.id === focus)?.label ?? focus;
 
   return (
     <div className="space-y-6">
@@ -118,14 +209,113 @@ export function GraphPage() {
         </div>
       </div>
 
-      <div className="bg-ark-dark border border-gray-700 rounded-lg p-4">
-        <div className="mb-4 text-sm text-gray-400">
-          ノード数: {graph?.nodes.length || 0} / エッジ数: {graph?.edges.length || 0}
+      <div className="bg-ark-dark border border-gray-700 rounded-lg p-4 space-y-2">
+        <div className="flex gap-4">
+          <input
+            type="text"
+            placeholder="起点にするデータを検索..."
+            value={filter}
+            onChange={(e) => setFilter(e.target.value)}
+            className="flex-1 px-4 py-2 bg-ark-darker border border-gray-700 rounded-lg focus:border-ark-accent focus:outline-none"
+          />
+          {!showAll && (
+            <button
+              onClick={() => {
+                setFocus(null);
+                setShowAll(true);
+              }}
+              className="px-4 py-2 text-sm bg-gray-700 hover:bg-gray-600 rounded-lg"
+            >
+              全体を表示
+            </button>
+          )}
+        </div>
+        {filter && query && (
+          <ul className="max-h-60 overflow-y-auto divide-y divide-gray-700 border border-gray-700 rounded-lg">
+            {hits.map((hit) => {
+              const prefix = GRAPH_NODE_PREFIXES[hit.type] as string;
+              return (
+                <li key={`${hit.type}:${hit.id}`}>
+                  <button
+                    onClick={() => selectNode(`${prefix}:${hit.id}`)}
+                    className="w-full flex items-center gap-3 px-4 py-2 text-left text-sm hover:bg-ark-darker"
+                  >
+                    <div className="w-3 h-3 rounded-full" style={{ backgroundColor: NODE_COLORS[prefix] }} />
+                    <span>{hit.label}</span>
+                    <span className="text-gray-500">{hit.id}</span>
+                  </button>
+                </li>
+              );
+            })}
+            {hits.length === 0 && (
+              <li className="px-4 py-2 text-sm text-gray-500">見つかりません</li>
+            )}
+          </ul>
+        )}
+      </div>
+
+      {hasGraph ? (
+        <div className="bg-ark-dark border border-gray-700 rounded-lg p-4">
+          <div className="mb-4 flex items-center gap-4 text-sm text-gray-400">
+            <span>
+              ノード数: {graph?.nodes.length || 0} / エッジ数: {graph?.edges.length || 0}
+            </span>
+            {focus ? (
+              <>
+                <span className="text-white">中心: {focusLabel}</span>
+                <label className="flex items-center gap-2">
+                  深さ
+                  <select
+                    value={depth}
+                    onChange={(e) => setDepth(Number(e.target.value))}
+                    className="px-2 py-1 bg-ark-darker border border-gray-700 rounded"
+                  >
+                    {DEPTH_OPTIONS.map((d) => (
+                      <option key={d} value={d}>{d}</option>
+                    ))}
+                  </select>
+                </label>
+                <label className="flex items-center gap-2">
+                  方向
+                  <select
+                    value={direction}
+                    onChange={(e) => setDirection(e.target.value as GraphDirection)}
+                    className="px-2 py-1 bg-ark-darker border border-gray-700 rounded"
+                  >
+                    {Object.entries(DIRECTION_LABELS).map(([value, label]) => (
+                      <option key={value} value={value}>{label}</option>
+                    ))}
+                  </select>
+                </label>
+                {neighborhood.data?.truncated && (
+                  <span className="text-yellow-400">ノード数の上限に達したため一部のみ表示</span>
+                )}
+                <button
+                  onClick={() => setFocus(null)}
+                  className="ml-auto px-2 py-1 text-xs bg-gray-700 hover:bg-gray-600 rounded"
+                >
+                  {showAll ? '全体表示に戻る' : '選択を解除'}
+                </button>
+              </>
+          ) : (
+            <span>ノードをクリックするとその周辺だけを表示します</span>
+          )}
         </div>
         <div ref={containerRef} className="w-full h-[600px] bg-ark-darker rounded-lg overflow-hidden">
-          <canvas ref={canvasRef} />
+          {isLoading ? (
+            <div className="text-center py-8">読み込み中...</div>
+          ) : error ? (
+            <div className="text-center py-8 text-red-500">エラーが発生しました</div>
+          ) : (
+            <canvas ref={canvasRef} onClick={handleCanvasClick} className="cursor-pointer" />
+          )}
         </div>
       </div>
+      ) : (
+        <div className="bg-ark-dark border border-gray-700 rounded-lg p-8 text-center text-gray-400">
+          データを検索して選ぶと、その周辺の依存関係を表示します
+        </div>
+      )}
 
       <div className="bg-ark-dark border border-gray-700 rounded-lg p-4">
         <h3 className="text-lg font-medium mb-4">エッジタイプ凡例</h3>
@@ -121,6 +121,7 @@ export function ItemsPage() {
         data={items}
         columns={columns}
         idField="id"
+        searchType="items"
         onEdit={openEditModal}
         onDelete={(id) => deleteMutation.mutate(id)}
       />
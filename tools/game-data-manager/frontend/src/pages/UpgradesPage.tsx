@@ -138,6 +138,7 @@ export function UpgradesPage() {
         data={upgrades}
         columns={columns}
         idField="id"
+        searchType="upgrades"
         onEdit={openEditModal}
         onDelete={(id) => deleteMutation.mutate(id)}
       />
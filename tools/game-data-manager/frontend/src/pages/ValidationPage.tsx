@@ -8,6 +8,7 @@ const ERROR_LABELS: Record<string, { label: string; color: string }> = {
   missing_stocks: { label: '株式参照エラー', color: 'text-orange-400' },
   missing_events: { label: 'イベント参照エラー', color: 'text-purple-400' },
   missing_banners: { label: 'バナー参照エラー', color: 'text-pink-400' },
+  prerequisite_cycles: { label: '前提条件の循環', color: 'text-red-400' },
 };
 
 function ErrorList({ errors, label, color }: { errors: ReferenceError[]; label: string; color: string }) {
@@ -29,10 +30,17 @@ function ErrorList({ errors, label, color }: { errors: ReferenceError[]; label:
               <span className="text-gray-400">フィールド:</span>
               <code className="text-gray-300">{err.field}</code>
             </div>
-            <div className="flex items-center gap-2">
-              <span className="text-gray-400">見つからないID:</span>
-              <code className="text-red-400">{err.missing_id}</code>
-            </div>
+            {err.cycle ? (
+              <div className="flex items-center gap-2">
+                <span className="text-gray-400">循環:</span>
+                <code className="text-red-400">{err.cycle.join(' → ')}</code>
+              </div>
+            ) : (
+              <div className="flex items-center gap-2">
+                <span className="text-gray-400">見つからないID:</span>
+                <code className="text-red-400">{err.missing_id}</code>
+              </div>
+            )}
           </div>
         ))}
       </div>
@@ -110,6 +118,7 @@ export function ValidationPage() {
           <li>• <strong>ガチャ</strong>: 排出アイテム、ピックアップアイテム、前提バナー、解放アイテム</li>
           <li>• <strong>企業</strong>: 解放キーアイテム</li>
           <li>• <strong>イベント</strong>: 前提イベント、報酬アイテム</li>
+          <li>• <strong>前提条件</strong>: アップグレード・イベント・バナーの前提チェーンの循環</li>
         </ul>
       </div>
     </div>
@@ -282,6 +282,52 @@ export interface DependencyGraph {
   edges: GraphEdge[];
 }
 
+export type GraphEdgeType = 'unlock' | 'prerequisite' | 'material' | 'contains' | 'reward';
+
+export interface GraphNeighborhoodNode extends GraphNode {
+  depth: number;
+  missing?: boolean;
+}
+
+export interface GraphNeighborhood {
+  center: string;
+  nodes: GraphNeighborhoodNode[];
+  edges: GraphEdge[];
+  truncated: boolean;
+}
+
+export interface GraphNeighborhoodParams {
+  depth?: number;
+  edgeTypes?: GraphEdgeType[];
+  direction?: 'out' | 'in' | 'both';
+  limit?: number;
+}
+
+// ========================================
+// Change events (Server-Sent Events)
+// ========================================
+
+export interface DataChangeEvent {
+  type: DataType;
+  op: string;
+  revision: number;
+  seq: number;
+  id?: string;
+  count?: number;
+}
+
+// ========================================
+// Search
+// ========================================
+
+export interface SearchHit {
+  type: DataType;
+  id: string;
+  label: string;
+  field: string;
+  score: number;
+}
+
 // ========================================
 // Validation
 // ========================================
@@ -290,6 +336,7 @@ export interface ReferenceError {
   source: string;
   field: string;
   missing_id: string;
+  cycle?: string[];
 }
 
 export interface ValidationResult {
@@ -299,4 +346,5 @@ export interface ValidationResult {
   missing_stocks: ReferenceError[];
   missing_events: ReferenceError[];
   missing_banners: ReferenceError[];
+  prerequisite_cycles: ReferenceError[];
 }
@@ -1,10 +1,20 @@
 import axios from 'axios';
-import type { DataType, DependencyGraph, ValidationResult } from '../types';
+import type {
+  DataType,
+  DependencyGraph,
+  GraphNeighborhood,
+  GraphNeighborhoodParams,
+  SearchHit,
+  ValidationResult,
+} from '../types';
 
 const api = axios.create({
   baseURL: '/api',
 });
 
+// データ変更のServer-Sent Events
+export const DATA_EVENTS_URL = '/api/data/events';
+
 // ========================================
 // Generic CRUD
 // ========================================
@@ -38,6 +48,17 @@ export async function bulkCreate<T>(dataType: DataType, items: Partial<T>[]): Pr
   return data;
 }
 
+// ========================================
+// Search
+// ========================================
+
+export async function search(q: string, types?: DataType[], limit = 20): Promise<SearchHit[]> {
+  const { data } = await api.get<SearchHit[]>('/data/search', {
+    params: { q, limit, types: types?.join(',') },
+  });
+  return data;
+}
+
 // ========================================
 // Validation & Graph
 // ========================================
@@ -52,6 +73,16 @@ export async function getDependencyGraph(): Promise<DependencyGraph> {
   return data;
 }
 
+export async function getGraphNeighborhood(
+  node: string,
+  { depth = 1, edgeTypes, direction = 'both', limit }: GraphNeighborhoodParams = {}
+): Promise<GraphNeighborhood> {
+  const { data } = await api.get<GraphNeighborhood>('/data/graph/neighborhood', {
+    params: { node, depth, direction, limit, edge_types: edgeTypes?.join(',') },
+  });
+  return data;
+}
+
 // ========================================
 // Export / Import
 // ========================================